@@ -1,13 +1,21 @@
 import asyncio
 import logging
 import os
-import json
+import time
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from config.constants import PRIORITY_INTERACTIVE, STAGE_ANSWER
+from core.llm.base import is_error_chunk, is_error_response
+from core.llm.breaker import is_circuit_open_response
+from core.memory.conversation_log import get_conversation_log
+
 logger = logging.getLogger(__name__)
 
 class Agent:
+    # Messages kept in memory; the full history stays in the session's log
+    history_limit = 100
+    
     def __init__(self, session_id: str, websocket_manager, thinking_process=None):
         self.session_id = session_id
         self.websocket_manager = websocket_manager
@@ -25,24 +33,32 @@ class Agent:
             from agent.thinking import ThinkingProcess
             self.thinking = ThinkingProcess(session_id, websocket_manager)
         
-        # Initialize LLM
+        # Use the process-wide LLM provider instead of opening a new client per message
         try:
-            from agent.llm import LlamaLLM
-            self.llm = LlamaLLM()
+            from core.llm.provider import get_llm_provider
+            self.llm = get_llm_provider()
             logger.info(f"LLM initialized for session {session_id}")
         except Exception as e:
             logger.error(f"Error initializing LLM: {str(e)}")
             self.llm = None
         
-        # Initialize conversation history
-        self.history_file = os.path.join(self.workspace_dir, "conversation.json")
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    self.conversation = json.load(f)
-            except:
-                self.conversation = {"messages": []}
-        else:
+        # Conversation history is loaded from the tail of the session's log by load()
+        self.history = get_conversation_log(session_id)
+        self.conversation = {"messages": []}
+    
+    @classmethod
+    async def create(cls, session_id: str, websocket_manager, thinking_process=None) -> "Agent":
+        """Create an agent with the session's conversation history loaded"""
+        agent = cls(session_id, websocket_manager, thinking_process)
+        await agent.load()
+        return agent
+    
+    async def load(self):
+        """Load the recent conversation history without blocking the event loop"""
+        try:
+            self.conversation = {"messages": await self.history.read_tail(self.history_limit)}
+        except Exception as e:
+            logger.error(f"Error loading conversation history: {str(e)}")
             self.conversation = {"messages": []}
     
     async def process_message(self, message: Dict):
@@ -53,7 +69,7 @@ class Agent:
             
             # Add user message to conversation if not already there
             if not any(msg.get("id") == message["id"] for msg in self.conversation["messages"]):
-                self.conversation["messages"].append({
+                self._record({
                     "role": "user",
                     "content": message["content"],
                     "timestamp": message["timestamp"],
@@ -66,24 +82,34 @@ class Agent:
             
             # Generate a simple response
             response_content = ""
+            response_metadata = {}
+            assistant_id = f"assistant-{datetime.now().isoformat()}"
             try:
                 if self.llm:
                     # Generate response with retry mechanism
                     for attempt in range(3):  # Try up to 3 times
                         try:
                             logger.info(f"Generating response (attempt {attempt+1}/3)")
-                            response_content = await self.llm.generate(message["content"])
+                            response_content, response_metadata = await self._stream_response(
+                                assistant_id, message["content"]
+                            )
                             
                             # Check if we got a valid response
-                            if response_content and not response_content.startswith("Error:"):
+                            if not is_error_response(response_content):
+                                break
+                            elif is_circuit_open_response(response_content):
+                                # Every provider is known to be down; retrying would only add delay
+                                logger.warning("LLM circuit open, not retrying")
                                 break
                             else:
                                 logger.warning(f"Invalid response on attempt {attempt+1}: {response_content}")
+                                await self._reset_stream(assistant_id)
                                 await asyncio.sleep(1)  # Wait before retry
                         except Exception as e:
                             logger.error(f"Error generating response (attempt {attempt+1}): {str(e)}")
                             if attempt == 2:  # Last attempt
                                 response_content = f"I'm sorry, I encountered an error while processing your message. Please try again."
+                            await self._reset_stream(assistant_id)
                             await asyncio.sleep(1)  # Wait before retry
                 else:
                     response_content = "I'm sorry, but the language model is not available. Please check the server logs."
@@ -97,18 +123,16 @@ class Agent:
             
             # Create assistant message
             assistant_message = {
-                "id": f"assistant-{datetime.now().isoformat()}",
+                "id": assistant_id,
                 "role": "assistant",
                 "content": response_content,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "metadata": response_metadata
             }
             
-            # Add assistant message to conversation
-            self.conversation["messages"].append(assistant_message)
-            
-            # Save updated conversation
-            with open(self.history_file, "w") as f:
-                json.dump(self.conversation, f, indent=2)
+            # Add assistant message to conversation, unless the provider failed
+            if not is_error_response(response_content):
+                self._record(assistant_message)
             
             # Record result in thinking process
             self.thinking.add_result("Response generated")
@@ -145,3 +169,69 @@ class Agent:
             }, self.session_id)
             
             return error_message
+    
+    def _record(self, message: Dict):
+        """Add a message to the conversation and append it to the log"""
+        messages = self.conversation["messages"]
+        messages.append(message)
+        del messages[:-self.history_limit]
+        
+        try:
+            self.history.append(message)
+        except Exception as e:
+            logger.error(f"Error saving conversation: {str(e)}")
+    
+    async def _stream_response(self, message_id: str, prompt: str):
+        """
+        Stream a response from the LLM, sending chat_delta frames as tokens arrive.
+        
+        Returns the full text and timings, with time to first token reported
+        separately from total latency. The final chat_message carrying the same
+        id replaces the streamed text on the client.
+        
+        An ErrorText chunk, the provider's failure signal, is never sent to the
+        client: the stream stops and the error alone is returned, so the caller
+        can retry.
+        """
+        start_time = time.monotonic()
+        first_token_time = None
+        chunks = []
+        error = None
+        
+        stream = self.llm.generate_stream(prompt, stage=STAGE_ANSWER, priority=PRIORITY_INTERACTIVE,
+                                          session_id=self.session_id)
+        try:
+            async for chunk in stream:
+                if is_error_chunk(chunk):
+                    error = chunk
+                    break
+                if first_token_time is None:
+                    first_token_time = time.monotonic()
+                chunks.append(chunk)
+                await self.websocket_manager.send_message({
+                    "type": "chat_delta",
+                    "message_id": message_id,
+                    "delta": chunk
+                }, self.session_id)
+        finally:
+            await stream.aclose()
+        
+        total_latency = time.monotonic() - start_time
+        timings = {
+            "time_to_first_token": (first_token_time or time.monotonic()) - start_time,
+            "total_latency": total_latency
+        }
+        logger.info(f"Streamed response for session {self.session_id}: "
+                    f"TTFT {timings['time_to_first_token']:.3f}s, total {total_latency:.3f}s")
+        
+        return (error if error is not None else "".join(chunks)), timings
+    
+    async def _reset_stream(self, message_id: str):
+        """Tell the client to drop the text streamed for a message before it is retried"""
+        try:
+            await self.websocket_manager.send_message({
+                "type": "chat_reset",
+                "message_id": message_id
+            }, self.session_id)
+        except Exception as e:
+            logger.error(f"Error resetting streamed message: {str(e)}")
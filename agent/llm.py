@@ -2,14 +2,14 @@ import asyncio
 import aiohttp
 import json
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
 
 logger = logging.getLogger(__name__)
 
 class LlamaLLM:
     """Interface to Ollama LLM API"""
     
-    def __init__(self, api_url=None, model_name=None):
+    def __init__(self, api_url=None, model_name=None, keep_alive=None):
         """Initialize the LLM connector"""
         # Try to get config values, or use defaults
         try:
@@ -21,6 +21,13 @@ class LlamaLLM:
             self.model_name = model_name or "llama3"
             logger.warning("Could not import config - using default Ollama settings")
         
+        # How long Ollama keeps the model loaded after each request
+        try:
+            from config.settings import settings
+            self.keep_alive = keep_alive or settings.LLAMA_KEEP_ALIVE
+        except ImportError:
+            self.keep_alive = keep_alive or "30m"
+        
         logger.info(f"Initializing LLM with API URL: {self.api_url} and model: {self.model_name}")
         self.session = None
     
@@ -46,6 +53,10 @@ class LlamaLLM:
                 "max_tokens": max_tokens
             }
             
+            # Keep the model loaded between requests
+            if self.keep_alive:
+                request_data["keep_alive"] = self.keep_alive
+            
             # Add system prompt if provided
             if system_prompt:
                 request_data["system"] = system_prompt
@@ -86,6 +97,76 @@ class LlamaLLM:
             logger.error(f"Error generating text: {str(e)}")
             return f"Error: An unexpected error occurred: {str(e)}"
     
+    async def generate_stream(self, prompt, system_prompt=None, temperature=0.7, max_tokens=1024) -> AsyncIterator[str]:
+        """Generate text using Ollama API, yielding chunks as they arrive"""
+        try:
+            # Validate API URL
+            if not self.api_url:
+                raise ValueError("No API URL provided")
+            
+            # Construct the request payload
+            request_data = {
+                "model": self.model_name,
+                "prompt": prompt,
+                "stream": True,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+            
+            # Keep the model loaded between requests
+            if self.keep_alive:
+                request_data["keep_alive"] = self.keep_alive
+            
+            # Add system prompt if provided
+            if system_prompt:
+                request_data["system"] = system_prompt
+            
+            logger.debug(f"Streaming request to {self.api_url} with model {self.model_name}")
+            
+            # Get a session
+            session = await self._ensure_session()
+            
+            # Only bound the silence between chunks, not the whole generation
+            timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+            
+            # Ollama answers with one JSON object per line until "done" is set
+            async with session.post(self.api_url, json=request_data, timeout=timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"API error: {response.status} - {error_text}")
+                    yield f"Error connecting to Ollama API (Status: {response.status}). Please check your server configuration."
+                    return
+                
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        logger.error(f"Stream error from Ollama API: {chunk['error']}")
+                        yield f"Error: {chunk['error']}"
+                        return
+                    
+                    text = chunk.get("response", "")
+                    if text:
+                        yield text
+                    
+                    if chunk.get("done"):
+                        break
+        
+        except aiohttp.ClientConnectorError:
+            logger.error(f"Cannot connect to Ollama API at {self.api_url}")
+            yield "Error: Cannot connect to Ollama API. Please check if Ollama is running on your server."
+        
+        except asyncio.TimeoutError:
+            logger.error("Streaming request to Ollama API timed out")
+            yield "Error: Ollama API request timed out. The server might be overloaded."
+        
+        except Exception as e:
+            logger.error(f"Error streaming text: {str(e)}")
+            yield f"Error: An unexpected error occurred: {str(e)}"
+    
     async def close(self):
         """Close the aiohttp session"""
         if self.session and not self.session.closed:
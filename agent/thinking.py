@@ -1,11 +1,12 @@
 import time
 import uuid
 import asyncio
-import json
-import os
 import logging
 from typing import Dict, List, Optional
 
+from core.memory import database
+from core.memory.database import get_session_db
+
 logger = logging.getLogger(__name__)
 
 class ThinkingStep:
@@ -33,9 +34,7 @@ class ThinkingProcess:
         self.start_time = time.time()
         self.in_progress = True
         
-        # Create directory for storing thinking logs
-        self.log_dir = os.path.join("workspace", session_id, "thinking")
-        os.makedirs(self.log_dir, exist_ok=True)
+        self.log_id = f"thinking_{int(self.start_time)}"
         
         logger.info(f"Initialized thinking process for session {session_id}")
         
@@ -75,7 +74,7 @@ class ThinkingProcess:
     def complete(self):
         """Mark thinking process as complete"""
         self.in_progress = False
-        self._save_to_file()
+        self._save()
         asyncio.create_task(self._notify_complete())
         logger.info(f"Completed thinking process for session {self.session_id}")
     
@@ -100,25 +99,14 @@ class ThinkingProcess:
         except Exception as e:
             logger.error(f"Error notifying thinking complete: {str(e)}")
     
-    def _save_to_file(self):
-        """Save thinking process to file"""
+    def _save(self):
+        """Queue the thinking process to be saved to the session database"""
         try:
-            filename = f"thinking_{int(self.start_time)}.json"
-            path = os.path.join(self.log_dir, filename)
-            
-            # Create directory if it doesn't exist
-            os.makedirs(self.log_dir, exist_ok=True)
-            
-            # Write thinking data to file
-            with open(path, "w") as f:
-                thinking_data = {
-                    "session_id": self.session_id,
-                    "start_time": self.start_time,
-                    "steps": [step.to_dict() for step in self.steps]
-                }
-                json.dump(thinking_data, f, indent=2)
-            
-            logger.info(f"Saved thinking process to {path}")
+            get_session_db().submit(database.save_thinking_log, self.session_id, self.log_id, {
+                "start_time": self.start_time,
+                "end_time": time.time(),
+                "steps": [step.to_dict() for step in self.steps]
+            })
         except Exception as e:
             logger.error(f"Error saving thinking process: {str(e)}")
         
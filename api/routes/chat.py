@@ -38,7 +38,7 @@ async def send_message(
         # Get or create agent for this session
         if session_id not in active_agents:
             websocket_manager = getattr(request.app, "websocket_connection_manager", None)
-            active_agents[session_id] = Agent(session_id, websocket_manager)
+            active_agents[session_id] = await Agent.create(session_id, websocket_manager)
         
         agent = active_agents[session_id]
         
@@ -68,7 +68,7 @@ async def websocket_chat(websocket: WebSocket, session_id: str = Query(None)):
         
         # Get or create agent for this session
         if session_id not in active_agents:
-            active_agents[session_id] = Agent(session_id, connection_manager)
+            active_agents[session_id] = await Agent.create(session_id, connection_manager)
         
         agent = active_agents[session_id]
         
@@ -0,0 +1,54 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+
+from core.llm.provider import get_llm_provider
+from core.router import tool_router
+from core.memory.database import get_session_db
+from core.memory.persistence import get_write_behind
+from api.middleware.auth import get_token
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/llm")
+async def get_llm_metrics(token: str = Depends(get_token)):
+    """Get metrics from every layer of the shared LLM provider"""
+    try:
+        provider = get_llm_provider()
+        stats = getattr(provider, "stats", None)
+        
+        return {
+            "status": "success",
+            "metrics": stats() if callable(stats) else {}
+        }
+    except Exception as e:
+        logger.error(f"Error getting LLM metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting LLM metrics: {str(e)}")
+
+@router.get("/router")
+async def get_router_metrics(token: str = Depends(get_token)):
+    """Get how often each tool routing path fired"""
+    try:
+        return {
+            "status": "success",
+            "metrics": tool_router.stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting router metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting router metrics: {str(e)}")
+
+@router.get("/persistence")
+async def get_persistence_metrics(token: str = Depends(get_token)):
+    """Get how far the background writers are behind"""
+    try:
+        return {
+            "status": "success",
+            "metrics": {
+                "files": get_write_behind().stats(),
+                "database": get_session_db().stats()
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error getting persistence metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting persistence metrics: {str(e)}")
@@ -0,0 +1,47 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+
+from api.middleware.auth import get_token, verify_session
+from core.memory import database
+from core.memory.database import get_session_db, SEARCH_KINDS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1, description="Words to search for; end a word with * to match prefixes"),
+    session_id: Optional[str] = Query(None, description="Only search this session"),
+    kind: Optional[str] = Query(None, description="Only search 'message' or 'thinking' content"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    token: str = Depends(get_token)
+):
+    """Search messages and thinking steps across sessions"""
+    if kind is not None and kind not in SEARCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown kind {kind}, expected one of {', '.join(SEARCH_KINDS)}")
+    
+    if session_id is not None:
+        session_id = verify_session(session_id)
+    
+    db = get_session_db()
+    if not db.search_enabled:
+        raise HTTPException(status_code=503, detail="Full-text search is not available in this SQLite build")
+    
+    try:
+        # One extra result tells whether there is another page
+        results = await db.read(database.search, q, session_id, (kind,) if kind else SEARCH_KINDS,
+                                limit + 1, offset)
+        
+        return {
+            "status": "success",
+            "results": results[:limit],
+            "offset": offset,
+            "limit": limit,
+            "has_more": len(results) > limit
+        }
+    except Exception as e:
+        logger.error(f"Error searching sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching sessions: {str(e)}")
@@ -1,9 +1,9 @@
+import asyncio
 import logging
-import json
 import shutil
 import uuid
 import os
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
 from datetime import datetime
@@ -11,6 +11,9 @@ from datetime import datetime
 
 from config.settings import settings
 from api.middleware.auth import get_token, create_session, verify_session
+from core.memory import database
+from core.memory.conversation_log import close_conversation_log
+from core.memory.database import get_session_db
 
 logger = logging.getLogger(__name__)
 
@@ -30,24 +33,13 @@ async def create_new_session(
         # Generate a new session ID
         session_id = str(uuid.uuid4())
         
-        # Create session directory
+        # Create session directory for the session's files
         session_dir = os.path.join(settings.WORKSPACE_DIR, session_id)
         os.makedirs(session_dir, exist_ok=True)
         
-        # Create session metadata
-        session_name = session_request.name if session_request else f"Session {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        
-        session_data = {
-            "id": session_id,
-            "name": session_name,
-            "created_at": datetime.now().isoformat(),
-            "last_active": datetime.now().isoformat()
-        }
-        
         # Save session metadata
-        metadata_path = os.path.join(session_dir, "metadata.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        session_name = session_request.name if session_request else None
+        session_data = await get_session_db().write(database.create_session, session_id, session_name)
         
         # Create auth token for this session
         token = create_session(session_id)
@@ -71,20 +63,11 @@ async def get_session_info(
         # Verify session exists and user has access
         verified_session_id = verify_session(session_id)
         
-        # Get session metadata
-        metadata_path = os.path.join(settings.WORKSPACE_DIR, verified_session_id, "metadata.json")
-        
-        if not os.path.exists(metadata_path):
-            raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
-        
-        with open(metadata_path, 'r') as f:
-            session_data = json.load(f)
-        
         # Update last active timestamp
-        session_data["last_active"] = datetime.now().isoformat()
+        session_data = await get_session_db().write(database.touch_session, verified_session_id)
         
-        with open(metadata_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        if session_data is None:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
         
         return {
             "status": "success",
@@ -97,28 +80,14 @@ async def get_session_info(
         raise HTTPException(status_code=500, detail=f"Error getting session info: {str(e)}")
 
 @router.get("/list")
-async def list_sessions(token: str = Depends(get_token)):
-    """List all available sessions"""
+async def list_sessions(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    token: str = Depends(get_token)
+):
+    """List sessions, most recently active first"""
     try:
-        sessions = []
-        
-        # Iterate through session directories
-        workspace_dir = settings.WORKSPACE_DIR
-        if os.path.exists(workspace_dir):
-            for session_id in os.listdir(workspace_dir):
-                metadata_path = os.path.join(workspace_dir, session_id, "metadata.json")
-                
-                if os.path.exists(metadata_path):
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            session_data = json.load(f)
-                            sessions.append(session_data)
-                    except:
-                        # Skip invalid session files
-                        continue
-        
-        # Sort by last active time (most recent first)
-        sessions.sort(key=lambda s: s.get("last_active", ""), reverse=True)
+        sessions = await get_session_db().read(database.list_sessions, limit, offset)
         
         return {
             "status": "success",
@@ -128,7 +97,75 @@ async def list_sessions(token: str = Depends(get_token)):
         logger.error(f"Error listing sessions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error listing sessions: {str(e)}")
 
-    @router.delete("/delete/{session_id}")
+@router.get("/{session_id}/messages")
+async def get_session_messages(
+    session_id: str,
+    request: Request,
+    response: Response,
+    before: Optional[int] = Query(None, description="Return the messages preceding this sequence number"),
+    after: Optional[int] = Query(None, description="Return the messages following this sequence number"),
+    since: Optional[int] = Query(None, description="Sequence number of the last message the client has; returns only newer ones"),
+    epoch: Optional[int] = Query(None, description="History epoch the client's since belongs to"),
+    limit: int = Query(50, ge=1, le=500),
+    token: str = Depends(get_token)
+):
+    """
+    Get a page of a session's messages, oldest first.
+    
+    Without cursors this is the latest page. The response carries an ETag
+    that changes whenever the history does, so a client polling with
+    If-None-Match gets 304 Not Modified until there is something new. With
+    since, only the messages after the client's last one are returned; if
+    the history was cleared in the meantime, reset is set and the latest
+    page is returned instead. Clearing starts a new epoch, so passing the
+    epoch of since detects a clear even once the history grew past since.
+    """
+    # Verify session exists and user has access
+    verified_session_id = verify_session(session_id)
+    
+    try:
+        db = get_session_db()
+        # Read before the messages: a stale version only costs the client one more fetch.
+        # Waiting for queued writes lets a client see the messages of a reply it just got.
+        version = await db.read_after_writes(database.get_history_version, verified_session_id)
+        
+        if version is None:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+        
+        etag = f'W/"{version["etag"]}"'
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        reset = False
+        if since is not None:
+            reset = ((epoch is not None and epoch != version["epoch"])
+                     or version["last_seq"] is None or since > version["last_seq"])
+            before, after = None, (None if reset else since)
+        
+        # One extra message tells whether there is more beyond this page
+        messages = await db.read(database.get_messages, verified_session_id, limit + 1, before, after)
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[:limit] if after is not None else messages[1:]
+        
+        response.headers["ETag"] = etag
+        return {
+            "status": "success",
+            "messages": messages,
+            "has_more": has_more,
+            "reset": reset,
+            "epoch": version["epoch"],
+            "message_count": version["message_count"],
+            "first_seq": version["first_seq"],
+            "last_seq": version["last_seq"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting session messages: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting session messages: {str(e)}")
+
+@router.delete("/delete/{session_id}")
 async def delete_session(
     session_id: str,
     token: str = Depends(get_token)
@@ -138,15 +175,17 @@ async def delete_session(
         # Verify session exists and user has access
         verified_session_id = verify_session(session_id)
         
-        # Get session directory
-        session_dir = os.path.join(settings.WORKSPACE_DIR, verified_session_id)
+        deleted = await get_session_db().write(database.delete_session, verified_session_id)
+        # Finish and close the session's log before its files go away
+        await asyncio.to_thread(close_conversation_log, verified_session_id)
         
-        if not os.path.exists(session_dir):
+        # Delete the session's files
+        session_dir = os.path.join(settings.WORKSPACE_DIR, verified_session_id)
+        if os.path.exists(session_dir):
+            shutil.rmtree(session_dir)
+        elif not deleted:
             raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
         
-        # Delete the session directory
-        shutil.rmtree(session_dir)
-        
         return {
             "status": "success",
             "message": f"Session {session_id} deleted successfully"
@@ -156,4 +195,3 @@ async def delete_session(
     except Exception as e:
         logger.error(f"Error deleting session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
-    
\ No newline at end of file
@@ -1,6 +1,4 @@
 import logging
-import json
-import os
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
@@ -9,6 +7,8 @@ import asyncio
 from config.settings import settings
 from config.constants import WS_THINKING_PATH
 from api.middleware.auth import get_token, verify_session
+from core.memory import database
+from core.memory.database import get_session_db
 
 logger = logging.getLogger(__name__)
 
@@ -28,35 +28,7 @@ async def get_thinking_logs(
     verified_session_id = verify_session(session_id)
     
     try:
-        # Get thinking logs directory
-        logs_dir = os.path.join(settings.WORKSPACE_DIR, verified_session_id, "thinking")
-        
-        if not os.path.exists(logs_dir):
-            return {
-                "status": "success",
-                "logs": []
-            }
-        
-        # List log files
-        log_files = [f for f in os.listdir(logs_dir) if f.endswith('.json')]
-        logs = []
-        
-        for log_file in log_files:
-            try:
-                with open(os.path.join(logs_dir, log_file), 'r') as f:
-                    log_data = json.load(f)
-                    logs.append({
-                        "id": log_file.replace(".json", ""),
-                        "start_time": log_data.get("start_time"),
-                        "end_time": log_data.get("end_time"),
-                        "step_count": len(log_data.get("steps", []))
-                    })
-            except:
-                # Skip invalid log files
-                continue
-        
-        # Sort by start time (most recent first)
-        logs.sort(key=lambda l: l.get("start_time", 0), reverse=True)
+        logs = await get_session_db().read(database.list_thinking_logs, verified_session_id)
         
         return {
             "status": "success",
@@ -77,15 +49,11 @@ async def get_thinking_log_detail(
     verified_session_id = verify_session(session_id)
     
     try:
-        # Get thinking log file
-        log_path = os.path.join(settings.WORKSPACE_DIR, verified_session_id, "thinking", f"{log_id}.json")
+        log_data = await get_session_db().read(database.get_thinking_log, verified_session_id, log_id)
         
-        if not os.path.exists(log_path):
+        if log_data is None:
             raise HTTPException(status_code=404, detail=f"Thinking log {log_id} not found")
         
-        with open(log_path, 'r') as f:
-            log_data = json.load(f)
-        
         return {
             "status": "success",
             "log": log_data
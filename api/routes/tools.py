@@ -36,7 +36,7 @@ async def execute_tool(
     try:
         # Create a temporary agent for tool execution
         websocket_manager = getattr(request.app, "websocket_connection_manager", None)
-        agent = Agent(session_id, websocket_manager)
+        agent = await Agent.create(session_id, websocket_manager)
         
         # Get the requested tool
         if tool_request.tool == TOOL_BROWSER:
@@ -1,21 +1,24 @@
 import logging
 from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from typing import Dict, List, Any
 
 from config.settings import settings
 from config.constants import API_URL_PREFIX
-from api.routes import chat, tools, sessions, thinking
+from api.routes import chat, tools, sessions, thinking, metrics, search
 from api.middleware.logging import RequestLoggingMiddleware
+from core.llm.warmup import warmup_status
 
 logger = logging.getLogger(__name__)
 
-def create_app() -> FastAPI:
+def create_app(lifespan=None) -> FastAPI:
     """Create and configure the FastAPI application"""
     app = FastAPI(
         title=settings.APP_NAME,
         description=settings.DESCRIPTION,
-        version=settings.VERSION
+        version=settings.VERSION,
+        lifespan=lifespan
     )
     
     # Add middleware
@@ -33,10 +36,23 @@ def create_app() -> FastAPI:
     app.include_router(tools.router, prefix=f"{API_URL_PREFIX}/tools", tags=["tools"])
     app.include_router(sessions.router, prefix=f"{API_URL_PREFIX}/sessions", tags=["sessions"])
     app.include_router(thinking.router, prefix=f"{API_URL_PREFIX}/thinking", tags=["thinking"])
+    app.include_router(metrics.router, prefix=f"{API_URL_PREFIX}/metrics", tags=["metrics"])
+    app.include_router(search.router, prefix=f"{API_URL_PREFIX}/search", tags=["search"])
     
     # WebSocket connection manager
     app.websocket_connection_manager = WebSocketConnectionManager()
     
+    # Readiness check: not ready until the LLM warm-up has finished
+    @app.get("/health")
+    async def health():
+        """Report whether the server is ready to take traffic"""
+        warmup = warmup_status()
+        status_code = 200 if warmup["ready"] else 503
+        return JSONResponse(
+            status_code=status_code,
+            content={"status": "ready" if warmup["ready"] else "warming_up", "warmup": warmup}
+        )
+    
     # Add debug WebSocket endpoint
     @app.websocket("/ws/debug")
     async def websocket_debug(websocket: WebSocket):
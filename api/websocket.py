@@ -82,7 +82,7 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                             thinking_process = ThinkingProcess(session_id, connection_manager)
                             
                             # Create an agent instance
-                            agent = Agent(
+                            agent = await Agent.create(
                                 session_id=session_id,
                                 websocket_manager=connection_manager,
                                 thinking_process=thinking_process
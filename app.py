@@ -1,6 +1,7 @@
 import os
 import logging
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -10,14 +11,50 @@ from fastapi.middleware.cors import CORSMiddleware
 # Local imports
 from config.settings import settings
 from api.server import create_app
+from core.llm.provider import init_llm_providers, close_llm_providers
+from core.llm.warmup import start_warmup, stop_warmup
+from core.memory.conversation_log import close_conversation_logs
+from core.memory.database import close_session_db
+from core.memory.persistence import close_write_behind
+from core.memory.embeddings import close_embedder
 from utils.logger import setup_logging
 
 # Set up logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Application lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Starting SparkyAI...")
+    logger.info(f"Environment: {settings.ENV}")
+    logger.info(f"Debug mode: {settings.DEBUG}")
+    
+    # Create necessary directories
+    os.makedirs(settings.WORKSPACE_DIR, exist_ok=True)
+    os.makedirs(settings.STATIC_DIR, exist_ok=True)
+    os.makedirs(settings.TEMPLATES_DIR, exist_ok=True)
+    
+    # Open the shared LLM client once for the whole process
+    provider = await init_llm_providers()
+    
+    # Preload models in the background; /health reports ready once done
+    start_warmup(provider)
+    
+    logger.info("SparkyAI started successfully")
+    
+    yield
+    
+    logger.info("Shutting down SparkyAI...")
+    await stop_warmup()
+    await close_llm_providers()
+    await close_embedder()
+    close_conversation_logs()
+    close_write_behind()
+    close_session_db()
+
 # Create FastAPI app
-app = create_app()
+app = create_app(lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -39,25 +76,6 @@ app.add_middleware(
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Starting SparkyAI...")
-    logger.info(f"Environment: {settings.ENV}")
-    logger.info(f"Debug mode: {settings.DEBUG}")
-    
-    # Create necessary directories
-    os.makedirs(settings.WORKSPACE_DIR, exist_ok=True)
-    os.makedirs(settings.STATIC_DIR, exist_ok=True)
-    os.makedirs(settings.TEMPLATES_DIR, exist_ok=True)
-    
-    logger.info("SparkyAI started successfully")
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Shutting down SparkyAI...")
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
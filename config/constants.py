@@ -25,6 +25,24 @@ THINKING_TYPE_ACTION = "action"
 THINKING_TYPE_RESULT = "result"
 THINKING_TYPE_CONCLUSION = "conclusion"
 
+# LLM request priorities (lower is served first)
+PRIORITY_ROUTING = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ROUTING: "routing",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background"
+}
+
+# LLM pipeline stages, each of which can run on its own model
+STAGE_ROUTING = "routing"
+STAGE_ANSWER = "answer"
+STAGE_CODE = "code"
+STAGE_ANALYSIS = "analysis"
+STAGE_SUMMARY = "summary"
+
 # Status types
 STATUS_IDLE = "idle"
 STATUS_THINKING = "thinking"
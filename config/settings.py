@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -32,9 +32,175 @@ class Settings:
     # LLM settings
     LLAMA_MODEL: str = os.getenv("LLAMA_MODEL", "llama3")
     LLAMA_API_URL: str = os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")
+    # Comma-separated Ollama endpoints to load balance over (defaults to LLAMA_API_URL)
+    LLAMA_API_URLS: List[str] = [url.strip() for url in os.getenv("LLAMA_API_URLS", "").split(",") if url.strip()]
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     USE_OPENAI: bool = os.getenv("USE_OPENAI", "False").lower() == "true"
     
+    # Per-stage models as "stage=model" pairs, e.g. "routing=llama3.2:1b,code=qwen2.5-coder";
+    # stages without an entry use the default model (stages are listed in config.constants)
+    LLAMA_STAGE_MODELS: Dict[str, str] = dict(
+        (stage.strip(), model.strip()) for stage, _, model in
+        (item.partition("=") for item in os.getenv("LLAMA_STAGE_MODELS", "").split(",")) if model.strip()
+    )
+    OPENAI_STAGE_MODELS: Dict[str, str] = dict(
+        (stage.strip(), model.strip()) for stage, _, model in
+        (item.partition("=") for item in os.getenv("OPENAI_STAGE_MODELS", "").split(",")) if model.strip()
+    )
+    
+    # LLM HTTP connection pool settings (shared by all sessions)
+    LLM_POOL_LIMIT: int = int(os.getenv("LLM_POOL_LIMIT", "100"))
+    LLM_POOL_LIMIT_PER_HOST: int = int(os.getenv("LLM_POOL_LIMIT_PER_HOST", "16"))
+    LLM_KEEPALIVE_TIMEOUT: float = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+    LLM_DNS_CACHE_TTL: int = int(os.getenv("LLM_DNS_CACHE_TTL", "300"))
+    
+    # LLM response cache (in-memory LRU + on-disk SQLite)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_MAX_TEMPERATURE: float = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+    LLM_CACHE_MEMORY_ENTRIES: int = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1000"))
+    LLM_CACHE_MEMORY_BYTES: int = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+    LLM_CACHE_DISK_PATH: str = os.getenv("LLM_CACHE_DISK_PATH", os.path.join(BASE_DIR, "cache", "llm_cache.db"))  # empty = memory only
+    LLM_CACHE_DISK_BYTES: int = int(os.getenv("LLM_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+    
+    # Semantic cache (opt-in): requests for LLM_SEMANTIC_CACHE_STAGES whose embedding (see
+    # EMBEDDING_MODEL) is at least LLM_SEMANTIC_CACHE_THRESHOLD cosine-similar to a cached one
+    # with the same model, system prompt and options are answered from the cache
+    LLM_SEMANTIC_CACHE_ENABLED: bool = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+    LLM_SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    LLM_SEMANTIC_CACHE_STAGES: List[str] = [s.strip() for s in os.getenv("LLM_SEMANTIC_CACHE_STAGES", "routing").split(",") if s.strip()]
+    LLM_SEMANTIC_CACHE_ENTRIES: int = int(os.getenv("LLM_SEMANTIC_CACHE_ENTRIES", "1000"))
+    LLM_SEMANTIC_CACHE_TTL: int = int(os.getenv("LLM_SEMANTIC_CACHE_TTL", "3600"))  # seconds, 0 = never expire
+    
+    # Ollama load balancing: "least_outstanding" or "ewma" routing, /api/tags health probes
+    LLAMA_BALANCER_STRATEGY: str = os.getenv("LLAMA_BALANCER_STRATEGY", "least_outstanding")
+    LLAMA_HEALTH_INTERVAL: float = float(os.getenv("LLAMA_HEALTH_INTERVAL", "15"))  # seconds
+    LLAMA_HEALTH_TIMEOUT: float = float(os.getenv("LLAMA_HEALTH_TIMEOUT", "5"))  # seconds
+    LLAMA_MAX_FAILURES: int = int(os.getenv("LLAMA_MAX_FAILURES", "3"))  # consecutive errors before ejection
+    
+    # Ollama model residency: keep_alive sent with every request, startup warm-up
+    # and a keeper that stops models being unloaded during business hours
+    LLAMA_KEEP_ALIVE: str = os.getenv("LLAMA_KEEP_ALIVE", "30m")  # Ollama duration, "-1" = forever
+    LLAMA_WARMUP_ENABLED: bool = os.getenv("LLAMA_WARMUP_ENABLED", "True").lower() == "true"
+    LLAMA_WARMUP_MODELS: List[str] = [m.strip() for m in os.getenv("LLAMA_WARMUP_MODELS", "").split(",") if m.strip()]  # defaults to LLAMA_MODEL plus the stage models
+    LLAMA_WARMUP_TIMEOUT: float = float(os.getenv("LLAMA_WARMUP_TIMEOUT", "300"))  # seconds, model load can be slow
+    LLAMA_KEEPER_INTERVAL: float = float(os.getenv("LLAMA_KEEPER_INTERVAL", "600"))  # seconds, keep below LLAMA_KEEP_ALIVE
+    LLAMA_KEEPER_HOURS: str = os.getenv("LLAMA_KEEPER_HOURS", "8-18")  # local hours, empty = never
+    LLAMA_KEEPER_WEEKDAYS: str = os.getenv("LLAMA_KEEPER_WEEKDAYS", "0,1,2,3,4")  # Monday = 0
+    
+    # LLM request scheduling: concurrent requests allowed per backend host
+    LLAMA_MAX_CONCURRENCY: int = int(os.getenv("LLAMA_MAX_CONCURRENCY", "4"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # seconds
+    
+    # Adaptive timeouts: once a stage has LLM_LATENCY_MIN_SAMPLES calls, its timeout becomes
+    # LLM_TIMEOUT_MULTIPLIER x the LLM_TIMEOUT_PERCENTILE latency, clamped to [MIN, MAX];
+    # until then LLM_STAGE_TIMEOUTS ("stage=seconds" pairs) or LLM_REQUEST_TIMEOUT applies
+    LLM_ADAPTIVE_TIMEOUTS: bool = os.getenv("LLM_ADAPTIVE_TIMEOUTS", "True").lower() == "true"
+    LLM_STAGE_TIMEOUTS: Dict[str, float] = dict(
+        (stage.strip(), float(seconds)) for stage, _, seconds in
+        (item.partition("=") for item in os.getenv("LLM_STAGE_TIMEOUTS", "routing=15,code=180,analysis=180").split(","))
+        if seconds.strip()
+    )
+    LLM_TIMEOUT_PERCENTILE: float = float(os.getenv("LLM_TIMEOUT_PERCENTILE", "0.99"))
+    LLM_TIMEOUT_MULTIPLIER: float = float(os.getenv("LLM_TIMEOUT_MULTIPLIER", "3"))
+    LLM_TIMEOUT_MIN: float = float(os.getenv("LLM_TIMEOUT_MIN", "5"))  # seconds
+    LLM_TIMEOUT_MAX: float = float(os.getenv("LLM_TIMEOUT_MAX", "300"))  # seconds
+    LLM_LATENCY_WINDOW: int = int(os.getenv("LLM_LATENCY_WINDOW", "200"))  # samples kept per stage
+    LLM_LATENCY_MIN_SAMPLES: int = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"))
+    
+    # Hedged requests (several Ollama hosts only): when a call has not answered within the
+    # LLAMA_HEDGE_PERCENTILE latency for its stage, send it to a second host and keep the faster
+    LLAMA_HEDGE_ENABLED: bool = os.getenv("LLAMA_HEDGE_ENABLED", "False").lower() == "true"
+    LLAMA_HEDGE_PERCENTILE: float = float(os.getenv("LLAMA_HEDGE_PERCENTILE", "0.95"))
+    
+    # Circuit breaker per provider: opens when the failure (or slow call) rate over the last
+    # LLM_BREAKER_WINDOW calls reaches the threshold, then fails fast for LLM_BREAKER_OPEN_SECONDS.
+    # Time queued for a slot does not count; a call is slow past LLM_BREAKER_SLOW_CALL_FRACTION of
+    # its stage's LLM_STAGE_TIMEOUTS entry, or LLM_BREAKER_SLOW_CALL_SECONDS for other stages
+    LLM_CIRCUIT_BREAKER_ENABLED: bool = os.getenv("LLM_CIRCUIT_BREAKER_ENABLED", "True").lower() == "true"
+    LLM_BREAKER_FAILURE_RATE: float = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+    LLM_BREAKER_SLOW_CALL_RATE: float = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+    LLM_BREAKER_SLOW_CALL_SECONDS: float = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "30"))
+    LLM_BREAKER_SLOW_CALL_FRACTION: float = float(os.getenv("LLM_BREAKER_SLOW_CALL_FRACTION", "0.5"))
+    LLM_BREAKER_WINDOW: int = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+    LLM_BREAKER_MIN_CALLS: int = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+    LLM_BREAKER_OPEN_SECONDS: float = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+    # Fail over to the other provider (OpenAI <-> Llama) while the primary's circuit is open
+    LLM_FAILOVER_ENABLED: bool = os.getenv("LLM_FAILOVER_ENABLED", "False").lower() == "true"
+    
+    # Coalesce concurrent identical LLM requests into one upstream call
+    LLM_SINGLE_FLIGHT_ENABLED: bool = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    
+    # Send conversation history as structured messages (Ollama /api/chat) instead of one flat prompt
+    LLM_CHAT_API_ENABLED: bool = os.getenv("LLM_CHAT_API_ENABLED", "True").lower() == "true"
+    
+    # Token counting for context assembly: "auto" uses tiktoken with OpenAI and TOKENIZER_PATH
+    # (a tokenizer.json, or a SentencePiece .model) with Llama, estimating from characters when
+    # neither is available; tiktoken / tokenizers / sentencepiece are optional installs
+    TOKENIZER: str = os.getenv("TOKENIZER", "auto")  # auto, tiktoken, huggingface, sentencepiece, heuristic
+    TOKENIZER_PATH: str = os.getenv("TOKENIZER_PATH", "")
+    TOKENIZER_CHARS_PER_TOKEN: float = float(os.getenv("TOKENIZER_CHARS_PER_TOKEN", "4"))
+    
+    # Context packing for the answer call: the model's context window, the part reserved for
+    # the response, and the largest share of the rest each optional section may take
+    # ("section=fraction" pairs); history gets whatever the other sections leave unused
+    LLM_CONTEXT_TOKENS: int = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+    LLM_RESPONSE_TOKENS: int = int(os.getenv("LLM_RESPONSE_TOKENS", "1024"))
+    CONTEXT_BUDGET_SHARES: Dict[str, float] = dict(
+        (section.strip(), float(share)) for section, _, share in
+        (item.partition("=") for item in os.getenv("CONTEXT_BUDGET_SHARES", "pinned=0.1,summary=0.1,retrieved=0.15,tool=0.35").split(","))
+        if share.strip()
+    )
+    
+    # Rolling history summary: once the unsummarized turns exceed SUMMARY_TRIGGER_TOKENS, all but
+    # the last SUMMARY_KEEP_TURNS turns are folded into summary.json by a background LLM call
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "True").lower() == "true"
+    SUMMARY_TRIGGER_TOKENS: int = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "2000"))
+    SUMMARY_KEEP_TURNS: int = int(os.getenv("SUMMARY_KEEP_TURNS", "3"))
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+    
+    # Vector memory: every message and tool result is embedded through Ollama /api/embeddings
+    # (EMBEDDING_API_URL defaults to the LLAMA_API_URL host) and relevant old turns recalled
+    VECTOR_MEMORY_ENABLED: bool = os.getenv("VECTOR_MEMORY_ENABLED", "True").lower() == "true"
+    EMBEDDING_API_URL: str = os.getenv("EMBEDDING_API_URL", "")
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+    EMBEDDING_MAX_CHARS: int = int(os.getenv("EMBEDDING_MAX_CHARS", "4000"))
+    VECTOR_RECALL_K: int = int(os.getenv("VECTOR_RECALL_K", "3"))
+    VECTOR_MIN_SCORE: float = float(os.getenv("VECTOR_MIN_SCORE", "0.35"))  # cosine similarity
+    
+    # Session store: sessions, thinking logs and (with CONVERSATION_STORE "sqlite") messages live in
+    # one SQLite database in WAL mode; import older workspaces with python -m core.memory.migrate
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", os.path.join(BASE_DIR, "data", "sessions.db"))
+    SESSION_DB_POOL_SIZE: int = int(os.getenv("SESSION_DB_POOL_SIZE", "4"))  # read connections
+    CONVERSATION_STORE: str = os.getenv("CONVERSATION_STORE", "sqlite")  # sqlite or jsonl
+    
+    # Write-behind persistence for files rewritten as a whole (summaries, StorageManager data):
+    # a file is written once it has not changed for PERSIST_DEBOUNCE_SECONDS, and saving waits
+    # once PERSIST_MAX_PENDING files are queued
+    PERSIST_DEBOUNCE_SECONDS: float = float(os.getenv("PERSIST_DEBOUNCE_SECONDS", "0.5"))
+    PERSIST_MAX_PENDING: int = int(os.getenv("PERSIST_MAX_PENDING", "1000"))
+    
+    # JSONL conversation log (workspace/<session>/conversation.jsonl, one record per message):
+    # fsync "always", "interval" (at most every CONVERSATION_FSYNC_INTERVAL seconds) or "never";
+    # compacted to the newest CONVERSATION_LOG_MAX_MESSAGES once it grows a quarter past that;
+    # the file is closed after CONVERSATION_LOG_IDLE_SECONDS without use
+    CONVERSATION_FSYNC: str = os.getenv("CONVERSATION_FSYNC", "interval")
+    CONVERSATION_FSYNC_INTERVAL: float = float(os.getenv("CONVERSATION_FSYNC_INTERVAL", "1"))
+    CONVERSATION_LOG_MAX_MESSAGES: int = int(os.getenv("CONVERSATION_LOG_MAX_MESSAGES", "1000"))  # 0 = keep everything
+    CONVERSATION_LOG_IDLE_SECONDS: float = float(os.getenv("CONVERSATION_LOG_IDLE_SECONDS", "300"))
+    
+    # Let the model call tools natively (OpenAI / Ollama "tools") and answer in the same pass;
+    # needs a model with tool support, e.g. llama3.1 rather than llama3
+    LLM_NATIVE_TOOLS: bool = os.getenv("LLM_NATIVE_TOOLS", "False").lower() == "true"
+    
+    # Route clear-cut messages to a tool by rules before asking the LLM
+    TOOL_ROUTER_ENABLED: bool = os.getenv("TOOL_ROUTER_ENABLED", "True").lower() == "true"
+    # Tool selection by LLM: "schema" (JSON schema), "json" (any JSON) or "none" (free text)
+    TOOL_ROUTING_FORMAT: str = os.getenv("TOOL_ROUTING_FORMAT", "schema")
+    TOOL_ROUTING_MAX_TOKENS: int = int(os.getenv("TOOL_ROUTING_MAX_TOKENS", "128"))
+    
     # Websocket settings
     WS_PING_INTERVAL: int = 30  # seconds
     
@@ -1,11 +1,22 @@
 import logging
 import json
 import asyncio
+import time
 from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime
 
+from config.constants import (PRIORITY_ROUTING, PRIORITY_INTERACTIVE, TOOL_BROWSER, TOOL_SEARCH, TOOL_CODE,
+                              STAGE_ROUTING, STAGE_ANSWER)
+from config.settings import settings
+from core.llm.base import is_error_chunk, is_error_response
 from core.llm.provider import get_llm_provider
+from core.llm.structured import generate_json
 from core.memory.conversation import ConversationMemory
+from core.memory.embeddings import get_embedder
+from core.memory.packer import create_context_packer
+from core.memory.summarizer import ConversationSummarizer
+from core.memory.vectors import VectorMemory
+from core.router import tool_router
 from core.thinking import ThinkingProcess
 from tools.browser.browser import BrowserAutomation
 from tools.web.search import WebSearch
@@ -16,6 +27,57 @@ from tools.chat_manager import ChatManager
 
 logger = logging.getLogger(__name__)
 
+# Output schema for the tool-selection LLM call
+TOOL_SELECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tool": {"type": "string", "enum": [TOOL_BROWSER, TOOL_SEARCH, TOOL_CODE, "none"]},
+        "input": {"type": "string"}
+    },
+    "required": ["tool", "input"]
+}
+
+# Tools offered to the model for native tool calling; each takes the same
+# single input string their execute() methods accept
+NATIVE_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": TOOL_BROWSER,
+            "description": "Open a web page, navigate websites or take screenshots",
+            "parameters": {
+                "type": "object",
+                "properties": {"input": {"type": "string", "description": "URL to open or what to look for"}},
+                "required": ["input"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": TOOL_SEARCH,
+            "description": "Search the web for current or factual information",
+            "parameters": {
+                "type": "object",
+                "properties": {"input": {"type": "string", "description": "Search query"}},
+                "required": ["input"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": TOOL_CODE,
+            "description": "Execute Python code and return its output",
+            "parameters": {
+                "type": "object",
+                "properties": {"input": {"type": "string", "description": "Python code to run"}},
+                "required": ["input"]
+            }
+        }
+    }
+]
+
 class Agent:
     """
     SparkyAI Agent - Core agent functionality
@@ -26,6 +88,18 @@ class Agent:
         self.websocket_manager = websocket_manager
         self.llm = get_llm_provider()
         self.memory = ConversationMemory(session_id)
+        self.packer = create_context_packer()
+        self.summarizer = ConversationSummarizer(
+            self.llm,
+            trigger_tokens=settings.SUMMARY_TRIGGER_TOKENS,
+            keep_turns=settings.SUMMARY_KEEP_TURNS,
+            summary_tokens=settings.SUMMARY_MAX_TOKENS
+        ) if settings.SUMMARY_ENABLED else None
+        self.vector_memory = VectorMemory(
+            session_id,
+            get_embedder(),
+            min_score=settings.VECTOR_MIN_SCORE
+        ) if settings.VECTOR_MEMORY_ENABLED else None
         self.thinking = None
         self.tools = {
             "browser": BrowserAutomation(session_id, self.notify_update),
@@ -38,6 +112,13 @@ class Agent:
         self.in_progress = False
         logger.info(f"Initialized agent for session {session_id}")
     
+    @classmethod
+    async def create(cls, session_id: str, websocket_manager = None) -> "Agent":
+        """Create an agent with the session's conversation history loaded"""
+        agent = cls(session_id, websocket_manager)
+        await agent.memory.load()
+        return agent
+    
     async def notify_update(self, update_type: str, content: Any):
         """Send updates to the client via websocket"""
         if self.websocket_manager:
@@ -57,7 +138,12 @@ class Agent:
             await self.notify_update("status", "thinking")
             
             # Add user message to memory
-            self.memory.add_message("user", message)
+            user_message = self.memory.add_message("user", message)
+            
+            # Recall relevant turns that have left the prompt, then remember this one
+            retrieved = await self._recall(message)
+            if self.vector_memory:
+                self.vector_memory.remember_later(message, "user", timestamp=user_message["timestamp"])
             
             # Initialize thinking process if not exists
             if not self.thinking:
@@ -66,8 +152,15 @@ class Agent:
             # Add thinking step
             await self.thinking.add_thinking(f"User message: {message}\n\nI need to understand what the user is asking and determine the best approach.")
             
-            # Determine if we need to use any tools
-            tool_choice, tool_input = await self._determine_tool_use(message)
+            system_prompt = "You are SparkyAI, a helpful and intelligent assistant. You have access to various tools including web browsing, search, and code execution. You can see and interact with web pages."
+            
+            # Determine if we need to use any tools. With native tool calling
+            # the model may answer straight away in the same round trip.
+            response, timings = None, None
+            if settings.LLM_NATIVE_TOOLS:
+                tool_choice, tool_input, response, timings = await self._native_tool_turn(message, system_prompt, retrieved)
+            else:
+                tool_choice, tool_input = await self._determine_tool_use(message)
             result = ""
             
             if tool_choice and tool_choice in self.tools:
@@ -80,27 +173,40 @@ class Agent:
                 
                 # Add tool result to thinking
                 await self.thinking.add_result(f"Result from {tool_choice} tool: {result[:200]}...")
+                
+                if self.vector_memory:
+                    self.vector_memory.remember_later(result, tool_choice, kind="tool")
             
-            # Generate the final response
-            system_prompt = "You are SparkyAI, a helpful and intelligent assistant. You have access to various tools including web browsing, search, and code execution. You can see and interact with web pages."
-            
-            # Construct prompt with conversation history and any tool results
-            conversation_context = self.memory.get_conversation_context()
-            prompt = f"{conversation_context}\n\n"
-            
-            if result:
-                prompt += f"I used the {tool_choice} tool and got the following information:\n{result}\n\n"
-            
-            prompt += f"Based on all available information, I need to provide a comprehensive and helpful response to the user's request: '{message}'"
-            
-            # Generate response with LLM
-            response = await self.llm.generate(
-                prompt=prompt,
-                system_prompt=system_prompt
-            )
+            # Generate the final response, unless the tool-calling pass already answered
+            if response is None:
+                # Fit history and tool output into the context window. With the
+                # chat API the history goes as structured messages; only the
+                # latest turn differs from the previous request, so the model
+                # server can reuse its cached evaluation of everything before it
+                packed = self.packer.pack(self.memory, message, system_prompt, tool_name=tool_choice,
+                                          tool_result=result, retrieved=retrieved,
+                                          chat=settings.LLM_CHAT_API_ENABLED)
+                
+                # Stream the response to the client as it is generated
+                response, timings = await self._stream_response(packed.prompt or message, packed.system_prompt,
+                                                                packed.messages)
             
+            if is_error_response(response):
+                # Report the failure without keeping it as the assistant's turn
+                logger.warning(f"No response generated for session {self.session_id}: {response}")
+                await self.thinking.add_conclusion(f"Failed to respond: {response}")
+                await self.thinking.complete()
+                await self.notify_update("status", "idle")
+                return response
+                
             # Add assistant response to memory
-            self.memory.add_message("assistant", response)
+            assistant_message = self.memory.add_message("assistant", response, metadata=timings)
+            if self.vector_memory:
+                self.vector_memory.remember_later(response, "assistant", timestamp=assistant_message["timestamp"])
+            
+            # Fold older turns into the summary without holding up this turn
+            if self.summarizer:
+                self.summarizer.schedule(self.memory)
             
             # Complete the thinking process
             await self.thinking.add_conclusion(f"My response: {response}")
@@ -115,8 +221,154 @@ class Agent:
         finally:
             self.in_progress = False
     
+    async def _stream_response(self, prompt: str, system_prompt: Optional[str] = None,
+                               messages: Optional[List[Dict[str, str]]] = None) -> tuple[str, Dict[str, float]]:
+        """
+        Generate the final response, pushing chat_delta updates as tokens arrive.
+        
+        Args:
+            prompt: Flat prompt, used when no messages are given
+            system_prompt: Optional system prompt
+            messages: Optional structured conversation to send instead of prompt
+        
+        Returns:
+            The full response text and its timings; time to first token is
+            reported separately from total latency. If the provider fails,
+            its ErrorText is returned instead and is never sent as a delta.
+        """
+        start_time = time.monotonic()
+        first_token_time = None
+        chunks = []
+        error = None
+        
+        stream = self.llm.generate_stream(prompt=prompt, system_prompt=system_prompt, messages=messages,
+                                          max_tokens=settings.LLM_RESPONSE_TOKENS, stage=STAGE_ANSWER,
+                                          priority=PRIORITY_INTERACTIVE, session_id=self.session_id)
+        try:
+            async for chunk in stream:
+                if is_error_chunk(chunk):
+                    error = chunk
+                    break
+                if first_token_time is None:
+                    first_token_time = time.monotonic()
+                chunks.append(chunk)
+                await self.notify_update("chat_delta", chunk)
+        finally:
+            await stream.aclose()
+        
+        total_latency = time.monotonic() - start_time
+        timings = {
+            "time_to_first_token": (first_token_time or time.monotonic()) - start_time,
+            "total_latency": total_latency
+        }
+        
+        logger.info(f"Response for session {self.session_id}: "
+                    f"TTFT {timings['time_to_first_token']:.3f}s, total {total_latency:.3f}s")
+        await self.notify_update("generation_stats", timings)
+        
+        return (error if error is not None else "".join(chunks)), timings
+    
+    async def _native_tool_turn(self, message: str, system_prompt: str,
+                                retrieved: Optional[List[str]] = None) -> tuple[Optional[str], Optional[str], Optional[str], Optional[Dict[str, float]]]:
+        """
+        Pick a tool or answer directly in a single tool-calling LLM pass.
+        
+        Rule-routed messages skip the pass and are answered as usual.
+        Otherwise answer text is streamed to the client as it arrives; if
+        the model calls a tool instead, the caller runs it and makes the
+        one extra call needed to answer with its result.
+        
+        Returns:
+            (tool, tool input, response, timings); response is None unless
+            the model answered without a tool
+        """
+        if settings.TOOL_ROUTER_ENABLED:
+            decision = tool_router.route(message)
+            if decision is not None:
+                return decision.tool, decision.tool_input, None, None
+        
+        start_time = time.monotonic()
+        first_token_time = None
+        chunks = []
+        tool_call = None
+        error = None
+        
+        packed = self.packer.pack(self.memory, message, system_prompt, retrieved=retrieved)
+        events = self.llm.generate_with_tools(
+            message,
+            system_prompt=packed.system_prompt,
+            max_tokens=settings.LLM_RESPONSE_TOKENS,
+            tools=NATIVE_TOOLS,
+            messages=packed.messages,
+            stage=STAGE_ANSWER,
+            priority=PRIORITY_INTERACTIVE,
+            session_id=self.session_id
+        )
+        try:
+            async for event in events:
+                if event["type"] == "tool_call":
+                    tool_call = event
+                    break
+                if is_error_chunk(event["content"]):
+                    error = event["content"]
+                    break
+                if first_token_time is None:
+                    first_token_time = time.monotonic()
+                chunks.append(event["content"])
+                await self.notify_update("chat_delta", event["content"])
+        finally:
+            await events.aclose()
+        
+        tool_router.record_llm(parsed=True)
+        
+        if tool_call is not None:
+            arguments = tool_call["arguments"] if isinstance(tool_call["arguments"], dict) else {}
+            logger.info(f"Model called tool {tool_call['name']} for session {self.session_id}")
+            return tool_call["name"], arguments.get("input") or message, None, None
+        
+        total_latency = time.monotonic() - start_time
+        timings = {
+            "time_to_first_token": (first_token_time or time.monotonic()) - start_time,
+            "total_latency": total_latency
+        }
+        logger.info(f"Response for session {self.session_id}: "
+                    f"TTFT {timings['time_to_first_token']:.3f}s, total {total_latency:.3f}s")
+        await self.notify_update("generation_stats", timings)
+        
+        return None, None, (error if error is not None else "".join(chunks)), timings
+    
+    async def _recall(self, message: str) -> List[str]:
+        """
+        Recall earlier turns and tool results relevant to a message.
+        
+        Turns still inside the prompt window are skipped, since the model
+        already sees them.
+        """
+        if not self.vector_memory:
+            return []
+        
+        window = self.memory.get_unsummarized_messages()
+        first = self.memory.window_start if self.memory.window_start in window else (window[0] if window else None)
+        entries = await self.vector_memory.recall(message, k=settings.VECTOR_RECALL_K,
+                                                  before=first["timestamp"] if first else None)
+        
+        recalled = []
+        for entry in entries:
+            date = entry["timestamp"][:10]
+            if entry["kind"] == "tool":
+                recalled.append(f"Result from the {entry['role']} tool ({date}): {entry['text']}")
+            else:
+                recalled.append(f"{entry['role'].capitalize()} ({date}): {entry['text']}")
+        return recalled
+    
     async def _determine_tool_use(self, message: str) -> tuple[Optional[str], Optional[str]]:
         """Determine if and which tool to use based on the message"""
+        # Clear-cut messages are routed by rules, saving an LLM round-trip
+        if settings.TOOL_ROUTER_ENABLED:
+            decision = tool_router.route(message)
+            if decision is not None:
+                return decision.tool, decision.tool_input
+        
         system_prompt = """
         Analyze the user message and determine if you need to use a specific tool. 
         Options are:
@@ -130,22 +382,36 @@ class Agent:
         
         prompt = f"User message: '{message}'\n\nWhich tool, if any, should I use to best address this request?"
         
-        response = await self.llm.generate(
-            prompt=prompt,
+        output_format = {
+            "schema": TOOL_SELECTION_SCHEMA,
+            "json": "json"
+        }.get(settings.TOOL_ROUTING_FORMAT)
+        
+        # Stream the selection and stop as soon as the JSON object closes
+        parsed_response = await generate_json(
+            self.llm,
+            prompt,
             system_prompt=system_prompt,
-            temperature=0.3  # Lower temperature for more deterministic tool selection
+            schema=output_format,
+            temperature=0.3,  # Lower temperature for more deterministic tool selection
+            max_tokens=settings.TOOL_ROUTING_MAX_TOKENS,
+            stage=STAGE_ROUTING,
+            priority=PRIORITY_ROUTING,
+            session_id=self.session_id,
+            semantic_text=message,  # Match on the message, not the fixed prompt around it
+            semantic_fields=("tool",)  # A similar message's input must not be reused; it falls back to this one
         )
         
-        try:
-            # Try to parse the JSON response
-            parsed_response = json.loads(response)
-            tool = parsed_response.get("tool", "none")
-            tool_input = parsed_response.get("input", message)
+        if parsed_response is None:
+            tool_router.record_llm(parsed=False)
+            logger.warning("Failed to parse tool selection JSON")
+            return None, None
+        
+        tool_router.record_llm()
+        tool = parsed_response.get("tool", "none")
+        tool_input = parsed_response.get("input") or message
+        
+        if tool == "none":
+            return None, None
             
-            if tool == "none":
-                return None, None
-                
-            return tool, tool_input
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse tool selection JSON: {response}")
-            return None, None
\ No newline at end of file
+        return tool, tool_input
\ No newline at end of file
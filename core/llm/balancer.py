@@ -0,0 +1,387 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from urllib.parse import urlsplit
+from typing import Dict, Any, Optional, AsyncIterator, List, Set, Union
+
+from config.settings import settings
+from core.llm.base import is_error_chunk, is_error_response
+from core.llm.latency import AdaptiveTimeoutLLM, LatencyTracker, DEFAULT_STAGE
+from core.llm.llama import LlamaLLM
+
+logger = logging.getLogger(__name__)
+
+class Backend:
+    """
+    One Ollama host behind the load balancer, with its routing state.
+    """
+    
+    def __init__(self, provider: Union[LlamaLLM, AdaptiveTimeoutLLM]):
+        self.provider = provider
+        self.url = provider.api_url
+        parts = urlsplit(self.url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.healthy = True
+        self.failures = 0  # Consecutive failures
+        self.models: Optional[Set[str]] = None  # None until the first health probe
+        self.requests = 0
+        self.errors = 0
+    
+    def has_model(self, model: str) -> bool:
+        """Check whether the backend has a model, treating an unprobed backend as having all"""
+        if self.models is None:
+            return True
+        if model in self.models:
+            return True
+        # Ollama reports "llama3:latest" for a model requested as "llama3"
+        return ":" not in model and f"{model}:latest" in self.models
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the backend state to a dictionary"""
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "models": sorted(self.models) if self.models is not None else None,
+            "latency": self.provider.tracker.stats() if isinstance(self.provider, AdaptiveTimeoutLLM) else None
+        }
+
+class LlamaBackendPool:
+    """
+    Spreads requests over several Ollama hosts.
+    
+    Requests go to the healthy host with the fewest outstanding requests
+    ("least_outstanding") or the lowest latency EWMA weighted by load
+    ("ewma"), restricted to hosts that have the requested model. A
+    periodic /api/tags probe ejects unreachable hosts, re-admits them once
+    they answer again and refreshes the list of models each host has.
+    
+    Given max_concurrency, a host already running that many requests only
+    gets more when every other candidate is as busy, so one slow or hung
+    host cannot take the scheduler's slots while the others sit idle.
+    
+    Given timeout_options, every host gets its own adaptive timeouts (see
+    AdaptiveTimeoutLLM). Given hedge_percentile, a request that has not
+    answered (or, for streams, sent its first chunk) within that latency
+    percentile for its stage is also sent to a second host; the first good
+    answer wins and the other request is cancelled.
+    """
+    
+    def __init__(self, api_urls: List[str], model_name: Optional[str] = None,
+                 strategy: str = "least_outstanding", health_interval: float = 15,
+                 health_timeout: float = 5, max_failures: int = 3, ewma_alpha: float = 0.3,
+                 timeout_options: Optional[Dict[str, Any]] = None, hedge_percentile: Optional[float] = None,
+                 latency_window: int = 200, latency_min_samples: int = 20, max_concurrency: Optional[int] = None):
+        self.backends = []
+        for url in api_urls:
+            provider = LlamaLLM(api_url=url, model_name=model_name)
+            if timeout_options is not None:
+                provider = AdaptiveTimeoutLLM(provider, **timeout_options)
+            self.backends.append(Backend(provider))
+        self.model_name = self.backends[0].provider.model_name
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_failures = max_failures
+        self.ewma_alpha = ewma_alpha
+        self.max_concurrency = max_concurrency
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker(latency_window, latency_min_samples)
+        self.hedges = {"sent": 0, "won": 0}
+        self.health_task: Optional[asyncio.Task] = None
+        logger.info(f"Initializing Llama backend pool with {len(self.backends)} hosts ({strategy})")
+    
+    async def ensure_session(self):
+        """Open every backend session and start health probing"""
+        for backend in self.backends:
+            await backend.provider.ensure_session()
+        
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.create_task(self._health_loop())
+    
+    def _has_capacity(self, backend: Backend) -> bool:
+        """Check whether a backend runs fewer than max_concurrency requests"""
+        return self.max_concurrency is None or backend.outstanding < self.max_concurrency
+    
+    def _choose(self, model: str) -> Backend:
+        """Pick the backend for the next request"""
+        candidates = [b for b in self.backends if b.healthy and b.has_model(model)]
+        if not candidates:
+            # Nothing healthy has the model: try any healthy host, then any host at all
+            candidates = [b for b in self.backends if b.healthy] or self.backends
+        # Hosts at their concurrency limit only when all of them are
+        candidates = [b for b in candidates if self._has_capacity(b)] or candidates
+        
+        if self.strategy == "ewma":
+            return min(candidates, key=lambda b: (b.ewma_latency or 0.0) * (b.outstanding + 1))
+        return min(candidates, key=lambda b: (b.outstanding, b.ewma_latency or 0.0))
+    
+    def _choose_hedge(self, primary: Backend, model: str) -> Optional[Backend]:
+        """Pick a second healthy backend with the model and a free slot, if there is one"""
+        candidates = [b for b in self.backends
+                      if b is not primary and b.healthy and b.has_model(model) and self._has_capacity(b)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: (b.outstanding, b.ewma_latency or 0.0))
+    
+    def _hedge_delay(self, key: str) -> Optional[float]:
+        """Get how long to wait before hedging, or None when hedging is off or there are too few samples"""
+        if self.hedge_percentile is None:
+            return None
+        return self.latency.percentile(key, self.hedge_percentile)
+    
+    def _route(self, kwargs: Dict[str, Any]) -> Backend:
+        """
+        Pick the backend for a request and pin the model it should run.
+        
+        When no healthy host has the stage model, the request falls back
+        to the default model.
+        """
+        model = kwargs.get("model") or settings.LLAMA_STAGE_MODELS.get(kwargs.get("stage") or "") or self.model_name
+        if model != self.model_name and not any(b.healthy and b.has_model(model) for b in self.backends):
+            logger.debug(f"No healthy Llama backend has {model}, using {self.model_name}")
+            model = self.model_name
+        
+        kwargs["model"] = model
+        return self._choose(model)
+    
+    def _observe(self, backend: Backend, latency: float, failed: bool, key: Optional[str] = None):
+        """Update a backend's latency and failure state after a request"""
+        backend.requests += 1
+        if failed:
+            backend.errors += 1
+            backend.failures += 1
+            if backend.healthy and backend.failures >= self.max_failures:
+                backend.healthy = False
+                logger.warning(f"Ejected Llama backend {backend.url} after {backend.failures} failures")
+            return
+        
+        backend.failures = 0
+        if key is not None:
+            self.latency.record(key, latency)
+        if backend.ewma_latency is None:
+            backend.ewma_latency = latency
+        else:
+            backend.ewma_latency += self.ewma_alpha * (latency - backend.ewma_latency)
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text on the best available backend, hedging on a second one when it is slow"""
+        backend = self._route(kwargs)
+        key = kwargs.get("stage") or DEFAULT_STAGE
+        call = lambda b: self._generate_on(b, key, prompt, system_prompt, temperature, max_tokens, kwargs)
+        
+        hedge_after = self._hedge_delay(key)
+        if hedge_after is None:
+            return await call(backend)
+        
+        tasks = [asyncio.create_task(call(backend))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                hedge = self._choose_hedge(backend, kwargs["model"])
+                if hedge is not None:
+                    logger.debug(f"Hedging slow {key} request from {backend.url} to {hedge.url}")
+                    self.hedges["sent"] += 1
+                    tasks.append(asyncio.create_task(call(hedge)))
+            
+            pending = set(tasks)
+            response = ""
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    response = task.result()
+                    if not is_error_response(response):
+                        if task is not tasks[0]:
+                            self.hedges["won"] += 1
+                        return response
+            return response
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _generate_on(self, backend: Backend, key: str, prompt: str, system_prompt: Optional[str],
+                           temperature: float, max_tokens: int, kwargs: Dict[str, Any]) -> str:
+        """Generate text on one backend, tracking its load and latency"""
+        backend.outstanding += 1
+        start_time = time.monotonic()
+        try:
+            response = await backend.provider.generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        finally:
+            backend.outstanding -= 1
+        
+        self._observe(backend, time.monotonic() - start_time, is_error_response(response), key)
+        return response
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream text from the best available backend.
+        
+        With hedging on, a stream whose first chunk is slow is raced
+        against the same stream on a second backend; whichever sends a
+        good first chunk first is kept and the other is closed.
+        """
+        backend = self._route(kwargs)
+        key = f"{kwargs.get('stage') or DEFAULT_STAGE}/ttft"
+        open_stream = lambda b: self._stream_on(b, key, prompt, system_prompt, temperature, max_tokens, kwargs)
+        
+        primary = open_stream(backend)
+        hedge_after = self._hedge_delay(key)
+        if hedge_after is None:
+            try:
+                async for chunk in primary:
+                    yield chunk
+            finally:
+                await primary.aclose()
+            return
+        
+        # Map each pending first-chunk task to its stream
+        racing = {asyncio.ensure_future(primary.__anext__()): primary}
+        winner = None
+        first_chunk = None
+        try:
+            done, _ = await asyncio.wait(racing, timeout=hedge_after)
+            if not done:
+                hedge = self._choose_hedge(backend, kwargs["model"])
+                if hedge is not None:
+                    logger.debug(f"Hedging slow {key} stream from {backend.url} to {hedge.url}")
+                    self.hedges["sent"] += 1
+                    secondary = open_stream(hedge)
+                    racing[asyncio.ensure_future(secondary.__anext__())] = secondary
+            
+            while racing and winner is None:
+                done, _ = await asyncio.wait(racing, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stream = racing.pop(task)
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        chunk = None
+                    if (chunk is None or is_error_chunk(chunk)) and racing:
+                        # The other backend may still answer
+                        first_chunk = chunk
+                        await stream.aclose()
+                        continue
+                    winner, first_chunk = stream, chunk
+                    if stream is not primary:
+                        self.hedges["won"] += 1
+                    break
+        finally:
+            for task, stream in racing.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+        
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                async for chunk in winner:
+                    yield chunk
+        finally:
+            await winner.aclose()
+    
+    async def _stream_on(self, backend: Backend, key: str, prompt: str, system_prompt: Optional[str],
+                         temperature: float, max_tokens: int, kwargs: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream text from one backend, tracking its load and time to first chunk"""
+        backend.outstanding += 1
+        start_time = time.monotonic()
+        first_chunk = None
+        try:
+            async for chunk in backend.provider.generate_stream(prompt, system_prompt, temperature,
+                                                                max_tokens, **kwargs):
+                if first_chunk is None:
+                    first_chunk = chunk
+                    # Time to first token is the latency signal for streams
+                    self._observe(backend, time.monotonic() - start_time, is_error_chunk(chunk), key)
+                yield chunk
+        finally:
+            backend.outstanding -= 1
+    
+    async def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1024,
+                                  tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls from the best available backend"""
+        backend = self._route(kwargs)
+        backend.outstanding += 1
+        start_time = time.monotonic()
+        observed = False
+        try:
+            async for event in backend.provider.generate_with_tools(prompt, system_prompt, temperature,
+                                                                    max_tokens, tools, **kwargs):
+                if not observed:
+                    observed = True
+                    failed = event["type"] == "content" and is_error_chunk(event["content"])
+                    self._observe(backend, time.monotonic() - start_time, failed)
+                yield event
+        finally:
+            backend.outstanding -= 1
+    
+    async def _health_loop(self):
+        """Probe every backend periodically"""
+        while True:
+            await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+    
+    async def _probe(self, backend: Backend):
+        """Check a backend through /api/tags and refresh its model list"""
+        try:
+            session = await backend.provider.ensure_session()
+            timeout = aiohttp.ClientTimeout(total=self.health_timeout)
+            async with session.get(f"{backend.base_url}/api/tags", timeout=timeout) as response:
+                if response.status != 200:
+                    raise ValueError(f"status {response.status}")
+                data = await response.json()
+            
+            backend.models = {model.get("name", "") for model in data.get("models", [])}
+            backend.failures = 0
+            if not backend.healthy:
+                backend.healthy = True
+                logger.info(f"Re-admitted Llama backend {backend.url}")
+        
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if backend.healthy:
+                logger.warning(f"Ejected Llama backend {backend.url}: health probe failed ({str(e)})")
+            backend.healthy = False
+    
+    async def warm_up(self, model_name: Optional[str] = None, keep_alive: Optional[str] = None) -> bool:
+        """Load a model on every healthy backend, returning True if any succeeded"""
+        backends = [b for b in self.backends if b.healthy] or self.backends
+        results = await asyncio.gather(*(b.provider.warm_up(model_name, keep_alive) for b in backends))
+        return any(results)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get the routing state of every backend"""
+        return {
+            "backends": {
+                "strategy": self.strategy,
+                "healthy": sum(1 for b in self.backends if b.healthy),
+                "hosts": [backend.to_dict() for backend in self.backends],
+                "hedging": {
+                    "enabled": self.hedge_percentile is not None,
+                    **self.hedges,
+                    "latency": self.latency.stats()
+                }
+            }
+        }
+    
+    async def close(self):
+        """Stop health probing and close every backend session"""
+        if self.health_task:
+            self.health_task.cancel()
+            try:
+                await self.health_task
+            except asyncio.CancelledError:
+                pass
+            self.health_task = None
+        
+        for backend in self.backends:
+            await backend.provider.close()
@@ -0,0 +1,104 @@
+import json
+import hashlib
+import logging
+from typing import Dict, Any, Optional, AsyncIterator, List
+
+logger = logging.getLogger(__name__)
+
+# Keyword arguments that steer how a request is handled but not what it returns
+ROUTING_HINTS = ("priority", "session_id", "timeout", "semantic_text", "semantic_fields")
+
+class ErrorText(str):
+    """
+    Message a provider returns or yields in place of text when a request fails.
+    
+    It is still a str, so it can be shown to the user as is, but failures are
+    recognized by this type and never by what the text says: a model answer
+    may well start with "Error".
+    """
+
+def is_error_response(text: Optional[str]) -> bool:
+    """Check whether a provider failed: it returned an ErrorText, or nothing at all"""
+    return not text or isinstance(text, ErrorText)
+
+def is_error_chunk(chunk: Optional[str]) -> bool:
+    """Check whether a streamed chunk is an ErrorText, which can follow partial text"""
+    return isinstance(chunk, ErrorText)
+
+def model_of(provider) -> str:
+    """Get the model name of a provider or wrapper"""
+    return getattr(provider, "model_name", None) or getattr(provider, "model", "") or ""
+
+def request_key(model: str, prompt: str, system_prompt: Optional[str], temperature: float,
+                max_tokens: int, **options) -> str:
+    """
+    Build a stable key identifying an LLM request.
+    
+    Args:
+        model: Model the request is sent to
+        prompt: User prompt
+        system_prompt: Optional system prompt
+        temperature: Sampling temperature
+        max_tokens: Maximum number of tokens to generate
+        **options: Any other request options; routing hints are ignored
+    
+    Returns:
+        Hex digest of the request parameters
+    """
+    options = {k: v for k, v in options.items() if k not in ROUTING_HINTS}
+    payload = json.dumps({
+        "model": model,
+        "prompt": prompt,
+        "system": system_prompt or "",
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "options": options
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMWrapper:
+    """
+    Base class for layers stacked in front of an LLM provider.
+    
+    Wrappers expose the same interface as the providers and delegate
+    everything they do not override to the wrapped instance.
+    """
+    
+    def __init__(self, inner):
+        self.inner = inner
+    
+    def __getattr__(self, name: str):
+        # Only called for attributes not found on the wrapper itself
+        return getattr(self.inner, name)
+    
+    async def ensure_session(self):
+        """Ensure the wrapped provider has an open session"""
+        return await self.inner.ensure_session()
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text through the wrapped provider"""
+        return await self.inner.generate(prompt, system_prompt=system_prompt, temperature=temperature,
+                                         max_tokens=max_tokens, **kwargs)
+    
+    def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                        temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """Stream text through the wrapped provider"""
+        return self.inner.generate_stream(prompt, system_prompt=system_prompt, temperature=temperature,
+                                          max_tokens=max_tokens, **kwargs)
+    
+    def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                            temperature: float = 0.7, max_tokens: int = 1024,
+                            tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls through the wrapped provider"""
+        return self.inner.generate_with_tools(prompt, system_prompt=system_prompt, temperature=temperature,
+                                              max_tokens=max_tokens, tools=tools, **kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get metrics for this layer and every layer below it"""
+        inner_stats = getattr(self.inner, "stats", None)
+        return inner_stats() if callable(inner_stats) else {}
+    
+    async def close(self):
+        """Close the wrapped provider"""
+        await self.inner.close()
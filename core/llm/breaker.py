@@ -0,0 +1,286 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator, Iterator, List, Tuple, Callable
+
+from core.llm.base import ErrorText, LLMWrapper, is_error_chunk, is_error_response
+from core.llm.scheduler import take_slot_wait
+
+logger = logging.getLogger(__name__)
+
+# Returned instead of calling a provider whose circuit is open
+CIRCUIT_OPEN_ERROR = ErrorText("Error: The language model is temporarily unavailable. Please try again shortly.")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+def is_circuit_open_response(text: Optional[str]) -> bool:
+    """Check whether a response is the fast-fail returned while circuits are open"""
+    return text == CIRCUIT_OPEN_ERROR
+
+class CircuitBreaker:
+    """
+    Tracks recent call outcomes for one provider and fails fast while it is down.
+    
+    The circuit opens when, over the last window calls, the failure rate or
+    the rate of calls slower than slow_call_seconds reaches its threshold.
+    After open_seconds it goes half-open and lets a few probe calls through:
+    a successful probe closes it again, a failed one re-opens it.
+    """
+    
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_rate: float = 0.8,
+                 slow_call_seconds: float = 30, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.outcomes: deque = deque(maxlen=window)  # (failed, slow) per call
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+    
+    def allow(self) -> bool:
+        """Check whether a call may go through, moving to half-open when the wait is over"""
+        if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = STATE_HALF_OPEN
+            self.probes = 0
+            logger.info(f"Circuit for {self.name} LLM provider is half-open, probing")
+        
+        if self.state == STATE_HALF_OPEN:
+            if self.probes < self.half_open_probes:
+                self.probes += 1
+                return True
+        elif self.state == STATE_CLOSED:
+            return True
+        
+        self.counters["rejected"] += 1
+        return False
+    
+    def record(self, failed: bool, latency: float, slow_call_seconds: Optional[float] = None):
+        """Record the outcome of an allowed call, optionally with its own slow call limit"""
+        self.counters["calls"] += 1
+        if failed:
+            self.counters["failures"] += 1
+        
+        if self.state == STATE_HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+            if failed:
+                self._open()
+            else:
+                self.state = STATE_CLOSED
+                self.outcomes.clear()
+                logger.info(f"Circuit for {self.name} LLM provider closed")
+            return
+        
+        self.outcomes.append((failed, latency >= (slow_call_seconds or self.slow_call_seconds)))
+        if self.state == STATE_CLOSED and len(self.outcomes) >= self.min_calls:
+            failure_rate, slow_rate = self._rates()
+            if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                self._open()
+    
+    def abandon(self):
+        """Give back the probe slot of an allowed call that was cancelled"""
+        if self.state == STATE_HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+    
+    def _open(self):
+        """Start failing fast"""
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.counters["opened"] += 1
+        logger.warning(f"Circuit for {self.name} LLM provider opened for {self.open_seconds}s")
+    
+    def _rates(self) -> Tuple[float, float]:
+        """Get the failure and slow call rates over the window"""
+        if not self.outcomes:
+            return 0.0, 0.0
+        failures = sum(1 for failed, _ in self.outcomes if failed)
+        slow = sum(1 for _, slow in self.outcomes if slow)
+        return failures / len(self.outcomes), slow / len(self.outcomes)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get the circuit state and call counters"""
+        failure_rate, slow_rate = self._rates()
+        return {
+            "state": self.state,
+            "failure_rate": failure_rate,
+            "slow_call_rate": slow_rate,
+            **self.counters
+        }
+
+class CircuitBreakerLLM(LLMWrapper):
+    """
+    Puts a circuit breaker in front of a provider, optionally failing over to another.
+    
+    Requests go to the primary provider while its circuit allows them. If
+    the circuit is open or the call fails, they go to the fallback provider
+    (under its own breaker) when there is one. With nothing available the
+    request fails immediately with CIRCUIT_OPEN_ERROR instead of waiting for
+    a timeout. Streams can only fail over before their first chunk.
+    
+    The latency of a call is measured without the time it waited for a
+    scheduler slot, so a busy but healthy provider does not look slow; for
+    streams it is the time to the first chunk. stage_slow_seconds gives
+    stages that normally run long their own slow call limit.
+    """
+    
+    def __init__(self, inner, fallback=None, primary_name: str = "primary", fallback_name: str = "fallback",
+                 stage_slow_seconds: Optional[Dict[str, float]] = None, **breaker_options):
+        super().__init__(inner)
+        self.fallback = fallback
+        self.stage_slow_seconds = stage_slow_seconds or {}
+        self.routes: List[Tuple[Any, CircuitBreaker]] = [(inner, CircuitBreaker(primary_name, **breaker_options))]
+        if fallback is not None:
+            self.routes.append((fallback, CircuitBreaker(fallback_name, **breaker_options)))
+        self.failovers = 0
+    
+    def _available(self) -> Iterator[Tuple[int, Any, CircuitBreaker]]:
+        """Yield the providers whose circuits allow a call, primary first"""
+        for index, (provider, breaker) in enumerate(self.routes):
+            # Only asked when reached, so a half-open probe slot is not
+            # taken unless the call is really made
+            if breaker.allow():
+                yield index, provider, breaker
+    
+    def _record(self, breaker: CircuitBreaker, failed: bool, start_time: float, stage: Optional[str]):
+        """Record a call's outcome, leaving out the time it spent queued"""
+        latency = time.monotonic() - start_time - take_slot_wait()
+        breaker.record(failed, latency, self.stage_slow_seconds.get(stage))
+    
+    def _count_failover(self, index: int):
+        """Count a request served by the fallback provider"""
+        if index > 0:
+            self.failovers += 1
+    
+    async def ensure_session(self):
+        """Ensure every provider has an open session"""
+        for provider, _ in self.routes:
+            await provider.ensure_session()
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text on the first provider that is up"""
+        response = CIRCUIT_OPEN_ERROR
+        stage = kwargs.get("stage")
+        for index, provider, breaker in self._available():
+            take_slot_wait()
+            start_time = time.monotonic()
+            try:
+                response = await provider.generate(prompt, system_prompt=system_prompt, temperature=temperature,
+                                                   max_tokens=max_tokens, **kwargs)
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except Exception as e:
+                self._record(breaker, True, start_time, stage)
+                logger.error(f"Error from {breaker.name} LLM provider: {str(e)}")
+                response = ErrorText(f"Error: An unexpected error occurred: {str(e)}")
+                continue
+            
+            failed = is_error_response(response)
+            self._record(breaker, failed, start_time, stage)
+            if not failed:
+                self._count_failover(index)
+                return response
+        
+        return response
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """Stream text from the first provider that is up"""
+        streams = self._failover_stream(
+            lambda provider: provider.generate_stream(prompt, system_prompt=system_prompt, temperature=temperature,
+                                                      max_tokens=max_tokens, **kwargs),
+            is_error_chunk,
+            CIRCUIT_OPEN_ERROR,
+            kwargs.get("stage")
+        )
+        async for chunk in streams:
+            yield chunk
+    
+    async def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1024,
+                                  tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls from the first provider that is up"""
+        streams = self._failover_stream(
+            lambda provider: provider.generate_with_tools(prompt, system_prompt=system_prompt, temperature=temperature,
+                                                          max_tokens=max_tokens, tools=tools, **kwargs),
+            lambda event: event["type"] == "content" and is_error_chunk(event["content"]),
+            {"type": "content", "content": CIRCUIT_OPEN_ERROR},
+            kwargs.get("stage")
+        )
+        async for event in streams:
+            yield event
+    
+    async def _failover_stream(self, open_stream: Callable[[Any], AsyncIterator[Any]],
+                               is_failure: Callable[[Any], bool], unavailable: Any,
+                               stage: Optional[str] = None) -> AsyncIterator[Any]:
+        """
+        Stream from the first provider whose first item is not an error.
+        
+        A provider fails by raising or by yielding its ErrorText first; the
+        text of an answer is never taken as a failure. Time to the first
+        item is the latency recorded for the breaker.
+        """
+        last_error = unavailable
+        for index, provider, breaker in self._available():
+            take_slot_wait()
+            start_time = time.monotonic()
+            stream = open_stream(provider)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                self._record(breaker, False, start_time, stage)
+                self._count_failover(index)
+                return
+            except asyncio.CancelledError:
+                breaker.abandon()
+                await stream.aclose()
+                raise
+            except Exception as e:
+                self._record(breaker, True, start_time, stage)
+                logger.error(f"Error from {breaker.name} LLM provider: {str(e)}")
+                await stream.aclose()
+                continue
+            
+            if is_failure(first):
+                self._record(breaker, True, start_time, stage)
+                last_error = first
+                await stream.aclose()
+                continue
+            
+            self._record(breaker, False, start_time, stage)
+            self._count_failover(index)
+            try:
+                yield first
+                async for item in stream:
+                    yield item
+            finally:
+                await stream.aclose()
+            return
+        
+        yield last_error
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get circuit states along with the wrapped providers' metrics"""
+        stats = super().stats()
+        stats["circuit_breaker"] = {
+            "failovers": self.failovers,
+            "circuits": {breaker.name: breaker.stats() for _, breaker in self.routes}
+        }
+        if self.fallback is not None:
+            fallback_stats = getattr(self.fallback, "stats", None)
+            stats["circuit_breaker"]["fallback"] = fallback_stats() if callable(fallback_stats) else {}
+        return stats
+    
+    async def close(self):
+        """Close every provider"""
+        for provider, _ in self.routes:
+            await provider.close()
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+
+from core.llm.base import LLMWrapper, is_error_chunk, is_error_response, model_of, request_key
+from core.llm.structured import extract_json
+
+logger = logging.getLogger(__name__)
+
+class MemoryCache:
+    """
+    Bounded in-memory LRU cache with per-entry expiry.
+    """
+    
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.size_bytes = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a value, dropping it if it has expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at and expires_at < time.time():
+            self._remove(key)
+            return None
+        
+        self.entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Store a value, evicting least recently used entries to stay within bounds"""
+        if key in self.entries:
+            self._remove(key)
+        
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        
+        expires_at = time.time() + ttl if ttl else 0
+        self.entries[key] = (expires_at, value)
+        self.size_bytes += size
+        
+        while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def _remove(self, key: str):
+        """Remove an entry and release its size"""
+        _, value = self.entries.pop(key)
+        self.size_bytes -= len(value.encode("utf-8"))
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class DiskCache:
+    """
+    Persistent SQLite cache that survives restarts.
+    
+    All methods are blocking and are meant to be run in a worker thread.
+    """
+    
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        self.conn.commit()
+        logger.info(f"Opened LLM disk cache at {path}")
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a value, dropping it if it has expired"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            value, expires_at = row
+            now = time.time()
+            if expires_at and expires_at < now:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return value
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Store a value, evicting least recently used rows to stay within the size limit"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        
+        now = time.time()
+        expires_at = now + ttl if ttl else 0
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires_at, now)
+            )
+            self.conn.execute("DELETE FROM llm_cache WHERE expires_at > 0 AND expires_at < ?", (now,))
+            self._evict()
+            self.conn.commit()
+    
+    def _evict(self):
+        """Delete least recently used rows until the cache fits in max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        while total > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.evictions += 1
+    
+    def count(self) -> int:
+        """Get the number of stored entries"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
+
+class CachedLLM(LLMWrapper):
+    """
+    Two-tier response cache (in-memory LRU + SQLite) in front of an LLM provider.
+    
+    Only calls at or below max_temperature are cached, since higher
+    temperatures are expected to give a different answer each time.
+    Error responses, and streams that produced an error partway, are never
+    cached.
+    """
+    
+    def __init__(self, inner, memory_entries: int = 1000, memory_bytes: int = 32 * 1024 * 1024,
+                 disk_path: Optional[str] = None, disk_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = 86400, max_temperature: float = 0.3):
+        super().__init__(inner)
+        self.memory = MemoryCache(memory_entries, memory_bytes)
+        self.disk = DiskCache(disk_path, disk_bytes) if disk_path else None
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+    
+    def _key(self, prompt: str, system_prompt: Optional[str], temperature: float,
+             max_tokens: int, kwargs: Dict[str, Any]) -> Optional[str]:
+        """Get the cache key for a request, or None if it should not be cached"""
+        if temperature > self.max_temperature:
+            self.counters["bypassed"] += 1
+            return None
+        return request_key(model_of(self.inner), prompt, system_prompt, temperature, max_tokens, **kwargs)
+    
+    async def _lookup(self, key: str) -> Optional[str]:
+        """Look a key up in memory, then on disk"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        
+        if self.disk:
+            try:
+                value = await asyncio.to_thread(self.disk.get, key)
+            except Exception as e:
+                logger.error(f"Error reading LLM disk cache: {str(e)}")
+                value = None
+            
+            if value is not None:
+                self.counters["disk_hits"] += 1
+                self.memory.set(key, value, self.ttl)
+                return value
+        
+        self.counters["misses"] += 1
+        return None
+    
+    async def _store(self, key: str, value: str):
+        """Store a successful response in both tiers"""
+        if is_error_response(value):
+            return
+        
+        self.memory.set(key, value, self.ttl)
+        self.counters["stores"] += 1
+        
+        if self.disk:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value, self.ttl)
+            except Exception as e:
+                logger.error(f"Error writing LLM disk cache: {str(e)}")
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text, answering from the cache when possible"""
+        key = self._key(prompt, system_prompt, temperature, max_tokens, kwargs)
+        if key is None:
+            return await super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        
+        cached = await self._lookup(key)
+        if cached is not None:
+            return cached
+        
+        response = await super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        await self._store(key, response)
+        return response
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """Stream text, replaying cached responses as a single chunk"""
+        key = self._key(prompt, system_prompt, temperature, max_tokens, kwargs)
+        if key is not None:
+            cached = await self._lookup(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        failed = False
+        complete = False
+        try:
+            async for chunk in super().generate_stream(prompt, system_prompt, temperature, max_tokens, **kwargs):
+                chunks.append(chunk)
+                failed = failed or is_error_chunk(chunk)
+                yield chunk
+            complete = True
+        finally:
+            if key is not None and not failed:
+                response = "".join(chunks)
+                if complete:
+                    await self._store(key, response)
+                elif kwargs.get("format"):
+                    # Structured output is closed as soon as the object is
+                    # complete (see generate_json), so keep just that object
+                    parsed = extract_json(response)
+                    if parsed is not None:
+                        await self._store(key, json.dumps(parsed))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters along with the wrapped provider's metrics"""
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        stats = super().stats()
+        stats["cache"] = {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size_bytes,
+            "memory_evictions": self.memory.evictions,
+            "disk_evictions": self.disk.evictions if self.disk else 0
+        }
+        return stats
+    
+    async def close(self):
+        """Close the wrapped provider and the disk cache"""
+        await super().close()
+        if self.disk:
+            self.disk.close()
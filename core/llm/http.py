@@ -0,0 +1,22 @@
+import logging
+import aiohttp
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+def create_client_session() -> aiohttp.ClientSession:
+    """
+    Create an aiohttp session backed by a tuned, keep-alive connection pool.
+    
+    Providers are process-wide singletons, so a single pool is reused by every
+    session and tool instead of paying TCP setup on each turn.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=settings.LLM_POOL_LIMIT,
+        limit_per_host=settings.LLM_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=settings.LLM_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=settings.LLM_DNS_CACHE_TTL
+    )
+    logger.debug(f"Created LLM connection pool (limit={settings.LLM_POOL_LIMIT}, "
+                 f"per host={settings.LLM_POOL_LIMIT_PER_HOST})")
+    return aiohttp.ClientSession(connector=connector)
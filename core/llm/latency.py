@@ -0,0 +1,132 @@
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator, List
+
+from core.llm.base import LLMWrapper, is_error_chunk, is_error_response
+
+logger = logging.getLogger(__name__)
+
+# Stage recorded for requests that do not name one
+DEFAULT_STAGE = "default"
+
+class LatencyTracker:
+    """
+    Rolling latency samples per key (usually a pipeline stage) with percentiles.
+    """
+    
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples: Dict[str, deque] = {}
+    
+    def record(self, key: str, latency: float):
+        """Add a latency sample"""
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.window)
+        samples.append(latency)
+    
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        """Get a latency percentile (0 < q <= 1), or None until there are min_samples samples"""
+        samples = self.samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get sample counts and common percentiles per key"""
+        stats = {}
+        for key, samples in self.samples.items():
+            ordered = sorted(samples)
+            stats[key] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                "p99": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+            }
+        return stats
+
+class AdaptiveTimeoutLLM(LLMWrapper):
+    """
+    Sets each request's timeout from the latencies observed for its stage.
+    
+    Once a stage has enough samples its timeout becomes the chosen
+    percentile times a multiplier, clamped to [min_timeout, max_timeout];
+    before that the stage's configured default applies. Complete calls are
+    timed end to end; streams are timed to their first chunk, since the
+    stream timeout bounds the silence between chunks. Calls that hit their
+    timeout are recorded at the timeout so a too-tight value can grow.
+    """
+    
+    def __init__(self, inner, default_timeout: float = 60, stage_timeouts: Optional[Dict[str, float]] = None,
+                 percentile: float = 0.99, multiplier: float = 3.0, min_timeout: float = 5,
+                 max_timeout: float = 300, window: int = 200, min_samples: int = 20):
+        super().__init__(inner)
+        self.default_timeout = default_timeout
+        self.stage_timeouts = stage_timeouts or {}
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.tracker = LatencyTracker(window, min_samples)
+    
+    def timeout_for(self, key: str, stage: str) -> float:
+        """Get the timeout for a stage's complete calls or streams"""
+        observed = self.tracker.percentile(key, self.percentile)
+        if observed is None:
+            return self.stage_timeouts.get(stage, self.default_timeout)
+        return min(self.max_timeout, max(self.min_timeout, observed * self.multiplier))
+    
+    def _record(self, key: str, latency: float, timeout: float, failed: bool):
+        """Record a call's latency unless it failed for a reason other than timing out"""
+        if not failed:
+            self.tracker.record(key, latency)
+        elif latency >= timeout * 0.95:
+            self.tracker.record(key, timeout)
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text with a timeout fitted to the stage"""
+        stage = kwargs.get("stage") or DEFAULT_STAGE
+        if kwargs.get("timeout"):
+            return await super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        
+        timeout = self.timeout_for(stage, stage)
+        start_time = time.monotonic()
+        response = await super().generate(prompt, system_prompt, temperature, max_tokens, timeout=timeout, **kwargs)
+        self._record(stage, time.monotonic() - start_time, timeout, is_error_response(response))
+        return response
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """Stream text with a first-chunk timeout fitted to the stage"""
+        stage = kwargs.get("stage") or DEFAULT_STAGE
+        key = f"{stage}/ttft"
+        timeout = kwargs.pop("timeout", None) or self.timeout_for(key, stage)
+        start_time = time.monotonic()
+        first = True
+        async for chunk in super().generate_stream(prompt, system_prompt, temperature, max_tokens,
+                                                   timeout=timeout, **kwargs):
+            if first:
+                first = False
+                self._record(key, time.monotonic() - start_time, timeout, is_error_chunk(chunk))
+            yield chunk
+    
+    def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                            temperature: float = 0.7, max_tokens: int = 1024,
+                            tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls with the stage's stream timeout"""
+        stage = kwargs.get("stage") or DEFAULT_STAGE
+        kwargs.setdefault("timeout", self.timeout_for(f"{stage}/ttft", stage))
+        return super().generate_with_tools(prompt, system_prompt, temperature, max_tokens, tools, **kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get latency percentiles and current timeouts along with the wrapped provider's metrics"""
+        stats = super().stats()
+        latencies = self.tracker.stats()
+        for key, values in latencies.items():
+            values["timeout"] = self.timeout_for(key, key.split("/")[0])
+        stats["latency"] = latencies
+        return stats
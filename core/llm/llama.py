@@ -1,8 +1,11 @@
 import json
+import asyncio
 import logging
 import aiohttp
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Union, Set
 from config.settings import settings
+from core.llm.base import ErrorText
+from core.llm.http import create_client_session
 
 logger = logging.getLogger(__name__)
 
@@ -11,71 +14,307 @@ class LlamaLLM:
     Implementation of the Llama3 LLM using the Ollama API.
     """
     
-    def __init__(self):
-        self.api_url = settings.LLAMA_API_URL
-        self.model_name = settings.LLAMA_MODEL
+    def __init__(self, api_url: Optional[str] = None, model_name: Optional[str] = None):
+        self.api_url = api_url or settings.LLAMA_API_URL
+        self.model_name = model_name or settings.LLAMA_MODEL
+        # Structured multi-turn requests go to /api/chat on the same host
+        self.chat_url = self._chat_url(self.api_url)
+        self.missing_models: Set[str] = set()  # Stage models the server does not have
         self.session = None
         logger.info(f"Initializing LLM with API URL: {self.api_url} and model: {self.model_name}")
     
     async def ensure_session(self):
         """Ensure aiohttp session exists"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            self.session = create_client_session()
         return self.session
     
+    @staticmethod
+    def _chat_url(api_url: str) -> str:
+        """Get the /api/chat URL on the host serving api_url"""
+        if api_url.endswith("/api/generate"):
+            return api_url[:-len("/generate")] + "/chat"
+        return api_url.rstrip("/") + "/api/chat"
+    
+    def resolve_model(self, stage: Optional[str] = None, model: Optional[str] = None) -> str:
+        """
+        Get the model for a request.
+        
+        An explicit model wins, then the model configured for the stage in
+        LLAMA_STAGE_MODELS, then the default model. Models the server turned
+        out not to have fall back to the default model.
+        """
+        resolved = model or settings.LLAMA_STAGE_MODELS.get(stage or "") or self.model_name
+        if resolved in self.missing_models:
+            return self.model_name
+        return resolved
+    
+    def _fall_back(self, model: str, status: int) -> bool:
+        """Check whether a failed request should be retried on the default model"""
+        if status != 404 or model == self.model_name:
+            return False
+        logger.warning(f"Model {model} not found at {self.api_url}, falling back to {self.model_name}")
+        self.missing_models.add(model)
+        return True
+    
+    def _build_request(self, prompt: str, system_prompt: Optional[str], temperature: float,
+                       max_tokens: int, stream: bool,
+                       messages: Optional[List[Dict[str, str]]] = None,
+                       format: Optional[Union[str, Dict[str, Any]]] = None,
+                       model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the Ollama request payload.
+        
+        With messages, the payload is for /api/chat and the prompt is not
+        sent; the system prompt goes first so the prefix is the same on
+        every turn and Ollama can reuse its cached evaluation of it.
+        format constrains the output to JSON ("json") or to a JSON schema.
+        """
+        # Sampling parameters are only honoured inside options
+        request_data = {
+            "model": model or self.model_name,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
+            }
+        }
+        
+        if format:
+            request_data["format"] = format
+        
+        if messages is not None:
+            system_messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+            request_data["messages"] = system_messages + messages
+        else:
+            request_data["prompt"] = prompt
+            
+            # Add system prompt if provided
+            if system_prompt:
+                request_data["system"] = system_prompt
+        
+        # Keep the model loaded between requests
+        if settings.LLAMA_KEEP_ALIVE:
+            request_data["keep_alive"] = settings.LLAMA_KEEP_ALIVE
+        
+        return request_data
+    
+    @staticmethod
+    def _response_text(data: Dict[str, Any]) -> str:
+        """Get the generated text from an /api/generate or /api/chat response"""
+        if "message" in data:
+            return (data.get("message") or {}).get("content", "")
+        return data.get("response", "")
+    
     async def generate(self, prompt: str, system_prompt: Optional[str] = None, 
-                      temperature: float = 0.7, max_tokens: int = 1024) -> str:
-        """Generate text using Llama API"""
+                      temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """
+        Generate text using Llama API.
+        
+        Passing messages (a list of {"role", "content"} dicts) sends a
+        multi-turn request to /api/chat instead, ignoring prompt; format
+        ("json" or a JSON schema) constrains the output; stage (see
+        config.constants) or model picks the model; timeout (seconds)
+        overrides LLM_REQUEST_TIMEOUT. Other extra keyword arguments
+        (scheduling hints such as priority and session_id) are accepted
+        and ignored.
+        """
         try:
             # Validate API URL
             if not self.api_url:
                 raise ValueError("No API URL provided")
             
             # Construct the request payload
-            request_data = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
-            
-            # Add system prompt if provided
-            if system_prompt:
-                request_data["system"] = system_prompt
+            messages = kwargs.get("messages")
+            request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                               stream=False, messages=messages, format=kwargs.get("format"),
+                                               model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
+            url = self.chat_url if messages is not None else self.api_url
                 
-            logger.debug(f"Sending request to {self.api_url} with model {self.model_name}")
+            logger.debug(f"Sending request to {url} with model {request_data['model']}")
             
             # Get a session
             session = await self.ensure_session()
             
             # Set timeout to prevent hanging
-            timeout = aiohttp.ClientTimeout(total=60)
+            timeout = aiohttp.ClientTimeout(total=kwargs.get("timeout") or settings.LLM_REQUEST_TIMEOUT)
             
             # Send the request
-            async with session.post(self.api_url, json=request_data, timeout=timeout) as response:
+            async with session.post(url, json=request_data, timeout=timeout) as response:
                 if response.status == 200:
                     response_data = await response.json()
                     logger.debug("Received response from Llama API")
-                    return response_data.get("response", "")
+                    return self._response_text(response_data)
                 else:
                     error_text = await response.text()
+                    if self._fall_back(request_data["model"], response.status):
+                        return await self.generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
                     logger.error(f"API Error ({response.status}): {error_text}")
-                    return f"Error connecting to Llama API (Status: {response.status}). Please check your server configuration."
+                    return ErrorText(f"Error connecting to Llama API (Status: {response.status}). Please check your server configuration.")
         
-        except aiohttp.ClientConnectError:
+        except aiohttp.ClientConnectorError:
             logger.error(f"Cannot connect to Llama API at {self.api_url}")
-            return "Error: Cannot connect to Llama API. Please check if Ollama is running on your server."
+            return ErrorText("Error: Cannot connect to Llama API. Please check if Ollama is running on your server.")
             
-        except aiohttp.ClientTimeoutError:
+        except asyncio.TimeoutError:
             logger.error("Request to Ollama API timed out")
-            return "Error: Ollama API request timed out. The server might be overloaded."
+            return ErrorText("Error: Ollama API request timed out. The server might be overloaded.")
             
         except Exception as e:
             logger.error(f"Error generating text: {str(e)}")
-            return f"Error: An unexpected error occurred: {str(e)}"
+            return ErrorText(f"Error: An unexpected error occurred: {str(e)}")
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """
+        Generate text using Llama API, yielding chunks as they arrive.
+        
+        Ollama streams newline-delimited JSON objects, each carrying a
+        "response" fragment (a "message" one for /api/chat), until one
+        arrives with "done": true. Errors are yielded as a single ErrorText
+        chunk, matching generate().
+        """
+        messages = kwargs.get("messages")
+        request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                           stream=True, messages=messages, format=kwargs.get("format"),
+                                           model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
+        url = self.chat_url if messages is not None else self.api_url
+        
+        async for event in self._stream_events(url, request_data, kwargs.get("timeout")):
+            if event["type"] == "content":
+                yield event["content"]
+    
+    async def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1024,
+                                  tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an answer through /api/chat, letting the model call tools instead.
+        
+        Args:
+            prompt: User prompt, used when no messages are given
+            system_prompt: Optional system prompt
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            tools: Function definitions in the OpenAI "tools" format
+            **kwargs: messages, format, stage, model, timeout; other keyword arguments are ignored
+        
+        Yields:
+            {"type": "content", "content": str} events for answer text and
+            {"type": "tool_call", "name": str, "arguments": dict} events
+        """
+        messages = kwargs.get("messages") or [{"role": "user", "content": prompt}]
+        request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                           stream=True, messages=messages, format=kwargs.get("format"),
+                                           model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
+        if tools:
+            request_data["tools"] = tools
+        
+        async for event in self._stream_events(self.chat_url, request_data, kwargs.get("timeout")):
+            yield event
+    
+    async def _stream_events(self, url: str, request_data: Dict[str, Any],
+                             timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Send a streaming request and yield content and tool call events"""
+        try:
+            # Validate API URL
+            if not self.api_url:
+                raise ValueError("No API URL provided")
+            
+            logger.debug(f"Streaming request to {url} with model {request_data['model']}")
+            
+            session = await self.ensure_session()
+            
+            # A stream can legitimately run longer than any fixed total, so
+            # only bound the silence between chunks
+            client_timeout = aiohttp.ClientTimeout(total=None, sock_read=timeout or settings.LLM_REQUEST_TIMEOUT)
+            
+            async with session.post(url, json=request_data, timeout=client_timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    if self._fall_back(request_data["model"], response.status):
+                        retry_data = {**request_data, "model": self.model_name}
+                        async for event in self._stream_events(url, retry_data, timeout):
+                            yield event
+                        return
+                    logger.error(f"API Error ({response.status}): {error_text}")
+                    yield {"type": "content", "content": ErrorText(f"Error connecting to Llama API (Status: {response.status}). Please check your server configuration.")}
+                    return
+                
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        logger.error(f"Stream error from Llama API: {chunk['error']}")
+                        yield {"type": "content", "content": ErrorText(f"Error: {chunk['error']}")}
+                        return
+                    
+                    text = self._response_text(chunk)
+                    if text:
+                        yield {"type": "content", "content": text}
+                    
+                    for tool_call in (chunk.get("message") or {}).get("tool_calls") or []:
+                        function = tool_call.get("function", {})
+                        yield {"type": "tool_call", "name": function.get("name", ""),
+                               "arguments": function.get("arguments") or {}}
+                    
+                    if chunk.get("done"):
+                        break
+        
+        except aiohttp.ClientConnectorError:
+            logger.error(f"Cannot connect to Llama API at {self.api_url}")
+            yield {"type": "content", "content": ErrorText("Error: Cannot connect to Llama API. Please check if Ollama is running on your server.")}
+        
+        except asyncio.TimeoutError:
+            logger.error("Streaming request to Ollama API timed out")
+            yield {"type": "content", "content": ErrorText("Error: Ollama API request timed out. The server might be overloaded.")}
+        
+        except Exception as e:
+            logger.error(f"Error streaming text: {str(e)}")
+            yield {"type": "content", "content": ErrorText(f"Error: An unexpected error occurred: {str(e)}")}
+    
+    async def warm_up(self, model_name: Optional[str] = None, keep_alive: Optional[str] = None) -> bool:
+        """
+        Load a model into memory without generating anything.
+        
+        Ollama loads the model when it receives a request with no prompt,
+        and keeps it loaded for keep_alive afterwards.
+        
+        Args:
+            model_name: Model to load (defaults to the configured model)
+            keep_alive: How long Ollama keeps the model loaded (defaults to LLAMA_KEEP_ALIVE)
+        
+        Returns:
+            True if the model was loaded
+        """
+        request_data = {"model": model_name or self.model_name}
+        keep_alive = keep_alive or settings.LLAMA_KEEP_ALIVE
+        if keep_alive:
+            request_data["keep_alive"] = keep_alive
+        
+        try:
+            session = await self.ensure_session()
+            timeout = aiohttp.ClientTimeout(total=settings.LLAMA_WARMUP_TIMEOUT)
+            
+            async with session.post(self.api_url, json=request_data, timeout=timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Error warming up {request_data['model']} ({response.status}): {error_text}")
+                    return False
+                await response.read()
+                return True
+        
+        except asyncio.TimeoutError:
+            logger.error(f"Warm-up of {request_data['model']} at {self.api_url} timed out")
+            return False
+        
+        except Exception as e:
+            logger.error(f"Error warming up {request_data['model']} at {self.api_url}: {str(e)}")
+            return False
     
     async def close(self):
         """Close the aiohttp session"""
         if self.session and not self.session.closed:
-            await self.session.close()
\ No newline at end of file
+            await self.session.close()
@@ -1,8 +1,11 @@
 import json
+import asyncio
 import logging
 import aiohttp
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Union, Set
 from config.settings import settings
+from core.llm.base import ErrorText
+from core.llm.http import create_client_session
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +17,8 @@ class OpenAILLM:
     def __init__(self):
         self.api_key = settings.OPENAI_API_KEY
         self.api_url = "https://api.openai.com/v1/chat/completions"
-        self.model = "gpt-3.5-turbo"  # Default model
+        self.model = settings.OPENAI_MODEL  # Default model
+        self.missing_models: Set[str] = set()  # Stage models the account cannot use
         self.session = None
         
         if not self.api_key:
@@ -25,40 +29,93 @@ class OpenAILLM:
     async def ensure_session(self):
         """Ensure aiohttp session exists"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            self.session = create_client_session()
         return self.session
     
+    def resolve_model(self, stage: Optional[str] = None, model: Optional[str] = None) -> str:
+        """
+        Get the model for a request.
+        
+        An explicit model wins, then the model configured for the stage in
+        OPENAI_STAGE_MODELS, then the default model. Models the API rejected
+        as not found fall back to the default model.
+        """
+        resolved = model or settings.OPENAI_STAGE_MODELS.get(stage or "") or self.model
+        if resolved in self.missing_models:
+            return self.model
+        return resolved
+    
+    def _fall_back(self, model: str, status: int) -> bool:
+        """Check whether a failed request should be retried on the default model"""
+        if status != 404 or model == self.model:
+            return False
+        logger.warning(f"OpenAI model {model} not found, falling back to {self.model}")
+        self.missing_models.add(model)
+        return True
+    
+    def _build_request(self, prompt: str, system_prompt: Optional[str], temperature: float,
+                       max_tokens: int, stream: bool,
+                       history: Optional[List[Dict[str, str]]] = None,
+                       format: Optional[Union[str, Dict[str, Any]]] = None,
+                       model: Optional[str] = None) -> Dict[str, Any]:
+        """Build the chat completions request payload"""
+        # Construct the messages array
+        messages = []
+        
+        # Add system prompt if provided
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        # Add the conversation if given, otherwise the user prompt
+        if history is not None:
+            messages.extend(history)
+        else:
+            messages.append({"role": "user", "content": prompt})
+        
+        request_data = {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            request_data["stream"] = True
+        
+        # JSON mode; a schema also maps to JSON mode, since schema-constrained
+        # output is not available on every chat model
+        if format:
+            request_data["response_format"] = {"type": "json_object"}
+        
+        return request_data
+    
     async def generate(self, prompt: str, system_prompt: Optional[str] = None, 
-                      temperature: float = 0.7, max_tokens: int = 1024) -> str:
-        """Generate text using OpenAI API"""
+                      temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """
+        Generate text using OpenAI API.
+        
+        Passing messages (a list of {"role", "content"} dicts) sends the whole
+        conversation instead of prompt; format ("json" or a JSON schema)
+        turns on JSON mode; stage (see config.constants) or model picks the
+        model; timeout (seconds) overrides LLM_REQUEST_TIMEOUT. Other extra
+        keyword arguments (scheduling hints such as priority and
+        session_id) are accepted and ignored.
+        """
         try:
             # Validate API key
             if not self.api_key:
                 raise ValueError("No OpenAI API key provided")
             
-            # Construct the messages array
-            messages = []
-            
-            # Add system prompt if provided
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            # Add user prompt
-            messages.append({"role": "user", "content": prompt})
-            
             # Construct the request payload
-            request_data = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
+            request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                               stream=False, history=kwargs.get("messages"),
+                                               format=kwargs.get("format"),
+                                               model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
             
             # Get a session
             session = await self.ensure_session()
             
             # Set timeout to prevent hanging
-            timeout = aiohttp.ClientTimeout(total=60)
+            timeout = aiohttp.ClientTimeout(total=kwargs.get("timeout") or settings.LLM_REQUEST_TIMEOUT)
             
             # Send the request
             async with session.post(
@@ -73,22 +130,151 @@ class OpenAILLM:
                     return response_data["choices"][0]["message"]["content"]
                 else:
                     error_text = await response.text()
+                    if self._fall_back(request_data["model"], response.status):
+                        return await self.generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
                     logger.error(f"API Error ({response.status}): {error_text}")
-                    return f"Error connecting to OpenAI API (Status: {response.status}). Please check your API key and account status."
+                    return ErrorText(f"Error connecting to OpenAI API (Status: {response.status}). Please check your API key and account status.")
         
-        except aiohttp.ClientConnectError:
+        except aiohttp.ClientConnectorError:
             logger.error("Cannot connect to OpenAI API")
-            return "Error: Cannot connect to OpenAI API. Please check your internet connection."
+            return ErrorText("Error: Cannot connect to OpenAI API. Please check your internet connection.")
             
-        except aiohttp.ClientTimeoutError:
+        except asyncio.TimeoutError:
             logger.error("Request to OpenAI API timed out")
-            return "Error: OpenAI API request timed out. The service might be experiencing high demand."
+            return ErrorText("Error: OpenAI API request timed out. The service might be experiencing high demand.")
             
         except Exception as e:
             logger.error(f"Error generating text: {str(e)}")
-            return f"Error: An unexpected error occurred: {str(e)}"
+            return ErrorText(f"Error: An unexpected error occurred: {str(e)}")
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """
+        Generate text using OpenAI API, yielding chunks as they arrive.
+        
+        The API streams server-sent events ("data: {...}" lines) whose
+        choices[0].delta.content carries the next fragment, terminated by
+        "data: [DONE]". Errors are yielded as a single ErrorText chunk.
+        """
+        request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                           stream=True, history=kwargs.get("messages"),
+                                           format=kwargs.get("format"),
+                                           model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
+        
+        async for event in self._stream_events(request_data, kwargs.get("timeout")):
+            if event["type"] == "content":
+                yield event["content"]
+    
+    async def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1024,
+                                  tools: Optional[List[Dict[str, Any]]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an answer, letting the model call tools instead.
+        
+        Args:
+            prompt: User prompt, used when no messages are given
+            system_prompt: Optional system prompt
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            tools: Function definitions in the "tools" format
+            **kwargs: messages, format, stage, model, timeout; other keyword arguments are ignored
+        
+        Yields:
+            {"type": "content", "content": str} events for answer text and
+            {"type": "tool_call", "name": str, "arguments": dict} events
+        """
+        request_data = self._build_request(prompt, system_prompt, temperature, max_tokens,
+                                           stream=True, history=kwargs.get("messages"),
+                                           format=kwargs.get("format"),
+                                           model=self.resolve_model(kwargs.get("stage"), kwargs.get("model")))
+        if tools:
+            request_data["tools"] = tools
+        
+        async for event in self._stream_events(request_data, kwargs.get("timeout")):
+            yield event
+    
+    async def _stream_events(self, request_data: Dict[str, Any],
+                             timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a streaming request and yield content and tool call events.
+        
+        Tool call names and arguments arrive in fragments keyed by index, so
+        the calls are assembled and yielded once the stream ends.
+        """
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        try:
+            # Validate API key
+            if not self.api_key:
+                raise ValueError("No OpenAI API key provided")
+            
+            session = await self.ensure_session()
+            
+            # Only bound the silence between chunks, not the whole stream
+            client_timeout = aiohttp.ClientTimeout(total=None, sock_read=timeout or settings.LLM_REQUEST_TIMEOUT)
+            
+            async with session.post(
+                self.api_url,
+                json=request_data,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=client_timeout
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    if self._fall_back(request_data["model"], response.status):
+                        async for event in self._stream_events({**request_data, "model": self.model}, timeout):
+                            yield event
+                        return
+                    logger.error(f"API Error ({response.status}): {error_text}")
+                    yield {"type": "content", "content": ErrorText(f"Error connecting to OpenAI API (Status: {response.status}). Please check your API key and account status.")}
+                    return
+                
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        # Blank separators, comments and keep-alives
+                        continue
+                    
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    event = json.loads(data)
+                    choices = event.get("choices") or []
+                    if not choices:
+                        continue
+                    
+                    delta = choices[0].get("delta", {})
+                    text = delta.get("content")
+                    if text:
+                        yield {"type": "content", "content": text}
+                    
+                    for fragment in delta.get("tool_calls") or []:
+                        call = tool_calls.setdefault(fragment.get("index", 0), {"name": "", "arguments": ""})
+                        function = fragment.get("function", {})
+                        call["name"] += function.get("name") or ""
+                        call["arguments"] += function.get("arguments") or ""
+            
+            for _, call in sorted(tool_calls.items()):
+                try:
+                    arguments = json.loads(call["arguments"]) if call["arguments"] else {}
+                except json.JSONDecodeError:
+                    logger.warning(f"Unparseable arguments for tool call {call['name']}: {call['arguments']}")
+                    arguments = {}
+                yield {"type": "tool_call", "name": call["name"], "arguments": arguments}
+        
+        except aiohttp.ClientConnectorError:
+            logger.error("Cannot connect to OpenAI API")
+            yield {"type": "content", "content": ErrorText("Error: Cannot connect to OpenAI API. Please check your internet connection.")}
+        
+        except asyncio.TimeoutError:
+            logger.error("Streaming request to OpenAI API timed out")
+            yield {"type": "content", "content": ErrorText("Error: OpenAI API request timed out. The service might be experiencing high demand.")}
+        
+        except Exception as e:
+            logger.error(f"Error streaming text: {str(e)}")
+            yield {"type": "content", "content": ErrorText(f"Error: An unexpected error occurred: {str(e)}")}
     
     async def close(self):
         """Close the aiohttp session"""
         if self.session and not self.session.closed:
-            await self.session.close()
\ No newline at end of file
+            await self.session.close()
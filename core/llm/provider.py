@@ -1,19 +1,186 @@
 import logging
-from typing import Union
+from typing import Dict, Any, List, Optional, Tuple, Union
 from config.settings import settings
 from core.llm.llama import LlamaLLM
 from core.llm.openai import OpenAILLM
+from core.llm.base import LLMWrapper
+from core.llm.balancer import LlamaBackendPool
+from core.llm.breaker import CircuitBreakerLLM
+from core.llm.latency import AdaptiveTimeoutLLM
+from core.llm.cache import CachedLLM
+from core.llm.semantic_cache import SemanticCachedLLM
+from core.llm.singleflight import SingleFlightLLM
+from core.llm.scheduler import ScheduledLLM
+from core.memory.embeddings import get_embedder
 
 logger = logging.getLogger(__name__)
 
-def get_llm_provider() -> Union[LlamaLLM, OpenAILLM]:
+# One provider instance per backend for the whole process
+_providers: Dict[str, Union[LlamaLLM, OpenAILLM, LlamaBackendPool, LLMWrapper]] = {}
+
+def _build_stack(primary: Tuple[str, LLMWrapper],
+                 fallback: Optional[Tuple[str, LLMWrapper]] = None) -> Union[LlamaLLM, OpenAILLM, LlamaBackendPool, LLMWrapper]:
+    """
+    Stack the enabled layers in front of a scheduled provider, innermost first.
+    
+    The caches sit outermost so hits skip everything else, the semantic
+    cache above the exact one so exact hits do not wait for an embedding;
+    single-flight sits below them so concurrent misses share one upstream
+    call. The
+    circuit breaker sits right above the schedulers so that, while a
+    provider is down, requests fail (or fail over) without queueing; the
+    time a call then spends queued is left out of the latency it judges.
+    
+    Args:
+        primary: (name, provider) to send requests to
+        fallback: Optional (name, provider) to fail over to
+    """
+    name, provider = primary
+    
+    if settings.LLM_CIRCUIT_BREAKER_ENABLED:
+        provider = CircuitBreakerLLM(
+            provider,
+            fallback=fallback[1] if fallback else None,
+            primary_name=name,
+            fallback_name=fallback[0] if fallback else "fallback",
+            failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+            slow_call_rate=settings.LLM_BREAKER_SLOW_CALL_RATE,
+            slow_call_seconds=settings.LLM_BREAKER_SLOW_CALL_SECONDS,
+            stage_slow_seconds={stage: timeout * settings.LLM_BREAKER_SLOW_CALL_FRACTION
+                                for stage, timeout in settings.LLM_STAGE_TIMEOUTS.items()},
+            window=settings.LLM_BREAKER_WINDOW,
+            min_calls=settings.LLM_BREAKER_MIN_CALLS,
+            open_seconds=settings.LLM_BREAKER_OPEN_SECONDS
+        )
+    
+    if settings.LLM_SINGLE_FLIGHT_ENABLED:
+        provider = SingleFlightLLM(provider)
+    
+    if settings.LLM_CACHE_ENABLED:
+        provider = CachedLLM(
+            provider,
+            memory_entries=settings.LLM_CACHE_MEMORY_ENTRIES,
+            memory_bytes=settings.LLM_CACHE_MEMORY_BYTES,
+            disk_path=settings.LLM_CACHE_DISK_PATH or None,
+            disk_bytes=settings.LLM_CACHE_DISK_BYTES,
+            ttl=settings.LLM_CACHE_TTL or None,
+            max_temperature=settings.LLM_CACHE_MAX_TEMPERATURE
+        )
+    
+    if settings.LLM_SEMANTIC_CACHE_ENABLED:
+        provider = SemanticCachedLLM(
+            provider,
+            get_embedder(),
+            threshold=settings.LLM_SEMANTIC_CACHE_THRESHOLD,
+            stages=tuple(settings.LLM_SEMANTIC_CACHE_STAGES),
+            max_entries=settings.LLM_SEMANTIC_CACHE_ENTRIES,
+            ttl=settings.LLM_SEMANTIC_CACHE_TTL or None,
+            max_temperature=settings.LLM_CACHE_MAX_TEMPERATURE
+        )
+    
+    return provider
+
+def _timeout_options() -> Optional[Dict[str, Any]]:
+    """Get the AdaptiveTimeoutLLM options, or None when adaptive timeouts are off"""
+    if not settings.LLM_ADAPTIVE_TIMEOUTS:
+        return None
+    return {
+        "default_timeout": settings.LLM_REQUEST_TIMEOUT,
+        "stage_timeouts": settings.LLM_STAGE_TIMEOUTS,
+        "percentile": settings.LLM_TIMEOUT_PERCENTILE,
+        "multiplier": settings.LLM_TIMEOUT_MULTIPLIER,
+        "min_timeout": settings.LLM_TIMEOUT_MIN,
+        "max_timeout": settings.LLM_TIMEOUT_MAX,
+        "window": settings.LLM_LATENCY_WINDOW,
+        "min_samples": settings.LLM_LATENCY_MIN_SAMPLES
+    }
+
+def _with_timeouts(provider):
+    """
+    Give a single provider adaptive timeouts.
+    
+    They sit below the scheduler so that time spent queueing for a slot
+    does not count towards a request's timeout.
+    """
+    options = _timeout_options()
+    return AdaptiveTimeoutLLM(provider, **options) if options is not None else provider
+
+def _build_llama(api_urls: List[str]) -> ScheduledLLM:
+    """Create a scheduled Llama provider, load balanced when there are several hosts"""
+    if len(api_urls) == 1:
+        provider = _with_timeouts(LlamaLLM(api_url=api_urls[0]))
+    else:
+        # The pool gives each host its own timeouts
+        provider = LlamaBackendPool(
+            api_urls,
+            strategy=settings.LLAMA_BALANCER_STRATEGY,
+            health_interval=settings.LLAMA_HEALTH_INTERVAL,
+            health_timeout=settings.LLAMA_HEALTH_TIMEOUT,
+            max_failures=settings.LLAMA_MAX_FAILURES,
+            timeout_options=_timeout_options(),
+            hedge_percentile=settings.LLAMA_HEDGE_PERCENTILE if settings.LLAMA_HEDGE_ENABLED else None,
+            latency_window=settings.LLM_LATENCY_WINDOW,
+            latency_min_samples=settings.LLM_LATENCY_MIN_SAMPLES,
+            max_concurrency=settings.LLAMA_MAX_CONCURRENCY
+        )
+    
+    # The scheduler bounds the total; the pool keeps each host within its share
+    return ScheduledLLM(provider, settings.LLAMA_MAX_CONCURRENCY * len(api_urls))
+
+def _build_openai() -> ScheduledLLM:
+    """Create a scheduled OpenAI provider"""
+    return ScheduledLLM(_with_timeouts(OpenAILLM()), settings.OPENAI_MAX_CONCURRENCY)
+
+def get_llm_provider(backends: Optional[List[str]] = None) -> Union[LlamaLLM, OpenAILLM, LlamaBackendPool, LLMWrapper]:
     """
     Factory function to get the appropriate LLM provider based on configuration.
-    Returns an instance of either LlamaLLM or OpenAILLM.
+    Returns the shared instance of either LlamaLLM or OpenAILLM, with the
+    other one as failover target when LLM_FAILOVER_ENABLED is set.
+    
+    Args:
+        backends: Optional list of Ollama API URLs to load balance over,
+                  overriding LLAMA_API_URLS / LLAMA_API_URL
     """
-    if settings.USE_OPENAI and settings.OPENAI_API_KEY:
-        logger.info("Using OpenAI as LLM provider")
-        return OpenAILLM()
+    if backends:
+        api_urls = list(backends)
+        backend = "llama:" + ",".join(api_urls)
+    elif settings.USE_OPENAI and settings.OPENAI_API_KEY:
+        api_urls = settings.LLAMA_API_URLS or [settings.LLAMA_API_URL]
+        backend = "openai"
     else:
-        logger.info("Using Llama as LLM provider")
-        return LlamaLLM()
\ No newline at end of file
+        api_urls = settings.LLAMA_API_URLS or [settings.LLAMA_API_URL]
+        backend = "llama"
+    
+    if backend not in _providers:
+        if backend == "openai":
+            logger.info("Using OpenAI as LLM provider")
+            primary = ("openai", _build_openai())
+            fallback = ("llama", _build_llama(api_urls)) if settings.LLM_FAILOVER_ENABLED else None
+        else:
+            logger.info(f"Using Llama as LLM provider ({len(api_urls)} hosts)")
+            primary = ("llama", _build_llama(api_urls))
+            fallback = None
+            if settings.LLM_FAILOVER_ENABLED and settings.OPENAI_API_KEY:
+                fallback = ("openai", _build_openai())
+        
+        if fallback:
+            logger.info(f"Failing over to {fallback[0]} when {primary[0]} is unavailable")
+        _providers[backend] = _build_stack(primary, fallback)
+    
+    return _providers[backend]
+
+async def init_llm_providers():
+    """Create the shared provider and open its connection pool"""
+    provider = get_llm_provider()
+    await provider.ensure_session()
+    return provider
+
+async def close_llm_providers():
+    """Close every shared provider and its connection pool"""
+    for backend, provider in list(_providers.items()):
+        try:
+            await provider.close()
+            logger.info(f"Closed {backend} LLM provider")
+        except Exception as e:
+            logger.error(f"Error closing {backend} LLM provider: {str(e)}")
+    _providers.clear()
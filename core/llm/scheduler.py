@@ -0,0 +1,184 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, AsyncIterator, List
+
+from config.constants import PRIORITY_INTERACTIVE, PRIORITY_NAMES
+from core.llm.base import LLMWrapper
+
+logger = logging.getLogger(__name__)
+
+# How long the current task last waited for a slot, so layers above the
+# scheduler can leave queueing out of the latency they measure
+_slot_wait: ContextVar[float] = ContextVar("llm_slot_wait", default=0.0)
+
+def take_slot_wait() -> float:
+    """Get how long the current task last waited for a slot, and reset it"""
+    wait = _slot_wait.get()
+    _slot_wait.set(0.0)
+    return wait
+
+class LLMScheduler:
+    """
+    Bounded-concurrency request scheduler with priority classes.
+    
+    Waiting requests are served strictly by priority class. Within a class,
+    start-time fair queuing spreads slots across session IDs in proportion to
+    their weights, so one busy session cannot starve the others.
+    """
+    
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max(1, max_concurrency)
+        self.active = 0
+        self.queue: List[tuple] = []  # Heap of (priority, start_tag, seq, future)
+        self.waiting = 0
+        self.seq = itertools.count()
+        self.virtual_time = 0.0
+        self.session_tags: Dict[str, float] = {}
+        self.weights: Dict[str, float] = {}
+        self.max_waiting = 0
+        self.metrics: Dict[int, Dict[str, float]] = {}
+    
+    def set_weight(self, session_id: str, weight: float):
+        """Set the share of slots a session gets relative to others (default 1.0)"""
+        self.weights[session_id] = max(weight, 0.01)
+    
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, session_id: Optional[str] = None):
+        """Hold one concurrency slot for the duration of the block"""
+        await self.acquire(priority, session_id)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, session_id: Optional[str] = None):
+        """Wait until a concurrency slot is granted"""
+        enqueued_at = time.monotonic()
+        
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            self._record(priority, 0.0)
+            _slot_wait.set(0.0)
+            return
+        
+        session_key = session_id or ""
+        start_tag = max(self.virtual_time, self.session_tags.get(session_key, 0.0))
+        self.session_tags[session_key] = start_tag + 1.0 / self.weights.get(session_key, 1.0)
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, start_tag, next(self.seq), future))
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before we were cancelled; hand it on
+                self.release()
+            else:
+                future.cancel()
+                self.waiting -= 1
+            raise
+        
+        wait = time.monotonic() - enqueued_at
+        self._record(priority, wait)
+        _slot_wait.set(wait)
+    
+    def release(self):
+        """Give a slot back and start the next waiting request"""
+        self.active -= 1
+        self._dispatch()
+    
+    def _dispatch(self):
+        """Grant free slots to the highest-priority, most underserved waiters"""
+        while self.queue and self.active < self.max_concurrency:
+            priority, start_tag, _, future = heapq.heappop(self.queue)
+            if future.done():
+                # Cancelled while waiting
+                continue
+            
+            self.waiting -= 1
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, start_tag)
+            future.set_result(None)
+        
+        if len(self.session_tags) > 1000:
+            # Sessions behind the virtual clock are indistinguishable from new ones
+            self.session_tags = {s: t for s, t in self.session_tags.items() if t > self.virtual_time}
+    
+    def _record(self, priority: int, wait: float):
+        """Record how long a request waited for its slot"""
+        metrics = self.metrics.setdefault(priority, {"requests": 0, "wait_total": 0.0, "wait_max": 0.0})
+        metrics["requests"] += 1
+        metrics["wait_total"] += wait
+        metrics["wait_max"] = max(metrics["wait_max"], wait)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth and wait time metrics"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "priorities": {
+                PRIORITY_NAMES.get(priority, str(priority)): {
+                    "requests": metrics["requests"],
+                    "wait_avg": metrics["wait_total"] / metrics["requests"],
+                    "wait_max": metrics["wait_max"]
+                }
+                for priority, metrics in sorted(self.metrics.items())
+            }
+        }
+
+class ScheduledLLM(LLMWrapper):
+    """
+    Runs every request to the wrapped provider through an LLMScheduler.
+    
+    Callers pass priority (see config.constants) and session_id keyword
+    arguments; both default to an interactive request without a session.
+    """
+    
+    def __init__(self, inner, max_concurrency: int = 4):
+        super().__init__(inner)
+        self.scheduler = LLMScheduler(max_concurrency)
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024,
+                       priority: int = PRIORITY_INTERACTIVE, session_id: Optional[str] = None, **kwargs) -> str:
+        """Generate text once a slot is available"""
+        async with self.scheduler.slot(priority, session_id):
+            return await super().generate(prompt, system_prompt, temperature, max_tokens,
+                                          priority=priority, session_id=session_id, **kwargs)
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024,
+                              priority: int = PRIORITY_INTERACTIVE, session_id: Optional[str] = None,
+                              **kwargs) -> AsyncIterator[str]:
+        """Stream text once a slot is available, holding it until the stream ends"""
+        async with self.scheduler.slot(priority, session_id):
+            async for chunk in super().generate_stream(prompt, system_prompt, temperature, max_tokens,
+                                                       priority=priority, session_id=session_id, **kwargs):
+                yield chunk
+    
+    async def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                                  temperature: float = 0.7, max_tokens: int = 1024,
+                                  tools: Optional[List[Dict[str, Any]]] = None,
+                                  priority: int = PRIORITY_INTERACTIVE, session_id: Optional[str] = None,
+                                  **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls once a slot is available"""
+        async with self.scheduler.slot(priority, session_id):
+            async for event in super().generate_with_tools(prompt, system_prompt, temperature, max_tokens, tools,
+                                                           priority=priority, session_id=session_id, **kwargs):
+                yield event
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get scheduler metrics along with the wrapped provider's metrics"""
+        stats = super().stats()
+        stats["scheduler"] = self.scheduler.stats()
+        return stats
@@ -0,0 +1,246 @@
+import json
+import time
+import logging
+import numpy as np
+from typing import Dict, Any, Optional, AsyncIterator, List, Tuple
+
+from core.llm.base import LLMWrapper, is_error_chunk, is_error_response, model_of, request_key
+from core.llm.structured import extract_json
+
+logger = logging.getLogger(__name__)
+
+class SemanticIndex:
+    """
+    Flat in-memory index of unit-length embeddings with LRU eviction.
+    
+    Rows live in one preallocated float32 matrix, so a lookup is a single
+    matrix-vector product over the used rows. Each row belongs to a scope
+    and only matches queries from the same scope.
+    """
+    
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.matrix: Optional[np.ndarray] = None  # Allocated once the dimension is known
+        self.scopes = np.full(max_entries, -1, dtype=np.int64)
+        self.last_used = np.zeros(max_entries, dtype=np.int64)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.values: List[Optional[Tuple[str, str]]] = [None] * max_entries  # (text, response)
+        self.scope_ids: Dict[str, int] = {}
+        self.count = 0
+        self.clock = 0
+        self.evictions = 0
+    
+    def _scope_id(self, scope: str) -> int:
+        """Get the numeric id of a scope"""
+        if scope not in self.scope_ids:
+            self.scope_ids[scope] = len(self.scope_ids)
+        return self.scope_ids[scope]
+    
+    def _tick(self) -> int:
+        """Advance the LRU clock"""
+        self.clock += 1
+        return self.clock
+    
+    def search(self, scope: str, vector: np.ndarray) -> Optional[Tuple[float, int]]:
+        """
+        Find the most similar live entry in a scope.
+        
+        Returns:
+            (cosine similarity, row), or None if the scope has no live entries
+        """
+        scope_id = self.scope_ids.get(scope)
+        if scope_id is None or self.matrix is None or vector.shape[0] != self.matrix.shape[1]:
+            return None
+        
+        used = slice(0, self.count)
+        scores = self.matrix[used] @ vector
+        expires_at = self.expires_at[used]
+        live = (self.scopes[used] == scope_id) & ((expires_at == 0) | (expires_at > time.time()))
+        if not live.any():
+            return None
+        
+        scores = np.where(live, scores, -np.inf)
+        row = int(np.argmax(scores))
+        return float(scores[row]), row
+    
+    def get(self, row: int) -> Tuple[str, str]:
+        """Get the (text, response) of a row and mark it as recently used"""
+        self.last_used[row] = self._tick()
+        return self.values[row]
+    
+    def add(self, scope: str, vector: np.ndarray, text: str, response: str, ttl: Optional[float] = None):
+        """Store an entry, replacing the least recently used one when full"""
+        if self.matrix is None:
+            self.matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self.matrix.shape[1]:
+            logger.warning(f"Ignoring {vector.shape[0]}-dimensional embedding in a "
+                           f"{self.matrix.shape[1]}-dimensional semantic cache")
+            return
+        
+        if self.count < self.max_entries:
+            row = self.count
+            self.count += 1
+        else:
+            row = int(np.argmin(self.last_used))
+            self.evictions += 1
+        
+        self.matrix[row] = vector
+        self.scopes[row] = self._scope_id(scope)
+        self.expires_at[row] = time.time() + ttl if ttl else 0
+        self.last_used[row] = self._tick()
+        self.values[row] = (text, response)
+    
+    def __len__(self) -> int:
+        return self.count
+
+class SemanticCachedLLM(LLMWrapper):
+    """
+    Response cache that also answers requests worded differently from a
+    cached one, as long as their embeddings are close enough.
+    
+    Only calls for the given stages are considered, since reusing an answer
+    for a merely similar question is only safe where the output depends on
+    the gist of the input (tool routing, for instance), not its details.
+    Entries are scoped by model, system prompt and every other request
+    option, so only the wording of the prompt may differ. Callers can pass
+    semantic_text to embed just the part of the prompt that varies, such
+    as the user's message inside a fixed template, and semantic_fields to
+    keep only the fields of a JSON answer that hold for similar prompts
+    (a tool choice, but not the tool input taken from the message).
+    """
+    
+    def __init__(self, inner, embedder, threshold: float = 0.92, stages: Tuple[str, ...] = ("routing",),
+                 max_entries: int = 1000, ttl: Optional[float] = 3600, max_temperature: float = 0.3):
+        super().__init__(inner)
+        self.embedder = embedder
+        self.threshold = threshold
+        self.stages = set(stages)
+        self.index = SemanticIndex(max_entries)
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "embedding_errors": 0}
+    
+    def _scope(self, system_prompt: Optional[str], temperature: float, max_tokens: int,
+               kwargs: Dict[str, Any]) -> Optional[str]:
+        """Get the scope a request is cached under, or None if it should not be cached"""
+        if (kwargs.get("stage") not in self.stages or temperature > self.max_temperature
+                or kwargs.get("messages") or kwargs.get("tools")):
+            self.counters["bypassed"] += 1
+            return None
+        return request_key(model_of(self.inner), "", system_prompt, temperature, max_tokens, **kwargs)
+    
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed a text as a unit vector"""
+        vector = await self.embedder.embed(text)
+        if vector is None:
+            self.counters["embedding_errors"] += 1
+            return None
+        
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+    
+    async def _lookup(self, scope: str, text: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Look up the closest cached request in a scope.
+        
+        Returns:
+            (cached response or None, embedding of text for storing the answer)
+        """
+        vector = await self._embed(text)
+        if vector is None:
+            return None, None
+        
+        match = self.index.search(scope, vector)
+        if match is not None and match[0] >= self.threshold:
+            cached_text, response = self.index.get(match[1])
+            self.counters["hits"] += 1
+            logger.debug(f"Semantic cache hit ({match[0]:.3f}): '{text[:60]}' ~ '{cached_text[:60]}'")
+            return response, vector
+        
+        self.counters["misses"] += 1
+        return None, vector
+    
+    def _store(self, scope: str, vector: np.ndarray, text: str, response: str,
+               fields: Optional[Tuple[str, ...]] = None):
+        """Store a successful response, reduced to the given JSON fields if any"""
+        if is_error_response(response):
+            return
+        if fields:
+            parsed = extract_json(response)
+            if parsed is None:
+                return
+            response = json.dumps({field: parsed[field] for field in fields if field in parsed})
+        self.index.add(scope, vector, text, response, self.ttl)
+        self.counters["stores"] += 1
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024,
+                       semantic_text: Optional[str] = None, semantic_fields: Optional[Tuple[str, ...]] = None,
+                       **kwargs) -> str:
+        """Generate text, answering from a similar cached request when possible"""
+        scope = self._scope(system_prompt, temperature, max_tokens, kwargs)
+        if scope is None:
+            return await super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        
+        text = semantic_text or prompt
+        cached, vector = await self._lookup(scope, text)
+        if cached is not None:
+            return cached
+        
+        response = await super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+        if vector is not None:
+            self._store(scope, vector, text, response, semantic_fields)
+        return response
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024,
+                              semantic_text: Optional[str] = None, semantic_fields: Optional[Tuple[str, ...]] = None,
+                              **kwargs) -> AsyncIterator[str]:
+        """Stream text, replaying a similar cached response as a single chunk"""
+        scope = self._scope(system_prompt, temperature, max_tokens, kwargs)
+        vector = None
+        text = semantic_text or prompt
+        if scope is not None:
+            cached, vector = await self._lookup(scope, text)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        failed = False
+        complete = False
+        try:
+            async for chunk in super().generate_stream(prompt, system_prompt, temperature, max_tokens, **kwargs):
+                chunks.append(chunk)
+                failed = failed or is_error_chunk(chunk)
+                yield chunk
+            complete = True
+        finally:
+            # Structured output is closed as soon as the object is complete
+            # (see generate_json), which still makes for a whole answer
+            response = "".join(chunks)
+            if vector is not None and not failed and (complete or (kwargs.get("format") and extract_json(response) is not None)):
+                self._store(scope, vector, text, response, semantic_fields)
+    
+    def generate_with_tools(self, prompt: str, system_prompt: Optional[str] = None,
+                            temperature: float = 0.7, max_tokens: int = 1024,
+                            tools: Optional[List[Dict[str, Any]]] = None,
+                            semantic_text: Optional[str] = None, semantic_fields: Optional[Tuple[str, ...]] = None,
+                            **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer or tool calls, never from the cache"""
+        return super().generate_with_tools(prompt, system_prompt, temperature, max_tokens, tools=tools, **kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get semantic cache counters along with the wrapped provider's metrics"""
+        lookups = self.counters["hits"] + self.counters["misses"]
+        stats = super().stats()
+        stats["semantic_cache"] = {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": len(self.index),
+            "evictions": self.index.evictions,
+            "threshold": self.threshold,
+            "stages": sorted(self.stages)
+        }
+        return stats
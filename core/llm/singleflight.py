@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional, AsyncIterator, List
+
+from core.llm.base import ErrorText, LLMWrapper, model_of, request_key
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """An in-flight generate() call shared by every identical request"""
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class _StreamFlight:
+    """
+    An in-flight generate_stream() call shared by every identical request.
+    
+    Chunks are buffered so that late joiners replay the prefix they missed
+    before following the live stream.
+    """
+    
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Event()
+    
+    def notify(self):
+        """Wake up every subscriber waiting for a new chunk"""
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+class SingleFlightLLM(LLMWrapper):
+    """
+    Coalesces concurrent identical LLM requests into one upstream call.
+    
+    The upstream call runs in its own task so that a waiter giving up does
+    not cancel it for the others; it is only cancelled once nobody is left
+    waiting for the result.
+    """
+    
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.calls: Dict[str, _Flight] = {}
+        self.streams: Dict[str, _StreamFlight] = {}
+        self.counters = {"calls": 0, "coalesced": 0, "streams": 0, "streams_coalesced": 0}
+    
+    def _key(self, prompt: str, system_prompt: Optional[str], temperature: float,
+             max_tokens: int, kwargs: Dict[str, Any]) -> str:
+        """Get the key identifying identical requests"""
+        return request_key(model_of(self.inner), prompt, system_prompt, temperature, max_tokens, **kwargs)
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> str:
+        """Generate text, sharing the result with identical requests already in flight"""
+        key = self._key(prompt, system_prompt, temperature, max_tokens, kwargs)
+        
+        flight = self.calls.get(key)
+        if flight is None:
+            task = asyncio.create_task(
+                super().generate(prompt, system_prompt, temperature, max_tokens, **kwargs)
+            )
+            flight = _Flight(task)
+            self.calls[key] = flight
+            task.add_done_callback(lambda _: self._forget(self.calls, key, flight))
+            self.counters["calls"] += 1
+        else:
+            self.counters["coalesced"] += 1
+            logger.debug(f"Joined in-flight LLM request {key[:12]}")
+        
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+    
+    async def generate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                              temperature: float = 0.7, max_tokens: int = 1024, **kwargs) -> AsyncIterator[str]:
+        """Stream text, sharing one upstream stream between identical requests"""
+        key = self._key(prompt, system_prompt, temperature, max_tokens, kwargs)
+        
+        flight = self.streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self.streams[key] = flight
+            flight.task = asyncio.create_task(
+                self._pump(key, flight, prompt, system_prompt, temperature, max_tokens, kwargs)
+            )
+            self.counters["streams"] += 1
+        else:
+            self.counters["streams_coalesced"] += 1
+            logger.debug(f"Joined in-flight LLM stream {key[:12]} at chunk {len(flight.chunks)}")
+        
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                changed = flight.changed
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                
+                if flight.done:
+                    break
+                
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is reading any more, so stop the upstream generation
+                flight.task.cancel()
+    
+    async def _pump(self, key: str, flight: _StreamFlight, prompt: str, system_prompt: Optional[str],
+                    temperature: float, max_tokens: int, kwargs: Dict[str, Any]):
+        """Read the upstream stream into the shared buffer"""
+        try:
+            async for chunk in super().generate_stream(prompt, system_prompt, temperature, max_tokens, **kwargs):
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            logger.error(f"Error in shared LLM stream: {str(e)}")
+            flight.chunks.append(ErrorText(f"Error: An unexpected error occurred: {str(e)}"))
+        finally:
+            flight.done = True
+            flight.notify()
+            self._forget(self.streams, key, flight)
+    
+    @staticmethod
+    def _forget(flights: Dict[str, Any], key: str, flight: Any):
+        """Remove a finished flight unless it was already replaced"""
+        if flights.get(key) is flight:
+            del flights[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get coalescing counters along with the wrapped provider's metrics"""
+        stats = super().stats()
+        stats["single_flight"] = {
+            **self.counters,
+            "in_flight": len(self.calls),
+            "streams_in_flight": len(self.streams)
+        }
+        return stats
@@ -0,0 +1,141 @@
+import json
+import logging
+from typing import Dict, Any, Optional, Union
+
+from core.llm.base import is_error_chunk
+
+logger = logging.getLogger(__name__)
+
+class JsonObjectDetector:
+    """
+    Tracks brace depth over streamed text to spot when the first JSON object closes.
+    
+    Braces inside strings (including escaped quotes) are ignored, so the
+    object is complete exactly when the depth returns to zero.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+    
+    def feed(self, chunk: str) -> bool:
+        """
+        Add a chunk of text.
+        
+        Returns:
+            True once the first top-level object has closed
+        """
+        if self.end is not None:
+            return True
+        
+        offset = len(self.text)
+        self.text += chunk
+        
+        for i, char in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.started:
+                    self.in_string = True
+            elif char == "{":
+                if not self.started:
+                    self.started = True
+                    self.start = offset + i
+                self.depth += 1
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = offset + i + 1
+                    return True
+        
+        return False
+    
+    def object_text(self) -> Optional[str]:
+        """Get the text of the completed object"""
+        if self.end is None:
+            return None
+        return self.text[self.start:self.end]
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract the first JSON object from model output.
+    
+    Tolerates prose around the object and Markdown code fences, which
+    models add even when asked for bare JSON.
+    
+    Args:
+        text: Raw model output
+    
+    Returns:
+        The parsed object, or None if there is no valid object
+    """
+    if not text:
+        return None
+    
+    try:
+        parsed = json.loads(text)
+        return parsed if isinstance(parsed, dict) else None
+    except json.JSONDecodeError:
+        pass
+    
+    # Try every opening brace in turn; prose can contain stray braces
+    position = text.find("{")
+    while position != -1:
+        detector = JsonObjectDetector()
+        if detector.feed(text[position:]):
+            try:
+                parsed = json.loads(detector.object_text())
+                if isinstance(parsed, dict):
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+        position = text.find("{", position + 1)
+    
+    return None
+
+async def generate_json(llm, prompt: str, system_prompt: Optional[str] = None,
+                        schema: Optional[Union[str, Dict[str, Any]]] = "json",
+                        temperature: float = 0.0, max_tokens: int = 128, **kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Ask an LLM for a JSON object, stopping generation as soon as it closes.
+    
+    Args:
+        llm: LLM provider (or wrapper) to use
+        prompt: User prompt
+        system_prompt: Optional system prompt
+        schema: Structured output mode: "json", a JSON schema, or None for free text
+        temperature: Sampling temperature
+        max_tokens: Maximum number of tokens to generate
+        **kwargs: Passed through to generate_stream (priority, session_id, ...)
+    
+    Returns:
+        The parsed object, or None if the model did not produce one
+    """
+    if schema is not None:
+        kwargs["format"] = schema
+    
+    detector = JsonObjectDetector()
+    stream = llm.generate_stream(prompt, system_prompt=system_prompt, temperature=temperature,
+                                 max_tokens=max_tokens, **kwargs)
+    try:
+        async for chunk in stream:
+            if not detector.started and is_error_chunk(chunk):
+                logger.warning(f"Structured generation failed: {chunk}")
+                return None
+            if detector.feed(chunk):
+                break
+    finally:
+        # Stop the upstream generation instead of letting it run to max_tokens
+        await stream.aclose()
+    
+    return extract_json(detector.object_text() or detector.text)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+def parse_hours(hours: str) -> Optional[Tuple[int, int]]:
+    """Parse an "8-18" style range of local hours, or return None if empty"""
+    if not hours or not hours.strip():
+        return None
+    start, _, end = hours.partition("-")
+    return int(start), int(end or 24)
+
+def parse_weekdays(weekdays: str) -> Set[int]:
+    """Parse a comma-separated list of weekday numbers (Monday = 0)"""
+    return {int(day) for day in weekdays.split(",") if day.strip()}
+
+class ModelWarmer:
+    """
+    Preloads Ollama models at startup and keeps them loaded during business hours.
+    
+    The warm-up runs in the background so the server can start accepting
+    connections straight away; ready is set once it has finished. After
+    that, the keeper re-sends the keep_alive request every interval while
+    inside business hours so Ollama never unloads the models then.
+    """
+    
+    def __init__(self, provider, models: List[str], keep_alive: Optional[str] = None,
+                 interval: float = 600, hours: Optional[Tuple[int, int]] = None,
+                 weekdays: Optional[Set[int]] = None):
+        self.provider = provider
+        self.models = models
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.hours = hours
+        self.weekdays = weekdays if weekdays is not None else {0, 1, 2, 3, 4}
+        self.ready = asyncio.Event()
+        self.loaded: Dict[str, bool] = {}
+        self.last_refresh: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start warming up in the background"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+    
+    def in_business_hours(self, now: Optional[datetime] = None) -> bool:
+        """Check whether models should be kept loaded right now"""
+        if self.hours is None:
+            return False
+        now = now or datetime.now()
+        start, end = self.hours
+        return now.weekday() in self.weekdays and start <= now.hour < end
+    
+    async def warm_up(self):
+        """Load every model, recording which ones succeeded"""
+        for model in self.models:
+            started = datetime.now()
+            self.loaded[model] = await self.provider.warm_up(model, self.keep_alive)
+            if self.loaded[model]:
+                logger.info(f"Warmed up {model} in {(datetime.now() - started).total_seconds():.1f}s")
+            else:
+                logger.warning(f"Could not warm up {model}")
+        self.last_refresh = datetime.now()
+    
+    async def _run(self):
+        """Warm up once, then keep the models loaded during business hours"""
+        try:
+            await self.warm_up()
+        except Exception as e:
+            logger.error(f"Error warming up models: {str(e)}")
+        finally:
+            # A failed warm-up only means the first request is slow, so do not
+            # hold readiness back forever
+            self.ready.set()
+        
+        if self.hours is None:
+            return
+        
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.in_business_hours():
+                continue
+            try:
+                await self.warm_up()
+            except Exception as e:
+                logger.error(f"Error refreshing model keep_alive: {str(e)}")
+    
+    def status(self) -> Dict[str, Any]:
+        """Get the warm-up state for the health endpoint"""
+        return {
+            "ready": self.ready.is_set(),
+            "models": dict(self.loaded),
+            "keep_alive": self.keep_alive,
+            "in_business_hours": self.in_business_hours(),
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None
+        }
+    
+    async def stop(self):
+        """Stop the keeper"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+# The warmer for the shared provider, if it supports warm-up
+_warmer: Optional[ModelWarmer] = None
+
+def start_warmup(provider) -> Optional[ModelWarmer]:
+    """
+    Start warming up the shared provider's models in the background.
+    
+    Providers without warm_up (OpenAI) need no warm-up, so nothing is started
+    and the process is ready straight away.
+    """
+    global _warmer
+    
+    if not settings.LLAMA_WARMUP_ENABLED or not callable(getattr(provider, "warm_up", None)):
+        return None
+    
+    _warmer = ModelWarmer(
+        provider,
+        settings.LLAMA_WARMUP_MODELS or list(dict.fromkeys([settings.LLAMA_MODEL, *settings.LLAMA_STAGE_MODELS.values()])),
+        keep_alive=settings.LLAMA_KEEP_ALIVE,
+        interval=settings.LLAMA_KEEPER_INTERVAL,
+        hours=parse_hours(settings.LLAMA_KEEPER_HOURS),
+        weekdays=parse_weekdays(settings.LLAMA_KEEPER_WEEKDAYS)
+    )
+    _warmer.start()
+    return _warmer
+
+def warmup_status() -> Dict[str, Any]:
+    """Get the readiness state of the model warm-up"""
+    if _warmer is None:
+        return {"ready": True}
+    return _warmer.status()
+
+async def stop_warmup():
+    """Stop the background keeper"""
+    global _warmer
+    
+    if _warmer is not None:
+        await _warmer.stop()
+        _warmer = None
@@ -1,9 +1,15 @@
 import os
 import json
+import asyncio
 import logging
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
+from core.memory.conversation_log import get_conversation_log
+from core.memory.messages import Message, MessageStore
+from core.memory.persistence import get_write_behind
+from core.memory.tokens import TokenCounter, MESSAGE_OVERHEAD, get_token_counter
+
 logger = logging.getLogger(__name__)
 
 class ConversationMemory:
@@ -11,15 +17,33 @@ class ConversationMemory:
     Manages conversation history and provides context for the agent.
     """
     
-    def __init__(self, session_id: str, max_history: int = 20):
+    def __init__(self, session_id: str, max_history: int = 20, token_counter: Optional[TokenCounter] = None):
         self.session_id = session_id
         self.max_history = max_history
-        self.messages = []  # List of message dictionaries
+        self.token_counter = token_counter or get_token_counter()
+        self.messages = MessageStore()
+        self.window_start = None  # First message sent to the model by get_chat_messages
+        self.summary = ""  # Running summary of the turns folded out of the prompt
+        self.summary_through = None  # Last message covered by the summary
         self.storage_dir = os.path.join("workspace", session_id)
         os.makedirs(self.storage_dir, exist_ok=True)
+        self.log = get_conversation_log(session_id)
+        self.next_id = 0  # Set from the stored messages by load()
         logger.info(f"Initialized conversation memory for session {session_id}")
     
-    def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
+    @classmethod
+    async def create(cls, session_id: str, **kwargs) -> "ConversationMemory":
+        """Create the memory of a session with its stored history loaded."""
+        memory = cls(session_id, **kwargs)
+        await memory.load()
+        return memory
+    
+    async def load(self):
+        """Load the stored conversation and summary without blocking the event loop."""
+        await self._load_conversation()
+        await asyncio.to_thread(self._load_summary)
+    
+    def add_message(self, role: str, content: str, metadata: Optional[Dict] = None) -> Message:
         """
         Add a message to the conversation history.
         
@@ -28,76 +52,180 @@ class ConversationMemory:
             content: The content of the message
             metadata: Optional metadata about the message
         """
-        message = {
-            "id": f"msg_{len(self.messages)}",
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "metadata": metadata or {}
-        }
+        # Counted once here so assembling context never re-tokenizes history
+        message = Message(f"msg_{self.next_id}", role, content, datetime.now().isoformat(),
+                          metadata, self.token_counter.count(content))
         
         self.messages.append(message)
+        self.next_id += 1
         
-        # Trim history if exceeds max_history
+        # Trim history if exceeds max_history. A quarter is dropped at once so
+        # the oldest message, and so the prefix sent to the model, only
+        # changes every few turns instead of on every message.
         if len(self.messages) > self.max_history:
-            self.messages = self.messages[-self.max_history:]
+            self.messages.trim(self.max_history - max(1, self.max_history // 4))
         
-        # Save the updated conversation
-        self._save_conversation()
+        # Append to the session's log rather than rewriting the conversation
+        try:
+            self.log.append(message.to_dict())
+        except Exception as e:
+            logger.error(f"Error saving conversation: {str(e)}")
         
         return message
     
-    def get_messages(self) -> List[Dict]:
+    def get_messages(self) -> List[Message]:
         """Get all messages in the conversation."""
-        return self.messages
+        return self.messages.slice()
+    
+    def _unsummarized_start(self) -> int:
+        """Get the index of the first message not covered by the summary."""
+        index = self.messages.index(self.summary_through)
+        # Either nothing is summarized or the summarized messages were trimmed
+        return index + 1 if index is not None else 0
+    
+    def get_unsummarized_messages(self) -> List[Message]:
+        """Get the messages not yet covered by the summary, oldest first."""
+        return self.messages.slice(self._unsummarized_start())
+    
+    def unsummarized_tokens(self) -> int:
+        """Get the tokens of the messages not yet covered by the summary."""
+        return self.messages.tokens_from(self._unsummarized_start())
+    
+    def update_summary(self, summary: str, through: Message):
+        """
+        Replace the running summary.
+        
+        Args:
+            summary: Summary of the conversation up to and including through
+            through: The last message the summary covers
+        """
+        self.summary = summary
+        self.summary_through = through
+        self._save_summary()
     
     def get_conversation_context(self, max_tokens: int = 4000) -> str:
         """
         Get the conversation context as a formatted string.
         
         Args:
-            max_tokens: Approximate maximum number of tokens to include
+            max_tokens: Maximum number of tokens to include
         
         Returns:
             Formatted conversation context
         """
-        context = "Here is the conversation history:\n\n"
-        
-        # Start from the most recent messages and work backwards
-        for message in reversed(self.messages):
-            message_text = f"{message['role'].capitalize()}: {message['content']}\n\n"
-            
-            # Simple token estimation (very approximate)
-            tokens_estimate = len(message_text) / 4
-            
-            if tokens_estimate > max_tokens:
+        header = "Here is the conversation history:\n\n"
+        max_tokens -= self.token_counter.count(header)
+        
+        # The most recent messages that fit, found from the running token sums
+        first = self._unsummarized_start()
+        start = self.messages.fit(max_tokens, first)
+        if start < len(self.messages):
+            return header + "".join(message.rendered for message in self.messages.slice(start))
+        
+        if first < len(self.messages) and max_tokens > MESSAGE_OVERHEAD:
+            # The latest message alone is too long: keep its beginning
+            message = self.messages[-1]
+            content = self.token_counter.truncate(message.content, max_tokens - MESSAGE_OVERHEAD)
+            return header + f"{message.role.capitalize()}: {content}...\n\n"
+        return header
+    
+    def get_chat_messages(self, max_tokens: int = 4000) -> List[Dict[str, str]]:
+        """
+        Get the conversation as structured chat messages.
+        
+        The window keeps starting at the same message from turn to turn, so
+        the model server can reuse its cached evaluation of the unchanged
+        prefix. Only once the window no longer fits in max_tokens is it moved
+        forward, far enough to leave room for the next several turns.
+        
+        Args:
+            max_tokens: Maximum number of tokens to include
+        
+        Returns:
+            List of {"role", "content"} dictionaries, oldest first
+        """
+        first = self._unsummarized_start()
+        last = len(self.messages) - 1
+        if first > last:
+            return []
+        
+        start = self.messages.index(self.window_start)
+        if start is None or start < first:
+            start = first
+        
+        if self.messages.tokens_from(start) > max_tokens:
+            # Trim down to half the budget so the new start holds for a while
+            start = min(self.messages.fit(max_tokens / 2, start), last)
+            # Do not open the window with a reply to a message that was cut
+            while start < last and self.messages[start].role == "assistant":
+                start += 1
+        
+        self.window_start = self.messages[start]
+        
+        chat_messages = []
+        for message in self.messages.slice(start):
+            role = message.role if message.role in ("system", "user", "assistant") else "user"
+            content = message.content
+            if message.cost > max_tokens:
                 # Truncate the message if it's too long
-                message_text = message_text[:max_tokens * 4] + "...\n\n"
-                context = context + message_text
-                break
-            
-            max_tokens -= tokens_estimate
-            context = message_text + context
-            
-            if max_tokens <= 0:
-                break
-        
-        return context
+                content = self.token_counter.truncate(content, max_tokens - MESSAGE_OVERHEAD) + "..."
+            chat_messages.append({"role": role, "content": content})
+        
+        return chat_messages
     
     def clear(self):
         """Clear the conversation history."""
-        self.messages = []
-        self._save_conversation()
+        self.messages.clear()
+        self.window_start = None
+        self.summary = ""
+        self.summary_through = None
+        try:
+            self.log.clear()
+        except Exception as e:
+            logger.error(f"Error clearing conversation: {str(e)}")
+        self._save_summary()
     
-    def _save_conversation(self):
-        """Save the conversation to disk."""
+    async def _load_conversation(self):
+        """Load the most recent messages of the session from its log."""
         try:
-            filepath = os.path.join(self.storage_dir, "conversation.json")
-            with open(filepath, 'w') as f:
-                json.dump({
-                    "session_id": self.session_id,
-                    "messages": self.messages
-                }, f, indent=2)
-                
+            for record in await self.log.read_tail(self.max_history):
+                self.messages.append(Message.from_dict(record, self.token_counter))
         except Exception as e:
-            logger.error(f"Error saving conversation: {str(e)}")
+            logger.error(f"Error loading conversation: {str(e)}")
+            self.messages.clear()
+        
+        # Message ids keep counting up across restarts and trimming
+        self.next_id = len(self.messages)
+        if self.messages:
+            last_id = str(self.messages[-1].id)
+            if last_id.startswith("msg_") and last_id[4:].isdigit():
+                self.next_id = max(self.next_id, int(last_id[4:]) + 1)
+    
+    def _load_summary(self):
+        """Load the summary kept from earlier in the session, if any."""
+        filepath = os.path.join(self.storage_dir, "summary.json")
+        try:
+            content = get_write_behind().read_text(filepath)
+            if content is None:
+                return
+            data = json.loads(content)
+            self.summary = data.get("summary", "")
+            through = data.get("through")
+            self.summary_through = next((m for m in self.messages if m.id == through), None)
+        
+        except Exception as e:
+            logger.error(f"Error loading conversation summary: {str(e)}")
+    
+    def _save_summary(self):
+        """Save the summary next to the conversation, in the background."""
+        try:
+            filepath = os.path.join(self.storage_dir, "summary.json")
+            get_write_behind().save_json(filepath, {
+                "session_id": self.session_id,
+                "summary": self.summary,
+                "through": self.summary_through.id if self.summary_through else None,
+                "updated": datetime.now().isoformat()
+            })
+        
+        except Exception as e:
+            logger.error(f"Error saving conversation summary: {str(e)}")
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Iterator, Optional
+
+from config.settings import settings
+from core.memory.database import SessionMessageLog, get_session_db
+
+logger = logging.getLogger(__name__)
+
+LOG_FILENAME = "conversation.jsonl"
+LEGACY_FILENAME = "conversation.json"
+
+# fsync policies
+FSYNC_ALWAYS = "always"  # After every append
+FSYNC_INTERVAL = "interval"  # At most once per fsync_interval seconds
+FSYNC_NEVER = "never"  # Leave flushing to the OS
+
+class ConversationLog:
+    """
+    Append-only conversation log with one JSON record per message.
+    
+    Adding a message costs one short append instead of rewriting the whole
+    conversation, and a crash can at worst tear the last line, which is cut
+    off on the next open. Once the log holds well over max_messages records
+    it is compacted down to the newest ones by writing a new file and
+    renaming it over the old one, so readers never see a partial file.
+    
+    All file work runs on the writer thread, in the order it was asked
+    for: appends return at once, and reads are awaited and see every
+    earlier append. The file is closed while the log is idle and opened
+    again by the next append.
+    """
+    
+    def __init__(self, directory: str, fsync: str = FSYNC_INTERVAL, fsync_interval: float = 1.0,
+                 max_messages: int = 1000, writer: Optional[ThreadPoolExecutor] = None):
+        self.directory = directory
+        self.path = os.path.join(directory, LOG_FILENAME)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_messages = max_messages
+        self.writer = writer or get_log_writer()
+        self.count = 0  # Records in the file
+        self.last_fsync = 0.0
+        self.last_used = time.monotonic()
+        self.file = None
+        self.closed = False
+        self._submit(self._start)
+    
+    def _submit(self, operation, *args) -> Future:
+        """Queue file work on the writer thread"""
+        future = self.writer.submit(operation, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+    
+    def _log_failure(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Error writing conversation log {self.path}: {str(future.exception())}")
+    
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._migrate()
+        self._open()
+    
+    def _migrate(self):
+        """Convert a conversation.json written by earlier versions, once"""
+        legacy_path = os.path.join(self.directory, LEGACY_FILENAME)
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return
+        
+        try:
+            with open(legacy_path, 'r') as f:
+                messages = json.load(f).get("messages", [])
+            self._write_atomic(messages)
+            # Kept for reference rather than deleted
+            os.replace(legacy_path, legacy_path + ".migrated")
+            logger.info(f"Migrated {len(messages)} messages from {legacy_path} to {self.path}")
+        
+        except Exception as e:
+            logger.error(f"Error migrating {legacy_path}: {str(e)}")
+    
+    def _open(self):
+        """Open the log for appending, cutting off a line torn by a crash"""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb+') as f:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    logger.warning(f"Dropping {len(data) - end} bytes of a torn record at the end of {self.path}")
+                    f.truncate(end)
+                self.count = data.count(b"\n", 0, end)
+        
+        self.file = open(self.path, 'a', encoding='utf-8')
+    
+    def append(self, message: Dict[str, Any]):
+        """Queue a message to be appended"""
+        self.last_used = time.monotonic()
+        # Serialized now, so later changes to the message are not written
+        self._submit(self._append, json.dumps(message, ensure_ascii=False) + "\n")
+    
+    def _append(self, line: str):
+        if self.closed:
+            raise ValueError("log is closed")
+        if self.file is None:
+            self._open()
+        self.file.write(line)
+        self.file.flush()
+        self.count += 1
+        self._sync()
+        
+        if self.max_messages and self.count > self.max_messages + max(1, self.max_messages // 4):
+            self.compact()
+    
+    def _sync(self):
+        """fsync according to the configured policy"""
+        if self.fsync == FSYNC_NEVER:
+            return
+        
+        now = time.monotonic()
+        if self.fsync == FSYNC_ALWAYS or now - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+    
+    async def read_tail(self, limit: int) -> List[Dict[str, Any]]:
+        """Read the last limit messages, oldest first"""
+        self.last_used = time.monotonic()
+        return await asyncio.wrap_future(self.writer.submit(self._read_tail, limit))
+    
+    async def read_all(self) -> List[Dict[str, Any]]:
+        """Read every message, oldest first"""
+        self.last_used = time.monotonic()
+        return await asyncio.wrap_future(self.writer.submit(lambda: list(self)))
+    
+    def _read_tail(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Read the last limit messages, oldest first.
+        
+        The file is read backwards in blocks until enough lines are found,
+        so loading a long conversation does not parse all of it.
+        """
+        if limit <= 0 or not os.path.exists(self.path):
+            return []
+        
+        block_size = 64 * 1024
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b""
+            # One extra newline marks the start of the first wanted line
+            while position > 0 and data.count(b"\n") <= limit:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+        
+        lines = data.splitlines()
+        if position > 0:
+            lines = lines[1:]  # Starts mid-record
+        return self._parse(lines[-limit:])
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Stream every message in the log, oldest first"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            for line in f:
+                yield from self._parse([line])
+    
+    def _parse(self, lines: List[bytes]) -> List[Dict[str, Any]]:
+        """Parse log lines, skipping any that are not valid records"""
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable record in {self.path}")
+        return messages
+    
+    def _write_atomic(self, messages: List[Dict[str, Any]]):
+        """Replace the log with the given messages through a temporary file"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+    
+    def _rewrite(self, messages: List[Dict[str, Any]]):
+        """Swap in a new log file holding only the given messages"""
+        if self.file:
+            self.file.close()
+            self.file = None
+        self._write_atomic(messages)
+        self.count = len(messages)
+        self.file = open(self.path, 'a', encoding='utf-8')
+    
+    def compact(self):
+        """Rewrite the log keeping only the newest max_messages records"""
+        try:
+            self._rewrite(self._read_tail(self.max_messages))
+            logger.info(f"Compacted {self.path} to {self.count} messages")
+        except Exception as e:
+            logger.error(f"Error compacting conversation log: {str(e)}")
+            if self.file is None or self.file.closed:
+                self.file = open(self.path, 'a', encoding='utf-8')
+    
+    def clear(self):
+        """Queue the removal of every message"""
+        self.last_used = time.monotonic()
+        self._submit(self._rewrite, [])
+    
+    def release(self, idle_seconds: float):
+        """Queue closing the file if the log is still idle when it runs"""
+        self._submit(self._release, idle_seconds)
+    
+    def _release(self, idle_seconds: float):
+        if time.monotonic() - self.last_used >= idle_seconds:
+            self._close_file()
+    
+    def _close_file(self):
+        """Flush and close the file; the next append opens it again"""
+        if self.file and not self.file.closed:
+            self.file.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self.file.fileno())
+            self.file.close()
+        self.file = None
+    
+    def close(self):
+        """Finish queued writes and close the log for good"""
+        self.closed = True
+        self._submit(self._close_file).result()
+
+# One log per session, shared by every agent of the session so that a
+# compaction never leaves another writer appending to the old file
+_logs: Dict[str, Any] = {}
+_writer: Optional[ThreadPoolExecutor] = None
+_last_sweep = 0.0
+
+# How often idle logs are looked for
+SWEEP_INTERVAL = 60.0
+
+def get_log_writer() -> ThreadPoolExecutor:
+    """Get the thread that does the file work of every ConversationLog"""
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-log")
+    return _writer
+
+def _release_idle_logs():
+    """Close the files of logs unused for CONVERSATION_LOG_IDLE_SECONDS"""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    
+    idle_seconds = settings.CONVERSATION_LOG_IDLE_SECONDS
+    for log in _logs.values():
+        if isinstance(log, ConversationLog) and log.file is not None and now - log.last_used >= idle_seconds:
+            log.release(idle_seconds)
+
+def get_conversation_log(session_id: str):
+    """
+    Get the shared message log of a session.
+    
+    With CONVERSATION_STORE "sqlite" this is the session's messages in the
+    session database, with "jsonl" a ConversationLog file in its workspace
+    directory.
+    """
+    if session_id not in _logs:
+        if settings.CONVERSATION_STORE == "sqlite":
+            _logs[session_id] = SessionMessageLog(get_session_db(), session_id)
+        else:
+            _logs[session_id] = ConversationLog(
+                os.path.join("workspace", session_id),
+                fsync=settings.CONVERSATION_FSYNC,
+                fsync_interval=settings.CONVERSATION_FSYNC_INTERVAL,
+                max_messages=settings.CONVERSATION_LOG_MAX_MESSAGES
+            )
+    _release_idle_logs()
+    return _logs[session_id]
+
+def close_conversation_log(session_id: str):
+    """Close and forget the log of a session, e.g. once it is deleted"""
+    log = _logs.pop(session_id, None)
+    if log is None:
+        return
+    try:
+        log.close()
+    except Exception as e:
+        logger.error(f"Error closing conversation log of session {session_id}: {str(e)}")
+
+def close_conversation_logs():
+    """Flush and close every shared log"""
+    global _writer
+    for session_id in list(_logs):
+        close_conversation_log(session_id)
+    if _writer is not None:
+        _writer.shutdown(wait=True)
+        _writer = None
@@ -0,0 +1,549 @@
+import os
+import json
+import hashlib
+import time
+import queue
+import asyncio
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_active TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    epoch INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    tokens INTEGER,
+    metadata TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_seq ON messages (session_id, seq);
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages (session_id, message_id);
+
+CREATE TABLE IF NOT EXISTS thinking_logs (
+    session_id TEXT NOT NULL,
+    log_id TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    step_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, log_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thinking_logs_start ON thinking_logs (session_id, start_time);
+
+CREATE TABLE IF NOT EXISTS thinking_steps (
+    rowid INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    log_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    step_id TEXT,
+    type TEXT,
+    content TEXT,
+    data TEXT,
+    timestamp REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_thinking_steps_log ON thinking_steps (session_id, log_id, seq);
+"""
+
+# Full-text indexes over message and thinking step content. They keep no
+# copy of the text (it is read from the tables when building snippets) and
+# triggers update them with every insert and delete.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS thinking_steps_fts USING fts5(
+    content, content='thinking_steps', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS thinking_steps_fts_insert AFTER INSERT ON thinking_steps BEGIN
+    INSERT INTO thinking_steps_fts (rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS thinking_steps_fts_delete AFTER DELETE ON thinking_steps BEGIN
+    INSERT INTO thinking_steps_fts (thinking_steps_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+END;
+"""
+
+SEARCH_KINDS = ("message", "thinking")
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+def _session_row(row) -> Dict[str, Any]:
+    return {"id": row[0], "name": row[1], "created_at": row[2], "last_active": row[3], "message_count": row[4]}
+
+def _message_row(row) -> Dict[str, Any]:
+    return {
+        "id": row[0],
+        "seq": row[1],
+        "role": row[2],
+        "content": row[3],
+        "timestamp": row[4],
+        "tokens": row[5],
+        "metadata": json.loads(row[6]) if row[6] else {}
+    }
+
+MESSAGE_COLUMNS = "message_id, seq, role, content, timestamp, tokens, metadata"
+
+# Operations, each run with a connection from the pool (reads) or on the
+# writer thread inside a transaction (writes)
+
+def create_session(conn: sqlite3.Connection, session_id: str, name: Optional[str] = None) -> Dict[str, Any]:
+    """Create a session, or refresh last_active if it already exists"""
+    now = _now()
+    conn.execute(
+        "INSERT OR IGNORE INTO sessions (id, name, created_at, last_active) VALUES (?, ?, ?, ?)",
+        (session_id, name or f"Session {datetime.now().strftime('%Y-%m-%d %H:%M')}", now, now)
+    )
+    conn.execute("UPDATE sessions SET last_active = ? WHERE id = ?", (now, session_id))
+    return get_session(conn, session_id)
+
+def get_session(conn: sqlite3.Connection, session_id: str) -> Optional[Dict[str, Any]]:
+    """Look a session up by id"""
+    row = conn.execute(
+        "SELECT id, name, created_at, last_active, message_count FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    return _session_row(row) if row else None
+
+def touch_session(conn: sqlite3.Connection, session_id: str) -> Optional[Dict[str, Any]]:
+    """Update a session's last_active timestamp"""
+    conn.execute("UPDATE sessions SET last_active = ? WHERE id = ?", (_now(), session_id))
+    return get_session(conn, session_id)
+
+def list_sessions(conn: sqlite3.Connection, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    """List sessions, most recently active first"""
+    rows = conn.execute(
+        "SELECT id, name, created_at, last_active, message_count FROM sessions "
+        "ORDER BY last_active DESC LIMIT ? OFFSET ?", (limit, offset)
+    ).fetchall()
+    return [_session_row(row) for row in rows]
+
+def delete_session(conn: sqlite3.Connection, session_id: str) -> bool:
+    """Delete a session with its messages and thinking logs"""
+    deleted = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+    for table in ("messages", "thinking_logs", "thinking_steps"):
+        conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+    return deleted > 0
+
+def append_message(conn: sqlite3.Connection, session_id: str, message: Dict[str, Any], seq: Optional[int] = None) -> int:
+    """
+    Append a message to a session, creating the session if needed.
+    
+    Returns:
+        The message's sequence number within the session
+    """
+    create_session(conn, session_id)
+    if seq is None:
+        seq = conn.execute(
+            "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+    inserted = conn.execute(
+        f"INSERT OR IGNORE INTO messages (session_id, {MESSAGE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (session_id, message.get("id"), seq, message.get("role", "user"), message.get("content", ""),
+         message.get("timestamp"), message.get("tokens"), json.dumps(message.get("metadata") or {}))
+    ).rowcount
+    if inserted:
+        conn.execute("UPDATE sessions SET message_count = message_count + 1 WHERE id = ?", (session_id,))
+    return seq
+
+def get_messages(conn: sqlite3.Connection, session_id: str, limit: int = 50,
+                 before: Optional[int] = None, after: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Get a window of a session's messages by sequence number, oldest first.
+    
+    With after, the first limit messages following that sequence number
+    (and preceding before, if given); otherwise the last limit messages
+    preceding before, or the last limit messages of the session. Every
+    case is a range scan of the (session_id, seq) index.
+    """
+    if after is not None:
+        rows = conn.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? AND seq > ? AND seq < ? ORDER BY seq LIMIT ?",
+            (session_id, after, before if before is not None else 2 ** 63 - 1, limit)
+        ).fetchall()
+        return [_message_row(row) for row in rows]
+    
+    if before is None:
+        rows = conn.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (session_id, before, limit)
+        ).fetchall()
+    return [_message_row(row) for row in reversed(rows)]
+
+def clear_messages(conn: sqlite3.Connection, session_id: str):
+    """Delete every message of a session"""
+    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+    # A new epoch, so the history version does not repeat once seq numbers restart
+    conn.execute(
+        "UPDATE sessions SET message_count = 0, epoch = epoch + 1, last_active = ? WHERE id = ?",
+        (_now(), session_id)
+    )
+
+def get_history_version(conn: sqlite3.Connection, session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get what identifies the current state of a session's history: its
+    epoch, which counts how often it was cleared, its message count and the
+    sequence numbers of its first and last messages.
+    
+    Returns:
+        The version, with an etag that changes whenever messages are added
+        or cleared, or None if the session does not exist
+    """
+    row = conn.execute(
+        "SELECT message_count, last_active, epoch FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    message_count, last_active, epoch = row
+    
+    first_seq, last_seq = conn.execute(
+        # Separate subqueries, so each is a single index lookup
+        "SELECT (SELECT MIN(seq) FROM messages WHERE session_id = ?), "
+        "(SELECT MAX(seq) FROM messages WHERE session_id = ?)", (session_id, session_id)
+    ).fetchone()
+    etag = f"{epoch}-{message_count}-{last_seq if last_seq is not None else -1}-{last_active}"
+    return {
+        "epoch": epoch,
+        "message_count": message_count,
+        "first_seq": first_seq,
+        "last_seq": last_seq,
+        "etag": hashlib.sha1(etag.encode("utf-8")).hexdigest()[:20]
+    }
+
+def save_thinking_log(conn: sqlite3.Connection, session_id: str, log_id: str, log: Dict[str, Any]):
+    """Store a thinking log and its steps, replacing an earlier version"""
+    create_session(conn, session_id)
+    steps = log.get("steps", [])
+    conn.execute(
+        "INSERT OR REPLACE INTO thinking_logs (session_id, log_id, start_time, end_time, step_count) VALUES (?, ?, ?, ?, ?)",
+        (session_id, log_id, log.get("start_time"), log.get("end_time"), len(steps))
+    )
+    conn.execute("DELETE FROM thinking_steps WHERE session_id = ? AND log_id = ?", (session_id, log_id))
+    conn.executemany(
+        "INSERT INTO thinking_steps (session_id, log_id, seq, step_id, type, content, data, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(session_id, log_id, seq, step.get("id"), step.get("type"), step.get("content"),
+          json.dumps(step.get("data") or {}), step.get("timestamp")) for seq, step in enumerate(steps)]
+    )
+
+def list_thinking_logs(conn: sqlite3.Connection, session_id: str) -> List[Dict[str, Any]]:
+    """List a session's thinking logs, most recent first"""
+    rows = conn.execute(
+        "SELECT log_id, start_time, end_time, step_count FROM thinking_logs "
+        "WHERE session_id = ? ORDER BY start_time DESC", (session_id,)
+    ).fetchall()
+    return [{"id": row[0], "start_time": row[1], "end_time": row[2], "step_count": row[3]} for row in rows]
+
+def search_query(text: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching every word.
+    
+    Words are quoted so punctuation and FTS5 operators in the text are
+    taken literally; a trailing * keeps its meaning as a prefix match.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+def search(conn: sqlite3.Connection, query: str, session_id: Optional[str] = None,
+           kinds: tuple = SEARCH_KINDS, limit: int = 20, offset: int = 0,
+           highlight: tuple = ("[", "]")) -> List[Dict[str, Any]]:
+    """
+    Search message and thinking step content across sessions, best match first.
+    
+    Args:
+        conn: Database connection
+        query: Free text; every word must match
+        session_id: Only search this session
+        kinds: Which content to search, from SEARCH_KINDS
+        limit: Maximum number of results
+        offset: Number of results to skip, for paging
+        highlight: Markers put around the matched words in snippets
+    
+    Returns:
+        Matches with their location and a snippet of the matching text
+    """
+    match = search_query(query)
+    if match is None:
+        return []
+    
+    selects = []
+    params: List[Any] = []
+    session_filter = " AND t.session_id = ?" if session_id else ""
+    if "message" in kinds:
+        selects.append(
+            "SELECT 'message', t.session_id, t.message_id, t.seq, NULL, t.role, t.timestamp, "
+            "snippet(messages_fts, 0, ?, ?, '...', 24), messages_fts.rank "
+            "FROM messages_fts JOIN messages t ON t.rowid = messages_fts.rowid "
+            f"WHERE messages_fts MATCH ?{session_filter}"
+        )
+        params += [*highlight, match] + ([session_id] if session_id else [])
+    if "thinking" in kinds:
+        selects.append(
+            "SELECT 'thinking', t.session_id, t.step_id, t.seq, t.log_id, t.type, t.timestamp, "
+            "snippet(thinking_steps_fts, 0, ?, ?, '...', 24), thinking_steps_fts.rank "
+            "FROM thinking_steps_fts JOIN thinking_steps t ON t.rowid = thinking_steps_fts.rowid "
+            f"WHERE thinking_steps_fts MATCH ?{session_filter}"
+        )
+        params += [*highlight, match] + ([session_id] if session_id else [])
+    if not selects:
+        return []
+    
+    rows = conn.execute(
+        " UNION ALL ".join(selects) + " ORDER BY 9 LIMIT ? OFFSET ?", (*params, limit, offset)
+    ).fetchall()
+    return [{
+        "kind": row[0],
+        "session_id": row[1],
+        "id": row[2],
+        "seq": row[3],
+        "log_id": row[4],
+        "role": row[5],
+        "timestamp": row[6],
+        "snippet": row[7],
+        "score": -row[8]  # FTS5 ranks better matches lower
+    } for row in rows]
+
+def get_thinking_log(conn: sqlite3.Connection, session_id: str, log_id: str) -> Optional[Dict[str, Any]]:
+    """Get a thinking log with all of its steps"""
+    row = conn.execute(
+        "SELECT start_time, end_time FROM thinking_logs WHERE session_id = ? AND log_id = ?", (session_id, log_id)
+    ).fetchone()
+    if row is None:
+        return None
+    
+    steps = conn.execute(
+        "SELECT step_id, type, content, data, timestamp FROM thinking_steps "
+        "WHERE session_id = ? AND log_id = ? ORDER BY seq", (session_id, log_id)
+    ).fetchall()
+    return {
+        "session_id": session_id,
+        "start_time": row[0],
+        "end_time": row[1],
+        "steps": [{"id": s[0], "type": s[1], "content": s[2], "data": json.loads(s[3]) if s[3] else {},
+                   "timestamp": s[4]} for s in steps]
+    }
+
+class SessionDatabase:
+    """
+    SQLite store for sessions, messages and thinking logs.
+    
+    The database runs in WAL mode so readers never wait for the writer.
+    Reads take a connection from a small pool and run in a worker thread;
+    writes are serialized on a single writer thread, each in its own
+    transaction, which also keeps them in submission order. Nothing here
+    touches the disk on the event loop.
+    """
+    
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        self.writer_conn = self._connect()
+        self.writer_conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        self.search_enabled = self._create_search_index()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-db-writer")
+        
+        self.pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+        self.pool_size = pool_size
+        # Write counters are updated from the event loop and the writer thread
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        self.counters = {"writes": 0, "errors": 0}
+        self.last_lag = 0.0  # Seconds a write waited in the queue
+        self.max_lag = 0.0
+        logger.info(f"Opened session database at {path}")
+    
+    def _upgrade_schema(self):
+        """Add the columns that databases created by earlier versions lack"""
+        columns = [row[1] for row in self.writer_conn.execute("PRAGMA table_info(sessions)")]
+        if "epoch" not in columns:
+            with self.writer_conn:
+                self.writer_conn.execute("ALTER TABLE sessions ADD COLUMN epoch INTEGER NOT NULL DEFAULT 0")
+    
+    def _create_search_index(self) -> bool:
+        """Create the full-text indexes, filling them from existing rows if they are new"""
+        conn = self.writer_conn
+        existed = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('messages_fts', 'thinking_steps_fts')"
+        ).fetchone()[0] == 2
+        try:
+            with conn:
+                conn.executescript(SEARCH_SCHEMA)
+                if not existed:
+                    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                    conn.execute("INSERT INTO thinking_steps_fts (thinking_steps_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5
+            logger.warning(f"Full-text search is not available: {str(e)}")
+            return False
+        return True
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the pragmas every connection needs"""
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe against corruption in WAL mode
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a read connection from the pool"""
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+    
+    def _read(self, operation: Callable, *args):
+        with self.connection() as conn:
+            return operation(conn, *args)
+    
+    def _write(self, operation: Callable, enqueued: float, *args):
+        lag = time.monotonic() - enqueued
+        with self.lock:
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+        try:
+            with self.writer_conn:  # Commits, or rolls back on error
+                return operation(self.writer_conn, *args)
+        finally:
+            with self.lock:
+                self.pending_writes -= 1
+                self.counters["writes"] += 1
+    
+    async def read(self, operation: Callable, *args):
+        """Run a read operation in a worker thread"""
+        return await asyncio.to_thread(self._read, operation, *args)
+    
+    async def read_after_writes(self, operation: Callable, *args):
+        """Run a read operation once every write queued before it has committed"""
+        return await asyncio.wrap_future(self.writer.submit(self._read, operation, *args))
+    
+    def submit(self, operation: Callable, *args) -> Future:
+        """Queue a write operation on the writer thread without waiting for it"""
+        with self.lock:
+            self.pending_writes += 1
+        future = self.writer.submit(self._write, operation, time.monotonic(), *args)
+        future.add_done_callback(self._log_failure)
+        return future
+    
+    async def write(self, operation: Callable, *args):
+        """Run a write operation on the writer thread and wait for it"""
+        return await asyncio.wrap_future(self.submit(operation, *args))
+    
+    def _log_failure(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            with self.lock:
+                self.counters["errors"] += 1
+            logger.error(f"Session database write failed: {str(future.exception())}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get write counters and how long writes wait for the writer thread"""
+        with self.lock:
+            return {
+                **self.counters,
+                "pending": self.pending_writes,
+                "last_lag_seconds": self.last_lag,
+                "max_lag_seconds": self.max_lag
+            }
+    
+    def close(self):
+        """Finish pending writes and close every connection"""
+        self.writer.shutdown(wait=True)
+        self.writer_conn.close()
+        for _ in range(self.pool_size):
+            self.pool.get().close()
+
+class SessionMessageLog:
+    """
+    A session's messages in the database, with the same interface as
+    ConversationLog. Appends are queued on the writer thread; reads go
+    through the writer thread too, so they see every earlier append, and
+    are awaited so the event loop never waits on the database.
+    """
+    
+    def __init__(self, db: SessionDatabase, session_id: str):
+        self.db = db
+        self.session_id = session_id
+    
+    def append(self, message: Dict[str, Any]):
+        """Queue a message to be appended"""
+        self.db.submit(append_message, self.session_id, message)
+    
+    async def read_tail(self, limit: int) -> List[Dict[str, Any]]:
+        """Read the last limit messages, oldest first"""
+        if limit <= 0:
+            return []
+        return await self.db.read_after_writes(get_messages, self.session_id, limit)
+    
+    async def read_all(self) -> List[Dict[str, Any]]:
+        """Read every message, oldest first"""
+        return await self.read_tail(2 ** 31)
+    
+    def clear(self):
+        """Queue the removal of every message"""
+        self.db.submit(clear_messages, self.session_id)
+    
+    def close(self):
+        pass
+
+# Shared database for the whole process
+_db: Optional[SessionDatabase] = None
+
+def get_session_db() -> SessionDatabase:
+    """Get the shared session database configured in settings"""
+    global _db
+    
+    if _db is None:
+        _db = SessionDatabase(settings.SESSION_DB_PATH, pool_size=settings.SESSION_DB_POOL_SIZE)
+    return _db
+
+def close_session_db():
+    """Finish pending writes and close the shared session database"""
+    global _db
+    
+    if _db is not None:
+        _db.close()
+        _db = None
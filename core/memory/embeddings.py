@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import aiohttp
+import numpy as np
+from typing import Optional
+
+from config.settings import settings
+from core.llm.http import create_client_session
+
+logger = logging.getLogger(__name__)
+
+class OllamaEmbedder:
+    """
+    Embeds text through a local Ollama /api/embeddings endpoint.
+    
+    Anything with the same async embed(text) method (a stub in tests, for
+    instance) can be used in its place.
+    """
+    
+    def __init__(self, api_url: Optional[str] = None, model: Optional[str] = None,
+                 max_chars: int = 4000, timeout: float = 30):
+        self.api_url = api_url or self._embeddings_url(settings.LLAMA_API_URL)
+        self.model = model or settings.EMBEDDING_MODEL
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.session = None
+    
+    @staticmethod
+    def _embeddings_url(api_url: str) -> str:
+        """Get the /api/embeddings URL on the host serving api_url"""
+        if api_url.endswith("/api/generate"):
+            return api_url[:-len("/generate")] + "/embeddings"
+        return api_url.rstrip("/") + "/api/embeddings"
+    
+    async def ensure_session(self):
+        """Ensure aiohttp session exists"""
+        if self.session is None or self.session.closed:
+            self.session = create_client_session()
+        return self.session
+    
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """
+        Embed a text.
+        
+        Returns:
+            The embedding as a float32 vector, or None if the request failed
+        """
+        request_data = {"model": self.model, "prompt": text[:self.max_chars]}
+        try:
+            session = await self.ensure_session()
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            
+            async with session.post(self.api_url, json=request_data, timeout=timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Embedding API Error ({response.status}): {error_text}")
+                    return None
+                data = await response.json()
+            
+            embedding = data.get("embedding")
+            if not embedding:
+                logger.error(f"Embedding API returned no embedding for model {self.model}")
+                return None
+            return np.asarray(embedding, dtype=np.float32)
+        
+        except asyncio.TimeoutError:
+            logger.error("Request to embedding API timed out")
+            return None
+        
+        except Exception as e:
+            logger.error(f"Error embedding text: {str(e)}")
+            return None
+    
+    async def close(self):
+        """Close the aiohttp session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+# Shared embedder for the whole process
+_embedder: Optional[OllamaEmbedder] = None
+
+def get_embedder() -> OllamaEmbedder:
+    """Get the shared embedder configured in settings"""
+    global _embedder
+    
+    if _embedder is None:
+        _embedder = OllamaEmbedder(
+            api_url=settings.EMBEDDING_API_URL or None,
+            model=settings.EMBEDDING_MODEL,
+            max_chars=settings.EMBEDDING_MAX_CHARS
+        )
+    return _embedder
+
+async def close_embedder():
+    """Close the shared embedder's connection pool"""
+    global _embedder
+    
+    if _embedder is not None:
+        await _embedder.close()
+        _embedder = None
@@ -0,0 +1,136 @@
+from bisect import bisect_left
+from typing import Dict, List, Any, Iterator, Optional
+
+from core.memory.tokens import TokenCounter, MESSAGE_OVERHEAD
+
+class Message:
+    """
+    One conversation message, with its token count and rendered text cached.
+    
+    Supports read-only dict-style access (message["content"]) so code that
+    handled messages as dictionaries keeps working.
+    """
+    
+    __slots__ = ("id", "role", "content", "timestamp", "metadata", "tokens", "position", "offset", "_rendered")
+    
+    # Fields readable dict-style and stored in the conversation log
+    FIELDS = ("id", "role", "content", "timestamp", "metadata", "tokens")
+    
+    def __init__(self, id: str, role: str, content: str, timestamp: str,
+                 metadata: Optional[Dict[str, Any]] = None, tokens: int = 0):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+        self.metadata = metadata or {}
+        self.tokens = tokens
+        self.position = 0  # Index in the session, set by MessageStore
+        self.offset = 0  # Tokens of every earlier message in the session, set by MessageStore
+        self._rendered: Optional[str] = None
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], token_counter: TokenCounter) -> "Message":
+        """Build a message from a stored record, counting tokens if it has none"""
+        tokens = data.get("tokens")
+        if tokens is None:
+            # Messages saved before token counts were recorded
+            tokens = token_counter.count(data.get("content", ""))
+        return cls(data.get("id", ""), data.get("role", "user"), data.get("content", ""),
+                   data.get("timestamp", ""), data.get("metadata"), tokens)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    @property
+    def cost(self) -> int:
+        """Tokens the message takes in a prompt, including the role and separators"""
+        return self.tokens + MESSAGE_OVERHEAD
+    
+    @property
+    def rendered(self) -> str:
+        """The message as a line of a flat conversation transcript"""
+        if self._rendered is None:
+            self._rendered = f"{self.role.capitalize()}: {self.content}\n\n"
+        return self._rendered
+    
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS
+
+class MessageStore:
+    """
+    The messages of a conversation, oldest first, with running token sums.
+    
+    Every message records the total tokens of the messages before it, so
+    the tokens from any message to the end are one subtraction, and the
+    longest suffix that fits a budget is one binary search. Old messages
+    are dropped from the front in batches (see ConversationMemory), which
+    keeps that amortized O(1) per message.
+    """
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.offsets: List[int] = []  # Message offsets, kept apart for bisect
+        self.total = 0  # Tokens of every message ever appended
+        self.appended = 0  # Messages ever appended
+
+    def append(self, message: Message):
+        message.position = self.appended
+        message.offset = self.total
+        self.messages.append(message)
+        self.offsets.append(message.offset)
+        self.appended += 1
+        self.total += message.cost
+
+    def trim(self, keep: int):
+        """Drop the oldest messages until at most keep are left"""
+        drop = len(self.messages) - max(keep, 0)
+        if drop > 0:
+            del self.messages[:drop]
+            del self.offsets[:drop]
+
+    def clear(self):
+        self.messages.clear()
+        self.offsets.clear()
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.messages)
+    
+    def __getitem__(self, index: int) -> Message:
+        return self.messages[index]
+    
+    def index(self, message: Optional[Message]) -> Optional[int]:
+        """Get the index of a message still in the store, or None"""
+        if message is None or not self.messages:
+            return None
+        index = message.position - self.messages[0].position
+        if 0 <= index < len(self.messages) and self.messages[index] is message:
+            return index
+        return None
+    
+    def tokens_from(self, start: int) -> int:
+        """Get the tokens of the messages from start to the end"""
+        if start >= len(self.messages):
+            return 0
+        return self.total - self.messages[start].offset
+    
+    def fit(self, max_tokens: float, start: int = 0) -> int:
+        """
+        Get the first index at or after start from which the remaining
+        messages fit in max_tokens; len(self) if not even the last one fits.
+        """
+        return bisect_left(self.offsets, self.total - max_tokens, lo=start)
+    
+    def slice(self, start: int = 0) -> List[Message]:
+        """Get the messages from start to the end"""
+        return self.messages[start:]
@@ -0,0 +1,134 @@
+"""
+Import session workspaces written by earlier versions into the session database.
+
+Usage:
+    python -m core.memory.migrate [--workspace DIR] [--db PATH]
+
+Reads workspace/<session>/metadata.json, conversation.jsonl (or
+conversation.json) and thinking/*.json. Running it again is safe: sessions
+whose messages are already in the database are left alone, and thinking
+logs are replaced with the same content.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import sqlite3
+from typing import Dict, List, Any
+
+from config.settings import settings
+from core.memory.database import SessionDatabase, append_message, create_session, save_thinking_log
+
+logger = logging.getLogger(__name__)
+
+def _read_messages(session_dir: str) -> List[Dict[str, Any]]:
+    """Read a session's messages from whichever conversation file it has"""
+    jsonl_path = os.path.join(session_dir, "conversation.jsonl")
+    if os.path.exists(jsonl_path):
+        messages = []
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Torn or corrupt record
+        return messages
+    
+    for name in ("conversation.json", "conversation.json.migrated"):
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("messages", [])
+    return []
+
+def import_session(conn: sqlite3.Connection, session_id: str, session_dir: str) -> Dict[str, int]:
+    """Import one session directory; runs on the database writer"""
+    counts = {"messages": 0, "thinking_logs": 0}
+    
+    create_session(conn, session_id)
+    
+    existing = conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+    if not existing:
+        for seq, message in enumerate(_read_messages(session_dir)):
+            append_message(conn, session_id, message, seq=seq)
+            counts["messages"] += 1
+    
+    thinking_dir = os.path.join(session_dir, "thinking")
+    if os.path.isdir(thinking_dir):
+        for filename in sorted(os.listdir(thinking_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(thinking_dir, filename), 'r') as f:
+                    log = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Skipping thinking log {filename} of session {session_id}: {str(e)}")
+                continue
+            save_thinking_log(conn, session_id, filename[:-len(".json")], log)
+            counts["thinking_logs"] += 1
+    
+    # Last, since the inserts above mark the session as active now
+    metadata_path = os.path.join(session_dir, "metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        conn.execute(
+            "UPDATE sessions SET name = COALESCE(?, name), created_at = COALESCE(?, created_at), "
+            "last_active = COALESCE(?, last_active) WHERE id = ?",
+            (metadata.get("name"), metadata.get("created_at"), metadata.get("last_active"), session_id)
+        )
+    
+    return counts
+
+def migrate_workspace(db: SessionDatabase, workspace_dir: str) -> Dict[str, int]:
+    """
+    Import every session directory under a workspace.
+    
+    Returns:
+        Totals of imported sessions, messages and thinking logs
+    """
+    totals = {"sessions": 0, "messages": 0, "thinking_logs": 0, "failed": 0}
+    if not os.path.isdir(workspace_dir):
+        return totals
+    
+    for session_id in sorted(os.listdir(workspace_dir)):
+        session_dir = os.path.join(workspace_dir, session_id)
+        if not os.path.isdir(session_dir):
+            continue
+        
+        try:
+            # Each session is imported in its own transaction
+            counts = db.submit(import_session, session_id, session_dir).result()
+        except Exception as e:
+            logger.error(f"Error importing session {session_id}: {str(e)}")
+            totals["failed"] += 1
+            continue
+        
+        totals["sessions"] += 1
+        totals["messages"] += counts["messages"]
+        totals["thinking_logs"] += counts["thinking_logs"]
+        logger.info(f"Imported session {session_id}: {counts['messages']} messages, "
+                    f"{counts['thinking_logs']} thinking logs")
+    
+    return totals
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import session workspaces into the session database")
+    parser.add_argument("--workspace", default="workspace", help="Workspace directory (default: ./workspace)")
+    parser.add_argument("--db", default=settings.SESSION_DB_PATH, help="Session database path")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    db = SessionDatabase(args.db)
+    try:
+        totals = migrate_workspace(db, args.workspace)
+    finally:
+        db.close()
+    
+    print(f"Imported {totals['sessions']} sessions, {totals['messages']} messages and "
+          f"{totals['thinking_logs']} thinking logs into {args.db} ({totals['failed']} failed)")
+    return 1 if totals["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
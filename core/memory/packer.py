@@ -0,0 +1,151 @@
+import logging
+from typing import Dict, List, Optional, NamedTuple
+
+from config.settings import settings
+from core.memory.conversation import ConversationMemory
+from core.memory.tokens import TokenCounter, MESSAGE_OVERHEAD, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Sections sharing the budget left after the system prompt, in prompt order
+SECTION_PINNED = "pinned"
+SECTION_SUMMARY = "summary"
+SECTION_HISTORY = "history"
+SECTION_RETRIEVED = "retrieved"
+SECTION_TOOL = "tool"
+
+# Least room given to the current message when the other sections leave none
+MIN_TURN_TOKENS = 256
+
+class PackedContext(NamedTuple):
+    """The context for one answer call, fitted to the model's window"""
+    system_prompt: str
+    messages: Optional[List[Dict[str, str]]]  # Chat form, oldest first, current turn last
+    prompt: Optional[str]  # Flat form, when the chat API is not used
+    usage: Dict[str, int]  # Tokens used per section
+
+class ContextPacker:
+    """
+    Fits the system prompt, pinned facts, conversation summary, history,
+    retrieved memory and tool output into the model's context window.
+    
+    Pinned facts, the summary, retrieved memory and tool output may each
+    take up to their share of the budget and are truncated to fit; history
+    (the turns the summary does not cover) gets everything they leave
+    unused. The layout keeps what rarely changes first (system prompt,
+    pinned facts and summary, then the history window, which only moves
+    every few turns) and what changes every turn last (retrieved memory,
+    tool output and the current message), so the model server can reuse
+    its cached evaluation of the prefix.
+    """
+    
+    def __init__(self, token_counter: Optional[TokenCounter] = None, context_tokens: int = 8192,
+                 response_tokens: int = 1024, shares: Optional[Dict[str, float]] = None):
+        self.token_counter = token_counter or get_token_counter()
+        self.context_tokens = context_tokens
+        self.response_tokens = response_tokens
+        self.shares = shares if shares is not None else {
+            SECTION_PINNED: 0.1,
+            SECTION_SUMMARY: 0.1,
+            SECTION_RETRIEVED: 0.15,
+            SECTION_TOOL: 0.35
+        }
+    
+    def fit(self, text: str, max_tokens: int) -> str:
+        """Truncate a text to max_tokens, noting how much was cut"""
+        tokens = self.token_counter.count(text)
+        if tokens <= max_tokens:
+            return text
+        note = "\n[... {} more tokens truncated]"
+        kept = self.token_counter.truncate(text, max(0, max_tokens - self.token_counter.count(note.format(tokens))))
+        return kept + note.format(tokens - self.token_counter.count(kept))
+    
+    def _section(self, name: str, text: str, available: int, usage: Dict[str, int]) -> str:
+        """Fit an optional section into its share of the budget"""
+        if not text:
+            usage[name] = 0
+            return ""
+        text = self.fit(text, int(available * self.shares.get(name, 0.0)))
+        usage[name] = self.token_counter.count(text) + MESSAGE_OVERHEAD
+        return text
+    
+    def pack(self, memory: ConversationMemory, message: str, system_prompt: str,
+             tool_name: Optional[str] = None, tool_result: Optional[str] = None,
+             pinned: Optional[List[str]] = None, retrieved: Optional[List[str]] = None,
+             chat: bool = True) -> PackedContext:
+        """
+        Build the context for answering the latest message.
+        
+        Args:
+            memory: Conversation memory, whose last message is the one being answered
+            message: The user message being answered
+            system_prompt: Base system prompt
+            tool_name: Tool that produced tool_result
+            tool_result: Output of the tool used for this turn
+            pinned: Facts that must stay in view for the whole conversation
+            retrieved: Earlier context recalled for this message
+            chat: Build structured chat messages rather than one flat prompt
+        
+        Returns:
+            The packed context
+        """
+        usage: Dict[str, int] = {}
+        available = self.context_tokens - self.response_tokens
+        
+        facts = self._section(SECTION_PINNED, "\n".join(f"- {fact}" for fact in pinned or []), available, usage)
+        if facts:
+            system_prompt = f"{system_prompt}\n\nFacts to keep in mind:\n{facts}"
+        summary = self._section(SECTION_SUMMARY, memory.summary, available, usage)
+        if summary:
+            system_prompt = f"{system_prompt}\n\nSummary of the conversation so far:\n{summary}"
+        usage["system"] = (self.token_counter.count(system_prompt) + MESSAGE_OVERHEAD
+                           - usage[SECTION_PINNED] - usage[SECTION_SUMMARY])
+        available -= usage["system"] + usage[SECTION_PINNED] + usage[SECTION_SUMMARY]
+        
+        recalled = self._section(SECTION_RETRIEVED, "\n\n".join(retrieved or []), available, usage)
+        result = self._section(SECTION_TOOL, tool_result or "", available, usage)
+        
+        # The volatile sections follow the history, attached to the current turn
+        extra = ""
+        if recalled:
+            extra += f"\n\nRelevant earlier context:\n{recalled}"
+        if result:
+            extra += f"\n\nI used the {tool_name} tool and got the following information:\n{result}"
+        
+        history_budget = max(0, available - usage[SECTION_RETRIEVED] - usage[SECTION_TOOL])
+        if chat:
+            messages = memory.get_chat_messages(max_tokens=history_budget)
+            if not messages or messages[-1]["role"] != "user" or messages[-1]["content"] != message:
+                # The current turn was cut or left out to fit the budget; it
+                # is sent anyway, truncated if it has to be
+                history = memory.get_messages()
+                if messages and messages[-1]["role"] == "user" and history and history[-1].content == message:
+                    messages.pop()
+                turn = self.fit(message, max(history_budget - MESSAGE_OVERHEAD, MIN_TURN_TOKENS))
+                messages.append({"role": "user", "content": turn})
+            usage[SECTION_HISTORY] = sum(self.token_counter.count(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+            if extra:
+                messages[-1] = {"role": "user", "content": messages[-1]["content"] + extra}
+            prompt = None
+        else:
+            instruction = ("Based on all available information, I need to provide a comprehensive and helpful "
+                           f"response to the user's request: '{message}'")
+            history_budget -= self.token_counter.count(instruction)
+            context = memory.get_conversation_context(max_tokens=max(0, history_budget))
+            usage[SECTION_HISTORY] = self.token_counter.count(context)
+            prompt = f"{context}\n\n"
+            if extra:
+                prompt += f"{extra.strip()}\n\n"
+            prompt += instruction
+            messages = None
+        
+        logger.debug(f"Packed context for session {memory.session_id}: {usage}")
+        return PackedContext(system_prompt, messages, prompt, usage)
+
+def create_context_packer() -> ContextPacker:
+    """Create a context packer configured from settings"""
+    return ContextPacker(
+        context_tokens=settings.LLM_CONTEXT_TOKENS,
+        response_tokens=settings.LLM_RESPONSE_TOKENS,
+        shares=settings.CONTEXT_BUDGET_SHARES
+    )
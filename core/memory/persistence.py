@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindStore:
+    """
+    Write-behind persistence for small files rewritten as a whole.
+    
+    Callers hand over the new content of a file and return immediately; a
+    worker thread writes it out once it has not changed for debounce
+    seconds, so a file saved several times in a burst is written once with
+    its latest content. Every write goes to a temporary file that is
+    fsynced and renamed over the target, so a crash leaves either the old
+    or the new version, never a mix.
+    
+    At most max_pending files can wait to be written. Beyond that, saving
+    a new file from a worker thread waits for the worker to catch up, which
+    is counted in the "backpressure" metric. Code running on an event loop
+    is never blocked: its file is queued over the limit, counted in
+    "overflow", and the worker drains the queue without waiting out the
+    debounce until it is back under the limit.
+    """
+    
+    def __init__(self, debounce: float = 0.5, max_pending: int = 1000):
+        self.debounce = debounce
+        self.max_pending = max_pending
+        # path -> (content, first marked dirty, last marked dirty), oldest first
+        self.pending: "OrderedDict[str, Tuple[bytes, float, float]]" = OrderedDict()
+        self.writing: Optional[Tuple[str, bytes]] = None  # (path, content) being written
+        self.flushing = 0  # Threads waiting in flush(), which skip the debounce
+        self.closed = False
+        self.condition = threading.Condition()
+        self.counters = {"saves": 0, "coalesced": 0, "writes": 0, "errors": 0, "backpressure": 0, "overflow": 0}
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.worker.start()
+    
+    def save_bytes(self, path: str, content: bytes):
+        """Queue a file to be written with the given content"""
+        now = time.monotonic()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Write-behind store is closed")
+            
+            if path in self.pending:
+                _, first_dirty, _ = self.pending.pop(path)
+                self.counters["coalesced"] += 1
+            else:
+                first_dirty = now
+                if len(self.pending) >= self.max_pending:
+                    if _on_event_loop():
+                        self.counters["overflow"] += 1
+                    else:
+                        self.counters["backpressure"] += 1
+                        self.condition.wait_for(lambda: len(self.pending) < self.max_pending or self.closed)
+            
+            self.pending[path] = (content, first_dirty, now)
+            self.counters["saves"] += 1
+            self.condition.notify_all()
+    
+    def save_text(self, path: str, text: str):
+        """Queue a text file to be written"""
+        self.save_bytes(path, text.encode("utf-8"))
+    
+    def save_json(self, path: str, data: Any):
+        """
+        Queue a JSON file to be written.
+        
+        The data is serialized right away, so the caller may keep changing
+        it afterwards.
+        """
+        self.save_bytes(path, json.dumps(data, indent=2).encode("utf-8"))
+    
+    def read_bytes(self, path: str) -> Optional[bytes]:
+        """Read a file, including content still waiting to be written"""
+        with self.condition:
+            entry = self.pending.get(path)
+            if entry is not None:
+                return entry[0]
+            # Popped from pending but not yet renamed into place
+            if self.writing is not None and self.writing[0] == path:
+                return self.writing[1]
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+    
+    def read_text(self, path: str) -> Optional[str]:
+        """Read a text file, including content still waiting to be written"""
+        content = self.read_bytes(path)
+        return content.decode("utf-8") if content is not None else None
+    
+    def _next_due(self) -> Tuple[Optional[str], float]:
+        """Get the next file due for writing, or how long to wait for one"""
+        now = time.monotonic()
+        # A full queue is drained without waiting, so savers are not held up for long
+        hurry = self.flushing or self.closed or len(self.pending) >= self.max_pending
+        wait = self.debounce
+        for path, (_, _, last_dirty) in self.pending.items():
+            due_in = last_dirty + self.debounce - now
+            if due_in <= 0 or hurry:
+                return path, 0.0
+            wait = min(wait, due_in)
+        return None, wait
+    
+    def _run(self):
+        """Worker loop: write each file once its debounce window has passed"""
+        while True:
+            with self.condition:
+                path, wait = self._next_due()
+                while path is None:
+                    if self.closed:
+                        return
+                    self.condition.wait(wait if self.pending else None)
+                    path, wait = self._next_due()
+                
+                content, first_dirty, _ = self.pending.pop(path)
+                self.writing = (path, content)
+                self.condition.notify_all()  # A slot is free
+            
+            try:
+                self._write(path, content)
+                self.counters["writes"] += 1
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error(f"Error writing {path}: {str(e)}")
+            
+            lag = time.monotonic() - first_dirty
+            with self.condition:
+                self.writing = None
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.condition.notify_all()
+    
+    @staticmethod
+    def _write(path: str, content: bytes):
+        """Replace a file atomically through a temporary file"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Write everything pending now, ignoring the debounce window.
+        
+        Returns:
+            True if everything was written within timeout
+        """
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            try:
+                return self.condition.wait_for(lambda: not self.pending and self.writing is None, timeout)
+            finally:
+                self.flushing -= 1
+    
+    def close(self, timeout: Optional[float] = None):
+        """Write everything pending and stop the worker"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get write counters and how far behind the worker is"""
+        now = time.monotonic()
+        with self.condition:
+            oldest = min((first_dirty for _, first_dirty, _ in self.pending.values()), default=None)
+            return {
+                **self.counters,
+                "pending": len(self.pending),
+                "max_pending": self.max_pending,
+                "oldest_pending_seconds": now - oldest if oldest is not None else 0.0,
+                "last_lag_seconds": self.last_lag,
+                "max_lag_seconds": self.max_lag
+            }
+
+def _on_event_loop() -> bool:
+    """Check whether the calling thread is running an event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+# Shared store for the whole process
+_store: Optional[WriteBehindStore] = None
+
+def get_write_behind() -> WriteBehindStore:
+    """Get the shared write-behind store configured in settings"""
+    global _store
+    
+    if _store is None:
+        _store = WriteBehindStore(
+            debounce=settings.PERSIST_DEBOUNCE_SECONDS,
+            max_pending=settings.PERSIST_MAX_PENDING
+        )
+    return _store
+
+def flush_write_behind(timeout: Optional[float] = None) -> bool:
+    """Write out everything the shared store has pending"""
+    return _store.flush(timeout) if _store is not None else True
+
+def close_write_behind():
+    """Write out everything pending and stop the shared store"""
+    global _store
+    
+    if _store is not None:
+        _store.close()
+        _store = None
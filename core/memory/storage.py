@@ -3,11 +3,16 @@ import json
 import logging
 from typing import Dict, List, Any, Optional
 
+from core.memory.persistence import get_write_behind
+
 logger = logging.getLogger(__name__)
 
 class StorageManager:
     """
     Manages persistent storage of data for the agent.
+    
+    Saves are handed to the shared write-behind store and written out in
+    the background; loads see saved data even before it reaches the disk.
     """
     
     def __init__(self, session_id: str):
@@ -29,14 +34,13 @@ class StorageManager:
         """
         try:
             filepath = os.path.join(self.base_dir, f"{filename}.json")
-            with open(filepath, 'w') as f:
-                json.dump(data, f, indent=2)
+            get_write_behind().save_json(filepath, data)
             return True
         except Exception as e:
             logger.error(f"Error saving data to {filename}: {str(e)}")
             return False
     
- def load_data(self, filename: str) -> Optional[Dict]:
+    def load_data(self, filename: str) -> Optional[Dict]:
         """
         Load data from a JSON file.
         
@@ -48,11 +52,8 @@ class StorageManager:
         """
         try:
             filepath = os.path.join(self.base_dir, f"{filename}.json")
-            if not os.path.exists(filepath):
-                return None
-                
-            with open(filepath, 'r') as f:
-                return json.load(f)
+            content = get_write_behind().read_text(filepath)
+            return json.loads(content) if content is not None else None
         except Exception as e:
             logger.error(f"Error loading data from {filename}: {str(e)}")
             return None
@@ -70,8 +71,7 @@ class StorageManager:
         """
         try:
             filepath = os.path.join(self.base_dir, f"{filename}.txt")
-            with open(filepath, 'w') as f:
-                f.write(text)
+            get_write_behind().save_text(filepath, text)
             return True
         except Exception as e:
             logger.error(f"Error saving text to {filename}: {str(e)}")
@@ -89,11 +89,7 @@ class StorageManager:
         """
         try:
             filepath = os.path.join(self.base_dir, f"{filename}.txt")
-            if not os.path.exists(filepath):
-                return None
-                
-            with open(filepath, 'r') as f:
-                return f.read()
+            return get_write_behind().read_text(filepath)
         except Exception as e:
             logger.error(f"Error loading text from {filename}: {str(e)}")
             return None
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from config.constants import PRIORITY_BACKGROUND, STAGE_SUMMARY
+from core.llm.base import is_error_response
+from core.memory.conversation import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = """
+You maintain a running summary of a conversation between a user and SparkyAI, an assistant.
+Merge the new turns into the existing summary. Keep facts, decisions, names, preferences,
+open questions and anything the user asked to remember; drop greetings and filler.
+Write plain prose or short bullet points, no preamble.
+"""
+
+class ConversationSummarizer:
+    """
+    Folds older turns of a conversation into a running summary in the background.
+    
+    Once the turns not yet summarized exceed trigger_tokens, or are about to
+    be trimmed by max_history, everything but the last keep_turns turns is
+    merged into the summary by a background-priority LLM call. The user's
+    turn never waits for it: the prompt keeps using the old summary and the
+    full recent turns until the new summary is ready.
+    """
+    
+    def __init__(self, llm, trigger_tokens: int = 2000, keep_turns: int = 3,
+                 summary_tokens: int = 400, message_tokens: int = 500):
+        self.llm = llm
+        self.trigger_tokens = trigger_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.message_tokens = message_tokens  # Cap per message in the summarization prompt
+        self.task: Optional[asyncio.Task] = None
+    
+    def _foldable(self, memory: ConversationMemory) -> List[Dict]:
+        """Get the unsummarized messages older than the turns to keep verbatim"""
+        messages = memory.get_unsummarized_messages()
+        keep = self.keep_turns * 2
+        return messages[:-keep] if len(messages) > keep else []
+    
+    def needs_summary(self, memory: ConversationMemory) -> bool:
+        """Check whether the unsummarized part of a conversation is due for folding"""
+        if not self._foldable(memory):
+            return False
+        
+        messages = memory.get_unsummarized_messages()
+        # add_message trims down to this many messages
+        trimmed_to = memory.max_history - max(1, memory.max_history // 4)
+        return memory.unsummarized_tokens() > self.trigger_tokens or len(messages) >= trimmed_to
+    
+    def schedule(self, memory: ConversationMemory) -> Optional[asyncio.Task]:
+        """Start summarizing in the background if it is due and not already running"""
+        if self.task is not None and not self.task.done():
+            return None
+        if not self.needs_summary(memory):
+            return None
+        
+        self.task = asyncio.create_task(self.summarize(memory))
+        return self.task
+    
+    async def summarize(self, memory: ConversationMemory) -> bool:
+        """
+        Fold the older unsummarized turns into the summary.
+        
+        Returns:
+            True if the summary was updated
+        """
+        messages = self._foldable(memory)
+        if not messages:
+            return False
+        
+        try:
+            transcript = "\n\n".join(
+                f"{message['role'].capitalize()}: "
+                f"{memory.token_counter.truncate(message['content'], self.message_tokens)}"
+                for message in messages
+            )
+            prompt = (f"Existing summary:\n{memory.summary or '(none yet)'}\n\n"
+                      f"New turns:\n{transcript}\n\nUpdated summary:")
+            
+            summary = await self.llm.generate(
+                prompt,
+                system_prompt=SUMMARY_SYSTEM_PROMPT,
+                temperature=0.2,
+                max_tokens=self.summary_tokens,
+                stage=STAGE_SUMMARY,
+                priority=PRIORITY_BACKGROUND,
+                session_id=memory.session_id
+            )
+            
+            if is_error_response(summary):
+                logger.warning(f"Could not summarize session {memory.session_id}: {summary}")
+                return False
+            
+            memory.update_summary(summary.strip(), messages[-1])
+            logger.info(f"Folded {len(messages)} messages into the summary for session {memory.session_id}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            return False
@@ -0,0 +1,141 @@
+import os
+import logging
+from typing import Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Tokens taken by the role and separators around each message
+MESSAGE_OVERHEAD = 4
+
+class TokenCounter:
+    """
+    Counts and truncates text in the tokens of one model.
+    
+    This base class is the character heuristic used when no tokenizer is
+    available; subclasses wrap real tokenizers.
+    """
+    
+    name = "heuristic"
+    
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+    
+    def count(self, text: str) -> int:
+        """Count the tokens in a text"""
+        if not text:
+            return 0
+        return max(1, int(len(text) / self.chars_per_token + 0.5))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut a text down to at most max_tokens tokens"""
+        return text[:int(max(0, max_tokens) * self.chars_per_token)]
+
+class TiktokenCounter(TokenCounter):
+    """Token counter for OpenAI models using tiktoken"""
+    
+    name = "tiktoken"
+    
+    def __init__(self, model: str):
+        import tiktoken
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Models tiktoken does not know yet use the current encoding
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+    
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=())) if text else 0
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max(0, max_tokens)])
+
+class HuggingFaceCounter(TokenCounter):
+    """Token counter using a local Hugging Face tokenizer.json file"""
+    
+    name = "huggingface"
+    
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(path)
+    
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids) if text else 0
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.tokenizer.encode(text, add_special_tokens=False).ids
+        return self.tokenizer.decode(ids[:max(0, max_tokens)])
+
+class SentencePieceCounter(TokenCounter):
+    """Token counter using a local SentencePiece .model file"""
+    
+    name = "sentencepiece"
+    
+    def __init__(self, path: str):
+        import sentencepiece
+        self.processor = sentencepiece.SentencePieceProcessor(model_file=path)
+    
+    def count(self, text: str) -> int:
+        return len(self.processor.encode(text)) if text else 0
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return self.processor.decode(self.processor.encode(text)[:max(0, max_tokens)])
+
+def create_token_counter(kind: str = "auto", path: Optional[str] = None, model: Optional[str] = None,
+                         chars_per_token: float = 4.0) -> TokenCounter:
+    """
+    Create a token counter, falling back to the character heuristic.
+    
+    Args:
+        kind: "tiktoken", "huggingface", "sentencepiece", "heuristic", or
+              "auto" to pick tiktoken for OpenAI and the tokenizer file at
+              path (by its extension) for Llama
+        path: Local tokenizer file for "huggingface" / "sentencepiece"
+        model: OpenAI model name for "tiktoken"
+        chars_per_token: Ratio used by the heuristic
+    
+    Returns:
+        The token counter
+    """
+    if kind == "auto":
+        if settings.USE_OPENAI and settings.OPENAI_API_KEY:
+            kind = "tiktoken"
+        elif path:
+            kind = "sentencepiece" if path.endswith(".model") else "huggingface"
+        else:
+            kind = "heuristic"
+    
+    try:
+        if kind == "tiktoken":
+            return TiktokenCounter(model or settings.OPENAI_MODEL)
+        if kind in ("huggingface", "sentencepiece"):
+            if not path or not os.path.exists(path):
+                raise FileNotFoundError(f"tokenizer file not found: {path}")
+            return HuggingFaceCounter(path) if kind == "huggingface" else SentencePieceCounter(path)
+        if kind != "heuristic":
+            logger.warning(f"Unknown tokenizer '{kind}', estimating tokens from characters")
+    
+    except ImportError as e:
+        logger.warning(f"Tokenizer '{kind}' is not installed ({str(e)}), estimating tokens from characters")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer '{kind}': {str(e)}, estimating tokens from characters")
+    
+    return TokenCounter(chars_per_token)
+
+# Shared counter, loaded on first use
+_token_counter: Optional[TokenCounter] = None
+
+def get_token_counter() -> TokenCounter:
+    """Get the token counter configured in settings"""
+    global _token_counter
+    
+    if _token_counter is None:
+        _token_counter = create_token_counter(
+            settings.TOKENIZER,
+            path=settings.TOKENIZER_PATH or None,
+            chars_per_token=settings.TOKENIZER_CHARS_PER_TOKEN
+        )
+        logger.info(f"Counting tokens with the {_token_counter.name} tokenizer")
+    return _token_counter
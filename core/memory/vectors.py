@@ -0,0 +1,239 @@
+import os
+import json
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class VectorStore:
+    """
+    Append-only store of unit-length float32 vectors with metadata.
+    
+    Vectors are appended as raw float32 rows to vectors.f32 and their
+    metadata as JSON lines to vectors.jsonl. The vector file is memory-
+    mapped for search, so loading a session costs nothing up front and the
+    OS page cache holds only the rows that are actually touched.
+    
+    Every method does blocking file I/O; async code calls them from a
+    worker thread (see VectorMemory).
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.metadata_path = os.path.join(directory, "vectors.jsonl")
+        self.dimension: Optional[int] = None
+        self.metadata: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None  # Memory map, reopened after appends
+    
+    def load(self):
+        """
+        Read the metadata and check it against the vector file.
+        
+        A crash can tear the last record of either file or leave one file a
+        record ahead of the other. Both are cut back to the entries that are
+        complete in both, so later appends stay aligned.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.metadata_path) or not os.path.exists(self.vectors_path):
+            return
+        
+        try:
+            torn = False
+            with open(self.metadata_path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        self.metadata.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        torn = True
+                        break
+            
+            if not self.metadata:
+                self.dimension = None
+                self._rewrite(0)
+                return
+            
+            self.dimension = self.metadata[0]["dimension"]
+            size = os.path.getsize(self.vectors_path)
+            row_size = 4 * self.dimension
+            rows = min(size // row_size, len(self.metadata))
+            if torn or rows != len(self.metadata) or size != rows * row_size:
+                logger.warning(f"Vector store {self.vectors_path} holds {size} bytes for "
+                               f"{len(self.metadata)} entries, keeping the first {rows}")
+                self.metadata = self.metadata[:rows]
+                self._rewrite(rows)
+        
+        except Exception as e:
+            logger.error(f"Error loading vector store: {str(e)}")
+            self.metadata = []
+            self.dimension = None
+    
+    def _rewrite(self, rows: int):
+        """Cut both files back to the first rows entries"""
+        with open(self.vectors_path, 'r+b') as f:
+            f.truncate(rows * 4 * self.dimension if rows else 0)
+        with open(self.metadata_path, 'w') as f:
+            for entry in self.metadata:
+                f.write(json.dumps(entry) + "\n")
+    
+    def __len__(self) -> int:
+        return len(self.metadata)
+    
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]) -> bool:
+        """
+        Append a vector and its metadata.
+        
+        Returns:
+            False if the vector does not match the store's dimension
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return False
+        if self.dimension is None:
+            self.dimension = vector.shape[0]
+        elif vector.shape[0] != self.dimension:
+            logger.warning(f"Ignoring {vector.shape[0]}-dimensional vector in a {self.dimension}-dimensional store")
+            return False
+        
+        # Stored normalized so cosine similarity is a plain dot product
+        with open(self.vectors_path, 'ab') as f:
+            f.write((vector / norm).tobytes())
+        entry = {**entry, "dimension": self.dimension}
+        with open(self.metadata_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        
+        self.metadata.append(entry)
+        self._matrix = None
+        return True
+    
+    def _vectors(self) -> Optional[np.ndarray]:
+        """Get the stored vectors as an (n, dimension) memory-mapped array"""
+        if not self.metadata:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != len(self.metadata):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                     shape=(len(self.metadata), self.dimension))
+        return self._matrix
+    
+    def search(self, vector: np.ndarray, k: int = 3, exclude: Optional[Set[int]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Find the stored vectors most similar to a query vector.
+        
+        Args:
+            vector: Query vector
+            k: Number of results
+            exclude: Row indexes to leave out
+        
+        Returns:
+            (cosine similarity, metadata) pairs, most similar first
+        """
+        matrix = self._vectors()
+        if matrix is None or k <= 0:
+            return []
+        
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0 or query.shape[0] != self.dimension:
+            return []
+        
+        scores = np.asarray(matrix @ (query / norm))
+        if exclude:
+            scores[list(exclude)] = -np.inf
+        
+        # argpartition finds the top k in linear time; only those get sorted
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.metadata[i]) for i in top if np.isfinite(scores[i])]
+
+class VectorMemory:
+    """
+    Semantic memory of one session: every message and tool result is
+    embedded and kept in a VectorStore, so relevant old turns can be
+    recalled long after they have left the prompt.
+    
+    The store is loaded, appended to and searched in a worker thread, one
+    operation at a time, so the event loop never waits on its files.
+    """
+    
+    def __init__(self, session_id: str, embedder, min_score: float = 0.35):
+        self.session_id = session_id
+        self.embedder = embedder
+        self.min_score = min_score
+        self.store = VectorStore(os.path.join("workspace", session_id))
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self.pending: Set[asyncio.Task] = set()
+        self._last_query: Optional[Tuple[str, np.ndarray]] = None  # Reused when the query is remembered
+    
+    async def _run(self, operation, *args):
+        """Run a store operation in a worker thread, loading the store first"""
+        async with self.lock:
+            if not self.loaded:
+                await asyncio.to_thread(self.store.load)
+                self.loaded = True
+            return await asyncio.to_thread(operation, *args)
+    
+    async def remember(self, text: str, role: str, kind: str = "message",
+                       timestamp: Optional[str] = None) -> bool:
+        """Embed a text and add it to the store"""
+        if not text or not text.strip():
+            return False
+        
+        if self._last_query is not None and self._last_query[0] == text:
+            vector = self._last_query[1]
+        else:
+            vector = await self.embedder.embed(text)
+        if vector is None:
+            return False
+        
+        return await self._run(self.store.add, vector, {
+            "role": role,
+            "kind": kind,
+            "text": text,
+            "timestamp": timestamp or datetime.now().isoformat()
+        })
+    
+    def remember_later(self, text: str, role: str, kind: str = "message", timestamp: Optional[str] = None):
+        """Embed and store a text in the background"""
+        task = asyncio.create_task(self.remember(text, role, kind, timestamp))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+    
+    async def recall(self, query: str, k: int = 3, before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find the stored texts most relevant to a query.
+        
+        Args:
+            query: Text to match, usually the user's message
+            k: Maximum number of results
+            before: Only recall messages older than this ISO timestamp, so
+                    turns still in the prompt are not repeated; tool
+                    results are recalled regardless
+        
+        Returns:
+            Metadata entries (role, kind, text, timestamp, score), most relevant first
+        """
+        if self.loaded and len(self.store) == 0:
+            return []
+        
+        vector = await self.embedder.embed(query)
+        if vector is None:
+            return []
+        self._last_query = (query, vector)
+        
+        results = await self._run(self._search, vector, k, before)
+        return [{**entry, "score": score} for score, entry in results if score >= self.min_score]
+    
+    def _search(self, vector: np.ndarray, k: int, before: Optional[str]) -> List[Tuple[float, Dict[str, Any]]]:
+        exclude = None
+        if before:
+            exclude = {index for index, entry in enumerate(self.store.metadata)
+                       if entry["kind"] == "message" and entry["timestamp"] >= before}
+        return self.store.search(vector, k, exclude)
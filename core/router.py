@@ -0,0 +1,147 @@
+import re
+import logging
+from typing import Dict, Any, Optional, NamedTuple
+
+from config.constants import TOOL_BROWSER, TOOL_SEARCH, TOOL_CODE
+
+logger = logging.getLogger(__name__)
+
+URL_PATTERN = re.compile(r"\b(?:https?://|www\.)[^\s<>\"'`]+", re.IGNORECASE)
+CODE_FENCE_PATTERN = re.compile(r"```[ \t]*([\w+-]*)[ \t]*\n(.*?)```", re.DOTALL)
+INLINE_CODE_PATTERN = re.compile(r"`([^`\n]+)`")
+# A message that opens by asking to run something, e.g. "Please run this:"
+RUN_REQUEST_PATTERN = re.compile(
+    r"^\s*(?:(?:can|could|would) you\s+|please\s+)*(?:run|execute|evaluate|eval)\b",
+    re.IGNORECASE
+)
+
+# Phrases asking for a web search; the remainder of the message is the query
+SEARCH_PATTERN = re.compile(
+    r"^\s*(?:(?:can|could|would) you\s+|please\s+)*"
+    r"(?:search(?: the web| online| google)?(?: for)?|google|look up|lookup|find (?:me )?(?:info(?:rmation)? )?(?:on|about)"
+    r"|what(?:'s| is) the latest(?: news)?(?: on| about)?)\s+(.+)$",
+    re.IGNORECASE
+)
+# Topics that need fresh information even without an explicit search phrase
+FRESHNESS_PATTERN = re.compile(
+    r"\b(latest|breaking news|news (?:about|on)|today'?s|this week'?s|current (?:price|weather|score)"
+    r"|weather (?:in|for|today)|stock price|exchange rate|who won)\b",
+    re.IGNORECASE
+)
+
+SMALL_TALK_PATTERN = re.compile(
+    r"^\s*(?:hi|hello|hey|hiya|yo|howdy|good (?:morning|afternoon|evening|night)"
+    r"|thanks?(?: you)?(?: (?:so|very) much)?|thx|ty|cheers|ok(?:ay)?|cool|nice|great|awesome|got it"
+    r"|sounds good|bye|goodbye|see you|see ya|how are you(?: doing)?(?: today)?|what'?s up|sup"
+    r"|who are you|what are you|what can you do)"
+    r"(?:[\s,]+(?:sparky(?:ai)?|there|again|buddy|mate))?\s*[.!?]*\s*$",
+    re.IGNORECASE
+)
+
+# Python is the only language the code tool can execute
+PYTHON_FENCES = ("python", "py", "python3")
+
+class RouteDecision(NamedTuple):
+    """A confident tool choice made without the LLM"""
+    tool: Optional[str]  # None means no tool is needed
+    tool_input: Optional[str]
+    path: str  # Which rule fired, for the counters
+
+class ToolRouter:
+    """
+    Cheap rule-based router run before the tool-selection LLM call.
+    
+    It only answers when a rule is confident; anything else returns None
+    and the caller falls back to asking the LLM. Counters record how often
+    each path fires so the share of messages skipping the LLM is visible.
+    """
+    
+    def __init__(self):
+        self.counters: Dict[str, int] = {
+            "url": 0,
+            "code_fence": 0,
+            "search": 0,
+            "small_talk": 0,
+            "llm": 0,
+            "llm_unparsed": 0
+        }
+    
+    def route(self, message: str) -> Optional[RouteDecision]:
+        """
+        Pick a tool for a message using rules only.
+        
+        Args:
+            message: The user message
+        
+        Returns:
+            The decision, or None if the rules are not confident
+        """
+        if CODE_FENCE_PATTERN.search(message) or INLINE_CODE_PATTERN.search(message):
+            # Code may be there to be explained or fixed rather than run, and
+            # a URL or search phrase inside it means nothing
+            decision = self._match_code(message)
+        else:
+            decision = (self._match_url(message) or self._match_small_talk(message)
+                        or self._match_search(message))
+        
+        if decision is not None:
+            self.counters[decision.path] += 1
+            logger.debug(f"Routed message by rule '{decision.path}' to {decision.tool or 'no tool'}")
+        return decision
+    
+    def record_llm(self, parsed: bool = True):
+        """Count a routing decision that needed the LLM"""
+        self.counters["llm"] += 1
+        if not parsed:
+            self.counters["llm_unparsed"] += 1
+    
+    def _match_code(self, message: str) -> Optional[RouteDecision]:
+        """An explicit request to run code in a python-tagged fence"""
+        if not RUN_REQUEST_PATTERN.match(message):
+            return None
+        
+        match = CODE_FENCE_PATTERN.search(message)
+        if not match or match.group(1).lower() not in PYTHON_FENCES:
+            # Untagged fences hold tracebacks and shell commands as often as
+            # Python; let the LLM decide
+            return None
+        return RouteDecision(TOOL_CODE, match.group(2).strip(), "code_fence")
+    
+    def _match_url(self, message: str) -> Optional[RouteDecision]:
+        """A URL in the message means the browser should open it"""
+        match = URL_PATTERN.search(message)
+        if not match:
+            return None
+        url = match.group(0).rstrip(".,;:!?)]}")
+        return RouteDecision(TOOL_BROWSER, url, "url")
+    
+    def _match_small_talk(self, message: str) -> Optional[RouteDecision]:
+        """Greetings, thanks and similar need no tool"""
+        if len(message) <= 60 and SMALL_TALK_PATTERN.match(message):
+            return RouteDecision(None, None, "small_talk")
+        return None
+    
+    def _match_search(self, message: str) -> Optional[RouteDecision]:
+        """Explicit search requests and questions about fresh information"""
+        match = SEARCH_PATTERN.match(message)
+        if match:
+            query = match.group(1).strip().rstrip("?.!")
+            if query:
+                return RouteDecision(TOOL_SEARCH, query, "search")
+        
+        if FRESHNESS_PATTERN.search(message) and len(message) <= 200:
+            return RouteDecision(TOOL_SEARCH, message.strip().rstrip("?.!"), "search")
+        
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get how often each routing path fired"""
+        total = sum(count for path, count in self.counters.items() if path != "llm_unparsed")
+        return {
+            **self.counters,
+            "total": total,
+            "rule_rate": (total - self.counters["llm"]) / total if total else 0.0
+        }
+
+# Shared by every agent so the counters cover the whole process
+tool_router = ToolRouter()
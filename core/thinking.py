@@ -1,11 +1,12 @@
 import time
-import os
-import json
 import logging
 import asyncio
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+from core.memory import database
+from core.memory.database import get_session_db
+
 logger = logging.getLogger(__name__)
 
 class ThinkingStep:
@@ -37,8 +38,7 @@ class ThinkingProcess:
         self.steps: List[ThinkingStep] = []
         self.in_progress = True
         self.start_time = time.time()
-        self.log_dir = os.path.join("workspace", session_id, "thinking")
-        os.makedirs(self.log_dir, exist_ok=True)
+        self.log_id = f"thinking_{int(self.start_time)}"
         logger.info(f"Initialized thinking process for session {session_id}")
     
     async def add_thinking(self, content: str, data: Dict = None) -> str:
@@ -72,7 +72,7 @@ class ThinkingProcess:
     async def complete(self):
         """Mark the thinking process as complete"""
         self.in_progress = False
-        await self._save_to_file()
+        await self._save()
         await self._notify_complete()
     
     async def _notify_update(self, step: ThinkingStep):
@@ -95,21 +95,16 @@ class ThinkingProcess:
                 "session_id": self.session_id
             })
     
-    async def _save_to_file(self):
-        """Save thinking process to file"""
+    async def _save(self):
+        """Save thinking process to the session database"""
         try:
-            filename = f"thinking_{int(self.start_time)}.json"
-            path = os.path.join(self.log_dir, filename)
+            await get_session_db().write(database.save_thinking_log, self.session_id, self.log_id, {
+                "start_time": self.start_time,
+                "end_time": time.time(),
+                "steps": [step.to_dict() for step in self.steps]
+            })
             
-            with open(path, 'w') as f:
-                json.dump({
-                    "session_id": self.session_id,
-                    "start_time": self.start_time,
-                    "end_time": time.time(),
-                    "steps": [step.to_dict() for step in self.steps]
-                }, f, indent=2)
-                
-            logger.info(f"Saved thinking process to {path}")
+            logger.info(f"Saved thinking process {self.log_id} of session {self.session_id}")
             
         except Exception as e:
             logger.error(f"Error saving thinking process: {str(e)}")
\ No newline at end of file
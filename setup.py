@@ -14,6 +14,7 @@ setup(
         "websockets>=11.0.2",
         "httpx>=0.24.0",
         "beautifulsoup4>=4.12.0",
+        "numpy>=1.24.0",
         "Pillow>=9.5.0",
     ],
     python_requires=">=3.9",
@@ -5,6 +5,12 @@ document.addEventListener('DOMContentLoaded', function() {
     // Global variables
     window.sessionId = null;
     window.messageCount = 0;
+    window.lastSeq = null; // Sequence number of the last stored message shown
+    window.historyEpoch = null; // Times the history was cleared when lastSeq was read
+    window.historyEtag = null;
+
+    // Messages fetched per page of chat history
+    const HISTORY_PAGE_SIZE = 50;
 
     // DOM elements
     const appContainer = document.querySelector('.app-container');
@@ -185,6 +191,14 @@ document.addEventListener('DOMContentLoaded', function() {
         // Connection status updates
         window.addEventListener('online', updateConnectionStatus);
         window.addEventListener('offline', updateConnectionStatus);
+        
+        // Catch up on messages added while disconnected or in another tab
+        window.addEventListener('online', () => syncChatHistory());
+        document.addEventListener('visibilitychange', function() {
+            if (document.visibilityState === 'visible') {
+                syncChatHistory();
+            }
+        });
     }
 
     // Create a new chat session
@@ -220,6 +234,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 // Reset message count
                 window.messageCount = 1;
+                window.lastSeq = null;
+                window.historyEpoch = null;
+                window.historyEtag = null;
                 
                 // Load chat list
                 loadChatsList();
@@ -273,6 +290,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Update message count
                 window.messageCount += 2; // User + Assistant
                 
+                // Move the history cursor past the messages just shown
+                syncChatHistory(false);
+                
                 // Update chat list if needed
                 if (window.messageCount === 3) { // After first exchange
                     loadChatsList();
@@ -289,7 +309,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Add a message to the UI
-    function addMessage(role, content) {
+    function addMessage(role, content, before = null) {
         if (!messagesContainer) return;
         
         const messageDiv = document.createElement('div');
@@ -307,10 +327,16 @@ document.addEventListener('DOMContentLoaded', function() {
         messageContent.innerHTML = processedContent;
         
         messageDiv.appendChild(messageContent);
-        messagesContainer.appendChild(messageDiv);
         
-        // Scroll to bottom
-        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        if (before) {
+            // Older history goes above what is already shown
+            messagesContainer.insertBefore(messageDiv, before);
+        } else {
+            messagesContainer.appendChild(messageDiv);
+            
+            // Scroll to bottom
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
         
         // Highlight code blocks if highlight.js is available
         if (window.hljs) {
@@ -350,12 +376,40 @@ document.addEventListener('DOMContentLoaded', function() {
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     }
 
+    // Fetch a page of the current session's messages
+    function fetchMessages(params, etag = null) {
+        const headers = etag ? { 'If-None-Match': etag } : {};
+        return fetch(`/api/sessions/${window.sessionId}/messages?${new URLSearchParams(params)}`, { headers })
+            .then(response => {
+                if (response.status === 304) {
+                    return null; // Nothing new
+                }
+                if (!response.ok) {
+                    throw new Error('Failed to load chat history');
+                }
+                window.historyEtag = response.headers.get('ETag');
+                return response.json();
+            });
+    }
+
+    // Add the user and assistant messages of a page of history
+    function showMessages(messages, before = null) {
+        messages.forEach(message => {
+            if (message.role === 'user' || message.role === 'assistant') {
+                addMessage(message.role, message.content, before);
+            }
+        });
+    }
+
     // Load chat history
     function loadChatHistory() {
         if (!window.sessionId || !messagesContainer) return;
         
         // Clear messages
         messagesContainer.innerHTML = '';
+        window.lastSeq = null;
+        window.historyEpoch = null;
+        window.historyEtag = null;
         
         // Show loading indicator
         const loadingDiv = document.createElement('div');
@@ -363,26 +417,21 @@ document.addEventListener('DOMContentLoaded', function() {
         loadingDiv.textContent = 'Loading chat history...';
         messagesContainer.appendChild(loadingDiv);
         
-        // Load history from conversation file
-        fetch(`/workspace/${window.sessionId}/conversation.json`)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Failed to load chat history');
-                }
-                return response.json();
-            })
+        // Load the latest page of history
+        fetchMessages({ limit: HISTORY_PAGE_SIZE })
             .then(data => {
                 // Remove loading indicator
                 loadingDiv.remove();
+                window.historyEpoch = data.epoch;
                 
                 if (data.messages && data.messages.length > 0) {
-                    data.messages.forEach(message => {
-                        if (message.role === 'user' || message.role === 'assistant') {
-                            addMessage(message.role, message.content);
-                        }
-                    });
+                    showMessages(data.messages);
+                    window.lastSeq = data.last_seq;
+                    window.messageCount = data.message_count;
                     
-                    window.messageCount = data.messages.length;
+                    if (data.has_more) {
+                        addLoadEarlierButton(data.messages[0].seq);
+                    }
                 } else {
                     // No messages, add welcome
                     addMessage('assistant', 'Hello! I am SparkyAI, your AI assistant. How can I help you today?');
@@ -405,6 +454,92 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // Offer to load the messages before a sequence number
+    function addLoadEarlierButton(beforeSeq) {
+        const button = document.createElement('button');
+        button.classList.add('load-earlier');
+        button.textContent = 'Load earlier messages';
+        messagesContainer.insertBefore(button, messagesContainer.firstChild);
+        
+        button.addEventListener('click', function() {
+            const sessionId = window.sessionId;
+            button.disabled = true;
+            
+            fetchMessages({ before: beforeSeq, limit: HISTORY_PAGE_SIZE })
+                .then(data => {
+                    if (sessionId !== window.sessionId) return; // Switched chats meanwhile
+                    button.remove();
+                    
+                    // Keep the view where it was while content is added above it
+                    const fromBottom = messagesContainer.scrollHeight - messagesContainer.scrollTop;
+                    showMessages(data.messages, messagesContainer.firstChild);
+                    messagesContainer.scrollTop = messagesContainer.scrollHeight - fromBottom;
+                    
+                    if (data.has_more) {
+                        addLoadEarlierButton(data.messages[0].seq);
+                    }
+                })
+                .catch(error => {
+                    console.error('Error loading earlier messages:', error);
+                    button.disabled = false;
+                });
+        });
+    }
+
+    // Fetch only the messages added since the last one shown
+    function syncChatHistory(show = true) {
+        if (!window.sessionId || !messagesContainer || window.lastSeq === null) {
+            if (window.sessionId && !show) {
+                loadHistoryCursor();
+            }
+            return;
+        }
+        
+        const sessionId = window.sessionId;
+        const params = { since: window.lastSeq, limit: 500 };
+        if (window.historyEpoch !== null && window.historyEpoch !== undefined) {
+            params.epoch = window.historyEpoch;
+        }
+        fetchMessages(params, window.historyEtag)
+            .then(data => {
+                if (!data || sessionId !== window.sessionId) return;
+                
+                if (data.reset) {
+                    // The history was cleared meanwhile
+                    loadChatHistory();
+                    return;
+                }
+                
+                if (show) {
+                    showMessages(data.messages);
+                }
+                if (data.messages.length > 0) {
+                    window.lastSeq = data.messages[data.messages.length - 1].seq;
+                }
+                if (data.has_more) {
+                    syncChatHistory(show);
+                }
+            })
+            .catch(error => {
+                console.error('Error syncing chat history:', error);
+            });
+    }
+
+    // Start the history cursor of a chat that began empty at its last message
+    function loadHistoryCursor() {
+        const sessionId = window.sessionId;
+        fetchMessages({ limit: 1 })
+            .then(data => {
+                if (data && sessionId === window.sessionId) {
+                    window.lastSeq = data.last_seq;
+                    window.historyEpoch = data.epoch;
+                }
+            })
+            .catch(error => {
+                console.error('Error loading chat history cursor:', error);
+            });
+    }
+
     // Load chats list
     function loadChatsList() {
         if (!chatsList) return;
@@ -125,8 +125,14 @@ function handleWebSocketMessage(data) {
             console.log('Message received:', data);
             break;
             
+        case 'chat_delta':
+            // Grow the in-progress response as tokens arrive
+            appendResponseDelta(data.content);
+            break;
+            
         case 'agent_response':
-            // Add agent response to UI
+            // Replace the streamed text with the final response
+            removeStreamingMessage();
             addMessage('assistant', data.message);
             break;
             
@@ -153,6 +159,31 @@ function handleWebSocketMessage(data) {
     }
 }
 
+// Append a streamed token chunk to the in-progress response
+function appendResponseDelta(delta) {
+    const container = document.getElementById('messages-container');
+    if (!container || !delta) return;
+    
+    let streaming = container.querySelector('.message.streaming');
+    if (!streaming) {
+        streaming = document.createElement('div');
+        streaming.classList.add('message', 'assistant', 'streaming');
+        streaming.innerHTML = '<div class="message-content"></div>';
+        container.appendChild(streaming);
+    }
+    
+    streaming.querySelector('.message-content').textContent += delta;
+    container.scrollTop = container.scrollHeight;
+}
+
+// Remove the in-progress response once the final one arrives
+function removeStreamingMessage() {
+    const streaming = document.querySelector('.message.streaming');
+    if (streaming) {
+        streaming.remove();
+    }
+}
+
 // Send message via WebSocket
 function sendWebSocketMessage(message) {
     if (!ws || ws.readyState !== WebSocket.OPEN) {
@@ -116,6 +116,10 @@ class WebSocketManager {
         // Default handling for common message types
         if (type === 'chat_message') {
             this.displayMessage(data.message);
+        } else if (type === 'chat_delta') {
+            this.appendDelta(data.message_id, data.delta);
+        } else if (type === 'chat_reset') {
+            this.resetDelta(data.message_id);
         } else if (type === 'thinking_update') {
             this.updateThinking(data.step);
         }
@@ -127,6 +131,13 @@ class WebSocketManager {
         const container = document.getElementById('messages-container');
         if (!container) return;
         
+        // Replace the text streamed so far with the final message
+        const streamed = message.id && container.querySelector(`[data-message-id="${message.id}"]`);
+        if (streamed) {
+            streamed.querySelector('.message-content').textContent = message.content;
+            return;
+        }
+        
         const div = document.createElement('div');
         div.className = `message ${message.role}-message`;
         div.innerHTML = `
@@ -138,6 +149,34 @@ class WebSocketManager {
         container.scrollTop = container.scrollHeight;
     }
     
+    resetDelta(messageId) {
+        // A failed attempt is being retried: drop what it streamed
+        const container = document.getElementById('messages-container');
+        const div = messageId && container && container.querySelector(`[data-message-id="${messageId}"]`);
+        if (div) {
+            div.remove();
+        }
+    }
+    
+    appendDelta(messageId, delta) {
+        if (!messageId || !delta) return;
+        
+        const container = document.getElementById('messages-container');
+        if (!container) return;
+        
+        let div = container.querySelector(`[data-message-id="${messageId}"]`);
+        if (!div) {
+            div = document.createElement('div');
+            div.className = 'message assistant-message';
+            div.dataset.messageId = messageId;
+            div.innerHTML = '<div class="message-content"></div>';
+            container.appendChild(div);
+        }
+        
+        div.querySelector('.message-content').textContent += delta;
+        container.scrollTop = container.scrollHeight;
+    }
+    
     updateThinking(step) {
         if (!step) return;
         
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+import numpy as np
+
+from core.memory.vectors import VectorMemory, VectorStore
+
+class StubEmbedder:
+    """Embeds known texts to fixed vectors instead of calling Ollama"""
+
+    VECTORS = {
+        "cats purr": [1.0, 0.0, 0.0],
+        "dogs bark": [0.0, 1.0, 0.0],
+        "stocks fell": [0.0, 0.0, 1.0],
+        "do cats purr?": [0.9, 0.1, 0.0]
+    }
+
+    def __init__(self):
+        self.calls = 0
+
+    async def embed(self, text):
+        self.calls += 1
+        vector = self.VECTORS.get(text)
+        return None if vector is None else np.array(vector, dtype=np.float32)
+
+def remember_all(memory, texts):
+    async def run():
+        for text in texts:
+            assert await memory.remember(text, "user", timestamp="2024-01-01T00:00:00")
+    asyncio.run(run())
+
+def test_add_search_and_reload(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    memory = VectorMemory("session", StubEmbedder())
+    remember_all(memory, ["cats purr", "dogs bark", "stocks fell"])
+
+    results = asyncio.run(memory.recall("do cats purr?", k=2))
+    assert [entry["text"] for entry in results] == ["cats purr"]
+    assert results[0]["score"] > 0.9
+
+    # A new memory for the same session reads the stored vectors back
+    reloaded = VectorMemory("session", StubEmbedder())
+    results = asyncio.run(reloaded.recall("do cats purr?", k=1))
+    assert [entry["text"] for entry in results] == ["cats purr"]
+    assert len(reloaded.store) == 3
+
+def test_recall_skips_messages_still_in_the_prompt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    memory = VectorMemory("session", StubEmbedder())
+    remember_all(memory, ["cats purr"])
+
+    assert asyncio.run(memory.recall("do cats purr?", before="2024-01-01T00:00:00")) == []
+    assert len(asyncio.run(memory.recall("do cats purr?", before="2025-01-01T00:00:00"))) == 1
+
+def test_load_cuts_a_torn_vector_row(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.load()
+    store.add(np.array([1.0, 0.0, 0.0]), {"text": "a"})
+    store.add(np.array([0.0, 1.0, 0.0]), {"text": "b"})
+
+    # A crash while appending a third vector leaves part of a row behind
+    with open(store.vectors_path, 'ab') as f:
+        f.write(b"\x00" * 5)
+
+    reloaded = VectorStore(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded) == 2
+    assert os.path.getsize(reloaded.vectors_path) == 2 * 3 * 4
+
+    # The next row lines up with its metadata
+    reloaded.add(np.array([0.0, 0.0, 1.0]), {"text": "c"})
+    score, entry = reloaded.search(np.array([0.0, 0.0, 1.0]), k=1)[0]
+    assert entry["text"] == "c" and score > 0.99
+
+def test_load_drops_a_vector_without_metadata(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.load()
+    store.add(np.array([1.0, 0.0, 0.0]), {"text": "a"})
+
+    # The vector of a second entry was written but its metadata was not
+    with open(store.vectors_path, 'ab') as f:
+        f.write(np.array([0.0, 1.0, 0.0], dtype=np.float32).tobytes())
+
+    reloaded = VectorStore(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded) == 1
+    assert os.path.getsize(reloaded.vectors_path) == 3 * 4
@@ -4,6 +4,8 @@ import json
 import datetime
 from typing import Dict, Any, Optional, List
 
+from core.memory.conversation_log import get_conversation_log
+
 logger = logging.getLogger(__name__)
 
 class ChatManager:
@@ -27,15 +29,12 @@ class ChatManager:
             if input_data in ["json", "markdown", "html", "text"]:
                 export_format = input_data
             
-            # Get conversation file path
-            conversation_file = os.path.join(self.workspace_dir, "conversation.json")
-            
-            if not os.path.exists(conversation_file):
+            # Read the conversation data from the session's log
+            messages = await get_conversation_log(self.session_id).read_all()
+            if not messages:
                 return "No chat history found for this session"
             
-            # Read the conversation data
-            with open(conversation_file, "r") as f:
-                conversation_data = json.load(f)
+            conversation_data = {"session_id": self.session_id, "messages": messages}
             
             # Export based on format
             if export_format == "json":
@@ -6,6 +6,8 @@ import subprocess
 import sys
 from typing import Dict, Any, Optional, List
 
+from config.constants import PRIORITY_BACKGROUND, STAGE_CODE
+
 logger = logging.getLogger(__name__)
 
 class CodeGenerator:
@@ -43,7 +45,10 @@ Format your response with markdown headings and code blocks."""
                 prompt=prompt,
                 system_prompt="You are an expert software developer. Generate comprehensive, production-ready code with clear explanations.",
                 temperature=0.3,
-                max_tokens=4000
+                max_tokens=4000,
+                priority=PRIORITY_BACKGROUND,
+                session_id=self.session_id,
+                stage=STAGE_CODE
             )
             
             # Save the generated code to a file
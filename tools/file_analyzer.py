@@ -4,6 +4,8 @@ import json
 import base64
 from typing import Dict, Any, Optional, List
 
+from config.constants import PRIORITY_BACKGROUND, STAGE_ANALYSIS
+
 logger = logging.getLogger(__name__)
 
 class FileAnalyzer:
@@ -67,7 +69,10 @@ class FileAnalyzer:
                         prompt=prompt,
                         system_prompt="You are an expert file analyzer.",
                         temperature=0.3,
-                        max_tokens=2000
+                        max_tokens=2000,
+                        priority=PRIORITY_BACKGROUND,
+                        session_id=self.session_id,
+                        stage=STAGE_ANALYSIS
                     )
                     
                     return f"## File Analysis: {os.path.basename(file_path)}\n\n{analysis}"
@@ -91,7 +96,10 @@ Please provide a detailed analysis."""
                     prompt=prompt,
                     system_prompt="You are an expert content analyzer.",
                     temperature=0.3,
-                    max_tokens=2000
+                    max_tokens=2000,
+                    priority=PRIORITY_BACKGROUND,
+                    session_id=self.session_id,
+                    stage=STAGE_ANALYSIS
                 )
                 
                 return f"## Content Analysis\n\n{analysis}"